@@ -0,0 +1,450 @@
+import datetime
+import glob
+import itertools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+from sqlalchemy import event
+
+REPLAY_MODES = ('off', 'record', 'replay')
+
+# Connection attributes read by the dialects when they connect, recorded and served back on replay
+CONNECTION_ATTRIBUTES = ('version', 'encoding', 'nencoding', 'dbms_name', 'dbms_ver', 'thin')
+
+
+# Numbers the recorders of a process, so that two engines of one section never write the same file
+_recorder_numbers = itertools.count(1)
+
+
+class ReplayError(Exception):
+    pass
+
+
+def encode_value(value):
+    # A result or parameter value as JSON, with tags for the types JSON does not have
+    if hasattr(value, 'read'):
+        # LOB locators are read while recording
+        value = value.read()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, Decimal):
+        return {'$decimal': str(value)}
+    if isinstance(value, datetime.datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {'$bytes': bytes(value).hex()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): encode_value(item) for key, item in value.items()}
+    return str(value)
+
+
+def decode_value(value):
+    if isinstance(value, dict):
+        if '$decimal' in value:
+            return Decimal(value['$decimal'])
+        if '$datetime' in value:
+            return datetime.datetime.fromisoformat(value['$datetime'])
+        if '$date' in value:
+            return datetime.date.fromisoformat(value['$date'])
+        if '$bytes' in value:
+            return bytes.fromhex(value['$bytes'])
+    return value
+
+
+def query_key(statement, parameters):
+    return statement.strip() + '\n' + json.dumps(encode_value(parameters), sort_keys=True)
+
+
+def recording_files(recording_file):
+    """
+    The files recorded for a section: <section>.jsonl and the per process <section>.<host>-<pid>-<n>.jsonl.
+    """
+    root, extension = os.path.splitext(recording_file)
+    files = sorted(glob.glob(f"{glob.escape(root)}.*{extension}"))
+    return ([recording_file] if os.path.exists(recording_file) else []) + files
+
+
+class CatalogRecorder:
+    """
+    Records every statement an engine executes with its result set and duration to a JSON lines
+    file, through the driver's connections, so that a run can be replayed offline by CatalogReplay.
+    Row streams (statements executed with stream_results, the table rows of data validation) are
+    passed through to the caller and only recorded as not replayable.
+    Each recorder writes its own file next to recording_file (suffixed with the host, process id and
+    recorder number), so that the processes of a distributed run never truncate or interleave each other.
+    """
+
+    def __init__(self, name, recording_file):
+        self.name = name
+        root, extension = os.path.splitext(recording_file)
+        self.recording_file = (f"{root}.{socket.gethostname()}-{os.getpid()}-{next(_recorder_numbers)}"
+                               f"{extension}")
+        self.query_count = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(recording_file) or '.', exist_ok=True)
+        self._file = open(self.recording_file, 'w')
+
+    def write(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+            if 'statement' in entry:
+                self.query_count += 1
+                self.seconds += entry['seconds']
+
+    def connect(self, dialect, cargs, cparams):
+        connection = dialect.loaded_dbapi.connect(*cargs, **cparams)
+        attributes = {}
+        for name in CONNECTION_ATTRIBUTES:
+            value = getattr(connection, name, None)
+            if isinstance(value, (str, int, float)):
+                attributes[name] = value
+        if hasattr(connection, 'server_info'):
+            # DB2: version information object
+            try:
+                attributes['server_info'] = {key: encode_value(value)
+                                             for key, value in vars(connection.server_info()).items()}
+            except Exception as e:
+                logging.info(f"Not recording the server info of {self.name}: {e}")
+        self.write({'connection': attributes})
+        return RecordingConnection(connection, self)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def summary(self):
+        return (f"{self.name}: {self.query_count} catalog queries recorded to '{self.recording_file}', "
+                f"{self.seconds:.2f}s in the database")
+
+
+class RecordingConnection:
+    def __init__(self, connection, recorder):
+        self._connection = connection
+        self._recorder = recorder
+
+    def cursor(self, *args, **kwargs):
+        return RecordingCursor(self._connection.cursor(*args, **kwargs), self._recorder)
+
+    def ss_cursor(self, *args, **kwargs):
+        # python-oracledb server side cursors, for stream_results
+        return RecordingCursor(self._connection.ss_cursor(*args, **kwargs), self._recorder)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._connection, name, value)
+
+
+class RecordingCursor:
+    def __init__(self, cursor, recorder):
+        self._cursor = cursor
+        self._recorder = recorder
+        self._rows = []
+        self._position = 0
+        self._streamed = False  # set per statement by attach_replay
+        self.description = None
+        self.rowcount = -1
+
+    def execute(self, statement, parameters=None):
+        started = time.monotonic()
+        try:
+            if parameters is None:
+                self._cursor.execute(statement)
+            else:
+                self._cursor.execute(statement, parameters)
+        except Exception as e:
+            # Dialects try some statements and fall back to others on errors, the errors are replayed too
+            self._recorder.write({'statement': statement, 'key': query_key(statement, parameters),
+                                  'error': [type(e).__name__, str(e)],
+                                  'seconds': round(time.monotonic() - started, 6)})
+            raise
+        self.description = self._cursor.description
+        if self._streamed:
+            # Fetched by the caller from the driver's cursor, the rows are neither kept nor recorded
+            self.rowcount = self._cursor.rowcount
+            self._recorder.write({'statement': statement, 'key': query_key(statement, parameters), 'streamed': True,
+                                  'seconds': round(time.monotonic() - started, 6)})
+            return self
+        # Fetched at once, so the recorded time includes the fetch round trips
+        self._rows = [tuple(row) for row in self._cursor.fetchall()] if self.description else []
+        self._position = 0
+        self.rowcount = self._cursor.rowcount
+        rows = encode_value(self._rows)
+        self._recorder.write({
+            'statement': statement,
+            'key': query_key(statement, parameters),
+            'description': [[column[0]] + [None] * 6 for column in self.description or ()] or None,
+            'rows': rows,
+            'rowcount': self.rowcount,
+            'seconds': round(time.monotonic() - started, 6)
+        })
+        # The recorded values (e.g. LOBs read as text), so that a replay returns exactly the same
+        self._rows = [tuple(decode_value(value) for value in row) for row in rows]
+        return self
+
+    def executemany(self, statement, parameters):
+        self._cursor.executemany(statement, parameters)
+        self.description = None
+        self.rowcount = self._cursor.rowcount
+
+    def fetchone(self):
+        if self._streamed:
+            return self._cursor.fetchone()
+        if self._position >= len(self._rows):
+            return None
+        self._position += 1
+        return self._rows[self._position - 1]
+
+    def fetchmany(self, size=None):
+        size = size or self.arraysize
+        if self._streamed:
+            return self._cursor.fetchmany(size)
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchall(self):
+        if self._streamed:
+            return self._cursor.fetchall()
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_') or name in ('description', 'rowcount'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+class CatalogReplay:
+    """
+    Serves the result sets of the CatalogRecorder files of a section instead of connecting to the database,
+    with optional simulated latency per query, so that runs can be benchmarked and tested offline.
+    A statement executed several times with the same parameters gets its recorded results in order
+    (the files merged in name order).
+    """
+
+    def __init__(self, name, recording_file, latency='0'):
+        """
+        :param latency: 'recorded' to wait the recorded time of each query, or a fixed time in milliseconds.
+        """
+        self.name = name
+        self.recording_file = recording_file
+        self.latency = latency
+        self.attributes = {}
+        self.results = {}  # query key -> [recorded entries]
+        self.served = {}  # query key -> entries served
+        self.query_count = 0
+        self.missing_count = 0
+        self.wait_time = 0.0
+        self._lock = threading.Lock()
+        files = recording_files(recording_file)
+        if not files:
+            raise FileNotFoundError(f"No recording of {name}: '{recording_file}'")
+        for path in files:
+            with open(path, 'r') as file:
+                for line in file:
+                    entry = json.loads(line)
+                    if 'connection' in entry:
+                        self.attributes = self.attributes or entry['connection']
+                    else:
+                        self.results.setdefault(entry['key'], []).append(entry)
+        logging.info(f"Replaying {sum(len(entries) for entries in self.results.values())} catalog queries "
+                     f"of {name} from {len(files)} recording file(s) '{recording_file}'")
+
+    def result(self, statement, parameters):
+        key = query_key(statement, parameters)
+        with self._lock:
+            entries = self.results.get(key)
+            if not entries:
+                self.missing_count += 1
+                raise ReplayError(f"Statement not in the recording of {self.name}: {statement.strip()[:200]}")
+            served = self.served.get(key, 0)
+            self.served[key] = served + 1
+            self.query_count += 1
+        entry = entries[min(served, len(entries) - 1)]
+        delay = entry['seconds'] if self.latency == 'recorded' else float(self.latency or 0) / 1000
+        if delay > 0:
+            time.sleep(delay)
+            with self._lock:
+                self.wait_time += delay
+        return entry
+
+    def connect(self, dialect, cargs, cparams):
+        return ReplayConnection(self, dialect.loaded_dbapi)
+
+    def close(self):
+        pass
+
+    def summary(self):
+        return (f"{self.name}: {self.query_count} catalog queries replayed, {self.missing_count} not recorded, "
+                f"{self.wait_time:.2f}s simulated latency")
+
+
+class ReplayConnection:
+    """
+    The DB-API connection methods and attributes the dialects use. Anything else raises AttributeError,
+    so that a driver call the replay does not know fails as it would diverge from the recorded run.
+    """
+
+    def __init__(self, replay, dbapi):
+        self._replay = replay
+        self._dbapi = dbapi
+        # Set by the dialects on connect (cx_Oracle type handler, isolation level)
+        self.outputtypehandler = None
+        self.autocommit = False
+
+    def cursor(self, *args, **kwargs):
+        return ReplayCursor(self._replay, self._dbapi)
+
+    # python-oracledb server side cursors
+    ss_cursor = cursor
+
+    # Transactions and pool checks: nothing to do without a database
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def ping(self):
+        pass
+
+    def close(self):
+        pass
+
+    def terminate(self):
+        pass
+
+    def __getattr__(self, name):
+        attributes = self._replay.attributes
+        if name == 'server_info' and 'server_info' in attributes:
+            return lambda: SimpleNamespace(**attributes['server_info'])
+        if name in attributes:
+            return attributes[name]
+        raise AttributeError(f"{name} is not available in the catalog replay of {self._replay.name}")
+
+
+class ReplayCursor:
+    def __init__(self, replay, dbapi):
+        self._replay = replay
+        self._dbapi = dbapi
+        self._rows = []
+        self._position = 0
+        self.description = None
+        self.rowcount = -1
+        self.arraysize = 100
+        self.lastrowid = None
+
+    def execute(self, statement, parameters=None):
+        entry = self._replay.result(statement, parameters)
+        if entry.get('streamed'):
+            raise ReplayError(f"Rows of {self._replay.name} streamed while recording, not replayable: "
+                              f"{statement.strip()[:200]}")
+        if 'error' in entry:
+            # Raised as the driver's exception class, so that SQLAlchemy handles it as it did when recording
+            error_class, message = entry['error']
+            raise getattr(self._dbapi, error_class, self._dbapi.Error)(message)
+        self.description = [tuple(column) for column in entry['description']] if entry['description'] else None
+        self._rows = [tuple(decode_value(value) for value in row) for row in entry['rows']]
+        self._position = 0
+        self.rowcount = entry['rowcount']
+        return self
+
+    def executemany(self, statement, parameters):
+        self.description = None
+
+    def fetchone(self):
+        if self._position >= len(self._rows):
+            return None
+        self._position += 1
+        return self._rows[self._position - 1]
+
+    def fetchmany(self, size=None):
+        size = size or self.arraysize
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return rows
+
+    def setinputsizes(self, *args, **kwargs):
+        pass
+
+    def setoutputsize(self, *args, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+def replay_from_config(config, name):
+    """
+    The CatalogRecorder or CatalogReplay of a config section from the [REPLAY] section, or None when off.
+    """
+    mode = config.get('REPLAY', 'mode', fallback='off')
+    if mode not in REPLAY_MODES:
+        raise ValueError(f"Invalid replay mode: {mode}, expected one of {REPLAY_MODES}")
+    if mode == 'off':
+        return None
+    recording_file = os.path.join(config.get('REPLAY', 'directory', fallback='recordings'), f"{name}.jsonl")
+    if mode == 'record':
+        return CatalogRecorder(name, recording_file)
+    return CatalogReplay(name, recording_file, config.get('REPLAY', 'latency', fallback='0'))
+
+
+def attach_replay(engine, replay):
+    """
+    Connect the engine through a CatalogRecorder (the real driver, recorded) or a CatalogReplay (no database).
+    """
+    @event.listens_for(engine, 'do_connect')
+    def replay_connect(dialect, conn_rec, cargs, cparams):
+        return replay.connect(dialect, cargs, cparams)
+
+    if isinstance(replay, CatalogRecorder):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def mark_streamed(conn, cursor, statement, parameters, context, executemany):
+            if isinstance(cursor, RecordingCursor):
+                cursor._streamed = bool(context is not None and context.execution_options.get('stream_results'))
+    return replay
@@ -0,0 +1,208 @@
+import logging
+import threading
+
+from sqlalchemy import event, inspect, text
+
+# Catalog queries that are not configurable in the [QUERIES] section
+DEFAULT_QUERIES = {
+    'TRIGGER_SCHEMA': """
+        SELECT NAME, TEXT FROM SYSIBM.SYSTRIGGERS WHERE SCHEMA = :schema_name AND TRIGNAME = :trigger_name
+    """,
+    'TRIGGERS_LIST': "SELECT NAME, TEXT FROM SYSIBM.SYSTRIGGERS WHERE SCHEMA = :schema_name",
+    'CHECK_CONSTRAINTS': """
+        SELECT C.NAME, C.TEXT FROM SYSIBM.SYSCHECKS C
+        JOIN SYSIBM.SYSTABLES T ON C.TBCREATOR = T.CREATOR AND C.TBNAME = T.NAME
+        WHERE C.TBNAME = :table_name AND C.TBCREATOR = :schema_name
+    """
+}
+
+# Object lists of two schemas of the same database in one pass, split by owner in memory.
+# The table and view queries apply the filters of the SQLAlchemy inspector of each dialect.
+OWNER_LIST_QUERIES = {
+    'oracle': {
+        'tables': """
+            SELECT T.OWNER, T.TABLE_NAME FROM ALL_TABLES T
+            WHERE T.OWNER IN (:source_schema_name, :target_schema_name)
+            AND NVL(T.TABLESPACE_NAME, 'no tablespace') NOT IN ('SYSTEM', 'SYSAUX')
+            AND T.IOT_NAME IS NULL AND T.DURATION IS NULL
+            AND NOT EXISTS (SELECT 1 FROM ALL_MVIEWS M WHERE M.OWNER = T.OWNER AND M.MVIEW_NAME = T.TABLE_NAME)
+        """,
+        'views': "SELECT OWNER, VIEW_NAME FROM ALL_VIEWS WHERE OWNER IN (:source_schema_name, :target_schema_name)",
+        'functions': """
+            SELECT OWNER, OBJECT_NAME FROM ALL_OBJECTS
+            WHERE OWNER IN (:source_schema_name, :target_schema_name) AND OBJECT_TYPE = 'FUNCTION'
+        """,
+        'stored_procedures': """
+            SELECT OWNER, OBJECT_NAME FROM ALL_OBJECTS
+            WHERE OWNER IN (:source_schema_name, :target_schema_name) AND OBJECT_TYPE = 'PROCEDURE'
+        """
+    },
+    'ibm_db_sa': {
+        'tables': """
+            SELECT TABSCHEMA, TABNAME FROM SYSCAT.TABLES
+            WHERE TABSCHEMA IN (:source_schema_name, :target_schema_name) AND TYPE = 'T'
+        """,
+        'views': """
+            SELECT TABSCHEMA, TABNAME FROM SYSCAT.TABLES
+            WHERE TABSCHEMA IN (:source_schema_name, :target_schema_name) AND TYPE = 'V'
+        """,
+        'functions': """
+            SELECT ROUTINESCHEMA, ROUTINENAME FROM SYSCAT.ROUTINES
+            WHERE ROUTINESCHEMA IN (:source_schema_name, :target_schema_name) AND ROUTINETYPE = 'F'
+        """,
+        'stored_procedures': """
+            SELECT ROUTINESCHEMA, ROUTINENAME FROM SYSCAT.ROUTINES
+            WHERE ROUTINESCHEMA IN (:source_schema_name, :target_schema_name) AND ROUTINETYPE = 'P'
+        """
+    }
+}
+
+# Whether the connected user can read the tables and catalog of the other schema (:schema_name), so that
+# one engine can serve both sides: 1 when it can. Oracle needs table and dictionary access (DBA or
+# SELECT_CATALOG_ROLE, for DBMS_METADATA), DB2 DBADM or DATAACCESS, or SELECTIN on the schema.
+CATALOG_ACCESS_QUERIES = {
+    'oracle': """
+        SELECT CASE WHEN EXISTS (SELECT 1 FROM SESSION_PRIVS WHERE PRIVILEGE = 'SELECT ANY TABLE')
+                     AND EXISTS (SELECT 1 FROM SESSION_ROLES WHERE ROLE IN ('DBA', 'SELECT_CATALOG_ROLE'))
+                    THEN 1 ELSE 0 END
+        FROM DUAL
+    """,
+    'ibm_db_sa': """
+        SELECT CASE WHEN EXISTS (SELECT 1 FROM SYSCAT.DBAUTH WHERE GRANTEE = USER
+                                 AND (DBADMAUTH = 'Y' OR DATAACCESSAUTH = 'Y'))
+                     OR EXISTS (SELECT 1 FROM SYSCAT.SCHEMAAUTH WHERE GRANTEE = USER
+                                AND SCHEMANAME = :schema_name AND SELECTINAUTH IN ('Y', 'G'))
+                    THEN 1 ELSE 0 END
+        FROM SYSIBM.SYSDUMMY1
+    """
+}
+
+
+def reads_other_schemas(engine, schema_name, query=None):
+    """
+    Whether the user of the engine can read the tables and catalog of another schema of its database, with
+    the CATALOG_ACCESS query of the [QUERIES] section or the built-in query for the dialect.
+    :param schema_name: The other schema, bound as :schema_name when the query uses it.
+    """
+    query = query or CATALOG_ACCESS_QUERIES.get(engine.dialect.name)
+    if query is None:
+        return False
+    try:
+        with engine.connect() as connection:
+            parameters = {'schema_name': schema_name} if ':schema_name' in query else {}
+            return connection.execute(text(query), parameters).scalar() == 1
+    except Exception as e:
+        logging.info(f"Error checking the catalog access of {engine.url.username}: {e}")
+        return False
+
+
+def connection_identity(section):
+    """
+    The database instance a config section connects to, ignoring the schema (and the credentials).
+    """
+    return (section.get('driver', ''), section.get('host', '').lower(), section.get('port', ''),
+            section.get('database', '').lower())
+
+
+def engine_options(config, driver=''):
+    """
+    Build create_engine() keyword arguments from the optional [ENGINE] config section.
+    :param config: The ConfigParser holding the tool configuration.
+    :param driver: The SQLAlchemy driver name, used for driver specific connect arguments.
+    """
+    options = {
+        'pool_size': config.getint('ENGINE', 'pool_size', fallback=5),
+        'max_overflow': config.getint('ENGINE', 'max_overflow', fallback=10),
+        'pool_pre_ping': config.getboolean('ENGINE', 'pool_pre_ping', fallback=True),
+        'pool_recycle': config.getint('ENGINE', 'pool_recycle', fallback=-1),
+        'query_cache_size': config.getint('ENGINE', 'statement_cache_size', fallback=500)
+    }
+    if 'oracle' in driver:
+        # Server side statement cache of the cx_Oracle connection
+        options['connect_args'] = {'stmtcachesize': config.getint('ENGINE', 'statement_cache_size', fallback=500)}
+    return options
+
+
+def configure_cursors(engine, arraysize=500, prefetchrows=500):
+    """
+    Set the fetch array size of every DB-API cursor the engine executes on, so that catalog
+    result sets are fetched in a few round trips. prefetchrows is only known to cx_Oracle.
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def set_cursor_sizes(conn, cursor, statement, parameters, context, executemany):
+        try:
+            cursor.arraysize = arraysize
+            if hasattr(cursor, 'prefetchrows'):
+                cursor.prefetchrows = prefetchrows
+        except Exception:
+            # Some drivers (e.g. older ibm_db_dbi) expose read only cursor attributes
+            pass
+
+
+class CatalogSession:
+    """
+    Long lived catalog access for one side of the comparison. Each thread keeps one connection
+    and one Inspector for the whole run, and the configured queries are built only once.
+    """
+
+    def __init__(self, engine, queries=None):
+        self.engine = engine
+        self.statements = {name: text(query) for name, query in DEFAULT_QUERIES.items()}
+        for name, query in (queries or {}).items():
+            # configparser lower cases the option names
+            self.statements[name.upper()] = text(query)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or connection.closed:
+            connection = self.engine.connect()
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    @property
+    def inspector(self):
+        inspector = getattr(self._local, 'inspector', None)
+        if inspector is None or getattr(self._local, 'inspector_connection', None) is not self.connection:
+            inspector = inspect(self.connection)
+            self._local.inspector = inspector
+            self._local.inspector_connection = self.connection
+        return inspector
+
+    def statement(self, name, default_query=None):
+        """
+        A named statement, built from default_query unless the [QUERIES] section configures it.
+        """
+        if name not in self.statements:
+            if default_query is None:
+                raise KeyError(f"No query configured for {name}")
+            self.statements[name] = text(default_query)
+        return self.statements[name]
+
+    def execute(self, statement, parameters=None):
+        """
+        Execute a named catalog statement (or a text() clause) on this thread's connection.
+        """
+        if isinstance(statement, str):
+            statement = self.statements[statement]
+        try:
+            return self.connection.execute(statement, parameters or {})
+        except Exception:
+            # Leave no failed transaction behind on the long lived connection
+            self.connection.rollback()
+            raise
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                try:
+                    connection.close()
+                except Exception as e:
+                    logging.info(f"Error closing catalog connection: {e}")
+            self._connections = []
+        self._local = threading.local()
@@ -0,0 +1,48 @@
+import importlib.util
+import logging
+
+from schema_model import MISSING, Table, schema_from_json
+
+# Columns of the exported column catalog, one row per column of a table or view
+EXPORT_COLUMNS = ('object', 'column', 'position', 'datatype', 'length', 'precision', 'scale', 'default',
+                  'is_nullable')
+
+
+def available():
+    # Optional: pandas and pyarrow for the Parquet export, imported on use only as they are slow to import
+    return importlib.util.find_spec('pandas') is not None
+
+
+def export_frame(schema):
+    """
+    The column catalog of a schema as a typed frame with the EXPORT_COLUMNS columns.
+    """
+    import pandas as pd
+
+    rows = []
+    for name, item in schema_from_json(schema).items():
+        if isinstance(item, Table):
+            for position, column in enumerate(item.columns.values(), start=1):
+                default = None if column.default in (MISSING, None) else str(column.default)
+                rows.append((name, column.name, position,
+                             *(None if value is MISSING else value for value in
+                               (column.datatype, column.length, column.precision, column.scale)),
+                             default, None if column.is_nullable is MISSING else column.is_nullable))
+    frame = pd.DataFrame(rows, columns=list(EXPORT_COLUMNS))
+    return frame.astype({'length': 'Int64', 'precision': 'Int64', 'scale': 'Int64', 'is_nullable': 'boolean'})
+
+
+def save_parquet(schema, output_file):
+    """
+    Write the column catalog of a schema to a Parquet file (requires pandas and pyarrow).
+    """
+    if not available():
+        logging.info(f"Parquet export to '{output_file}' skipped: pandas is not installed")
+        return False
+    try:
+        export_frame(schema).to_parquet(output_file, index=False)
+    except ImportError as e:
+        logging.info(f"Parquet export to '{output_file}' skipped: {e}")
+        return False
+    logging.info(f"Column catalog saved to '{output_file}'.")
+    return True
@@ -0,0 +1,240 @@
+import json
+import logging
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from result_store import (ResultStore, MISSING_IN_TARGET, MISSING_IN_SOURCE, COLUMN_MISSING, COLUMN_MISMATCH,
+                          DEFINITION_MISMATCH, render_value)
+from schema_model import CONSTRAINT_KINDS, Routine, schema_from_json, schema_to_json
+
+
+def format_schema_for_json(schema):
+    try:
+        formatted_schema = {}
+        for item_name, item_info in schema.items():
+            if isinstance(item_info, dict):
+                # Handle column definitions or other dictionary-based schema items
+                if "definition" in item_info:
+                    item_data = {"definition": item_info["definition"]}
+                else:
+                    item_data = {"datatype": item_info.get("datatype", "").split("(")[0].strip().lower()}
+                    length_info = item_info.get("datatype", "").split("(")[1][:-1] if len(
+                        item_info.get("datatype", "").split("(")) > 1 else None
+
+                    if length_info:
+                        if "," in length_info:
+                            precision, scale = length_info.split(",")
+                            item_data["precision"] = int(precision.strip())
+                            item_data["scale"] = int(scale.strip())
+                        else:
+                            item_data["length"] = int(length_info.strip())
+
+                    if "default" in item_info:
+                        item_data["default"] = item_info["default"]
+
+                    item_data["is_nullable"] = item_info.get("is_nullable", None)
+
+            elif isinstance(item_info, list):
+                # Handle lists, which are likely constraints or keys
+                item_data = item_info
+
+            else:
+                # Handle unexpected types (optional, depending on your schema)
+                item_data = str(item_info)
+
+            formatted_schema[item_name] = item_data
+
+        return formatted_schema
+    except Exception as e:
+        logging.info(f"Error formatting {schema} schema: {e}")
+        return {}
+
+
+def compare_schemas(source_schema, target_schema, store=None, comparison_type=None,
+                    source_schema_name=None, target_schema_name=None):
+    """
+    Compare two schemas, given as model objects or in their JSON form, and record
+    the differences in a ResultStore. Columns and constraints are compared separately.
+    :param store: The run-wide ResultStore, a new one is created when omitted.
+    :param comparison_type: The object type being compared (tables, views, ...).
+    :return: The differences of this comparison type as a name -> [messages] dictionary.
+    """
+    if store is None:
+        store = ResultStore(source_schema_name, target_schema_name)
+
+    source_schema = schema_from_json(source_schema)
+    target_schema = schema_from_json(target_schema)
+
+    for item_name, source_item in source_schema.items():
+        target_item = target_schema.get(item_name)
+        if target_item is not None:
+            if isinstance(source_item, Routine) or isinstance(target_item, Routine):
+                if source_item != target_item:
+                    store.add(comparison_type, source_schema_name, item_name, COLUMN_MISMATCH, item_name,
+                              {"definition": getattr(source_item, 'definition', None)},
+                              {"definition": getattr(target_item, 'definition', None)})
+                continue
+
+            target_columns = target_item.columns
+            for column_name, source_column in source_item.columns.items():
+                target_column = target_columns.get(column_name)
+                if target_column is None:
+                    store.add(comparison_type, source_schema_name, item_name, COLUMN_MISSING, column_name)
+                elif source_column != target_column:
+                    store.add(comparison_type, source_schema_name, item_name, COLUMN_MISMATCH, column_name,
+                              source_column, target_column)
+
+            # Non-column entries that are neither columns nor constraints
+            source_extra = source_item.extra or {}
+            target_extra = target_item.extra or {}
+            for key, value in source_extra.items():
+                if key not in target_extra:
+                    store.add(comparison_type, source_schema_name, item_name, COLUMN_MISSING, key)
+                elif value != target_extra[key]:
+                    store.add(comparison_type, source_schema_name, item_name, COLUMN_MISMATCH, key,
+                              value, target_extra[key])
+
+            if source_item.definition != target_item.definition:
+                store.add(comparison_type, source_schema_name, item_name, DEFINITION_MISMATCH,
+                          source_value=source_item.definition, target_value=target_item.definition)
+
+            # Compare constraints
+            for kind in CONSTRAINT_KINDS:
+                if source_item.constraints.get(kind, ()) != target_item.constraints.get(kind, ()):
+                    store.add(comparison_type, source_schema_name, item_name, kind,
+                              source_value=source_item.constraint_json(kind),
+                              target_value=target_item.constraint_json(kind))
+
+            # Compare indexes
+            # source_indexes = source_item_schema.get('indexes', {})
+            # target_indexes = target_item_schema.get('indexes', {})
+            # if source_indexes != target_indexes:
+            #     item_differences.append(f"Indexes mismatch: {source_indexes} != {target_indexes}")
+
+            # Compare triggers
+            # source_triggers = source_item_schema.get('triggers', {})
+            # target_triggers = target_item_schema.get('triggers', {})
+            # if source_triggers != target_triggers:
+            #     item_differences.append(f"Triggers mismatch: {source_triggers} != {target_triggers}")
+        else:
+            store.add(comparison_type, source_schema_name, item_name, MISSING_IN_TARGET)
+
+    for item_name in target_schema:
+        if item_name not in source_schema:
+            store.add(comparison_type, target_schema_name, item_name, MISSING_IN_SOURCE)
+
+    return store.differences_for(comparison_type)
+
+
+def align_names(source_names, target_names):
+    """
+    Merge-join the source and target object names in a single pass.
+    :return: The sorted names found in both lists, only in the source and only in the target.
+    """
+    # Catalog queries are ordered server side, but the database collation may not match
+    # Python's ordering; sorting an already sorted list is linear so it is cheap insurance.
+    # dict.fromkeys drops duplicates without losing that order, as a set would.
+    source_names = sorted(dict.fromkeys(source_names))
+    target_names = sorted(dict.fromkeys(target_names))
+    both, source_only, target_only = [], [], []
+    i = j = 0
+    while i < len(source_names) and j < len(target_names):
+        source_name = source_names[i]
+        target_name = target_names[j]
+        if source_name == target_name:
+            both.append(source_name)
+            i += 1
+            j += 1
+        elif source_name < target_name:
+            source_only.append(source_name)
+            i += 1
+        else:
+            target_only.append(target_name)
+            j += 1
+    source_only.extend(source_names[i:])
+    target_only.extend(target_names[j:])
+    return both, source_only, target_only
+
+
+def shard_of(item_name, shard_count):
+    # crc32 rather than hash() so that every process agrees on the shard of a name
+    return zlib.crc32(item_name.encode('utf-8')) % shard_count
+
+
+def _format_and_compare_shard(payload):
+    """
+    Worker entry point. The shard arrives and leaves as a JSON string so that no
+    SQLAlchemy objects or model instances are pickled between processes.
+    """
+    shard = json.loads(payload)
+    source_schema = shard['source']
+    target_schema = shard['target']
+    if shard['format_raw']:
+        source_schema = {name: format_schema_for_json(schema) for name, schema in source_schema.items()}
+        target_schema = {name: format_schema_for_json(schema) for name, schema in target_schema.items()}
+
+    store = ResultStore(shard['source_schema_name'], shard['target_schema_name'])
+    compare_schemas(source_schema, target_schema, store, shard['comparison_type'],
+                    shard['source_schema_name'], shard['target_schema_name'])
+    records = [(record.schema, record.name, record.kind, record.column,
+                render_value(record.source_value), render_value(record.target_value)) for record in store]
+    return json.dumps({'source': source_schema, 'target': target_schema, 'records': records})
+
+
+def format_and_compare(source_schema, target_schema, store, comparison_type, source_schema_name,
+                       target_schema_name, workers=1, format_raw=True, min_objects_per_worker=200):
+    """
+    Format reflected schemas for JSON and compare them, optionally sharding the objects by
+    name hash across a process pool. The merged result is identical to a serial run.
+    :param source_schema: {name: schema} as returned by get_schema, or already formatted JSON.
+    :param format_raw: Whether the schemas still need format_schema_for_json (False for saved snapshots).
+    :param workers: Number of worker processes, 1 or less compares in this process.
+    :return: The formatted source and target schemas and the differences of this comparison type.
+    """
+    object_count = len(source_schema) + len(target_schema)
+    workers = min(workers, object_count // max(min_objects_per_worker, 1))
+    if workers <= 1:
+        if format_raw:
+            source_schema = {name: format_schema_for_json(schema) for name, schema in source_schema.items()}
+            target_schema = {name: format_schema_for_json(schema) for name, schema in target_schema.items()}
+        source_schema = schema_from_json(source_schema)
+        target_schema = schema_from_json(target_schema)
+        differences = compare_schemas(source_schema, target_schema, store, comparison_type,
+                                      source_schema_name, target_schema_name)
+        return schema_to_json(source_schema), schema_to_json(target_schema), differences
+
+    # Several shards per worker keep the pool busy when shard sizes are uneven
+    shard_count = workers * 4
+    shards = [({}, {}) for _ in range(shard_count)]
+    for name, schema in source_schema.items():
+        shards[shard_of(name, shard_count)][0][name] = render_value(schema)
+    for name, schema in target_schema.items():
+        shards[shard_of(name, shard_count)][1][name] = render_value(schema)
+    payloads = [json.dumps({
+        'source': shard_source,
+        'target': shard_target,
+        'format_raw': format_raw,
+        'comparison_type': comparison_type,
+        'source_schema_name': source_schema_name,
+        'target_schema_name': target_schema_name
+    }) for shard_source, shard_target in shards if shard_source or shard_target]
+
+    logging.info(f"Comparing {object_count} {comparison_type} in {len(payloads)} shards on {workers} workers")
+    formatted_source = {}
+    formatted_target = {}
+    records_by_name = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(_format_and_compare_shard, payloads):
+            result = json.loads(result)
+            formatted_source.update(result['source'])
+            formatted_target.update(result['target'])
+            for record in result['records']:
+                records_by_name.setdefault(record[1], []).append(record)
+
+    # Merge in the order a serial comparison would have produced
+    for name in list(source_schema) + [name for name in target_schema if name not in source_schema]:
+        for schema, item_name, kind, column, source_value, target_value in records_by_name.get(name, []):
+            store.add(comparison_type, schema, item_name, kind, column, source_value, target_value)
+    formatted_source = {name: formatted_source[name] for name in source_schema}
+    formatted_target = {name: formatted_target[name] for name in target_schema}
+    return formatted_source, formatted_target, store.differences_for(comparison_type)
@@ -1,80 +1,115 @@
-import json
 import os
 import configparser
+import contextlib
+import threading
 import time
 from datetime import datetime
 import logging
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-from sqlalchemy import create_engine, inspect, text, exc as sa_exc
+from sqlalchemy import create_engine, exc as sa_exc
 import warnings
 
+from catalog_replay import attach_replay, replay_from_config
+from catalog_session import (OWNER_LIST_QUERIES, CatalogSession, configure_cursors, connection_identity,
+                             engine_options, reads_other_schemas)
+from columnar import save_parquet
+from comparison import align_names, compare_schemas, format_and_compare, format_schema_for_json
+from data_validation import DataSide, validate_tables
+from dependency_graph import DependencyGraph, read_dependency_graph
+from profiler import Profiler, profile_stage
+from progress import Progress
+from output_files import generate_documentation, save_schema_to_json
+from result_store import ResultStore
+from sampling import Sampler, log_estimate
+from scheduling import FailFast, Priority
+from schema_model import VIEW_DEFINITION, object_from_json, schema_to_json
+from snapshot_index import save_indexed_schema
+from snapshot_registry import registry_from_config
+from table_statistics import StatisticsCheck, read_table_statistics
+from view_extractor import ViewCatalogCache, inspector_datatype, normalize_definition
+from throttle import attach_throttle, throttle_from_config
+
 # warnings.filterwarnings('ignore', category=sa_exc.SAWarning, message="Did not recognize type")
 
 config = configparser.ConfigParser()
-config.read('config.ini')
 
 # Accumulators for error messages
 error_tables = defaultdict(list)
 error_views = defaultdict(list)
 TYPE = None
 
-# Get the current timestamp
-timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+# Set by setup()
+source = None
+target = None
+source_engine = None
+target_engine = None
+source_session = None
+target_session = None
+throttles = []
+replays = []
+catalog_budget = contextlib.nullcontext()
+progress = Progress(refresh_seconds=0)
+registry = None
+baseline_manifest = None
+snapshot_objects = {'source': {}, 'target': {}}
+view_catalogs = None
+profiler = None
+sampler = None
+priority = None
+fail_fast = None
+output_dir_with_timestamp = None
+
+error_logger = logging.getLogger('error_logger')
 
-# Define the output directory with the timestamp
-output_dir_with_timestamp = os.path.join('output', f'SchemaValidator_{timestamp}')
 
-# Create the output directory if it doesn't exist
-if not os.path.exists(output_dir_with_timestamp):
-    os.makedirs(output_dir_with_timestamp)
+def setup_logging(output_dir):
+    # Set up logging configuration
+    info_log_filename = os.path.join(output_dir, 'schema_validator.log')
+    error_log_filename = os.path.join(output_dir, 'schema_validator_error.log')
 
-# Set up logging configuration
-info_log_filename = os.path.join(output_dir_with_timestamp, 'schema_validator.log')
-error_log_filename = os.path.join(output_dir_with_timestamp, 'schema_validator_error.log')
+    # Set up logger for INFO level messages
+    info_logger = logging.getLogger('info_logger')
+    info_logger.setLevel(logging.INFO)
 
-# Set up logger for INFO level messages
-info_logger = logging.getLogger('info_logger')
-info_logger.setLevel(logging.INFO)
+    info_handler = logging.FileHandler(info_log_filename)
+    info_handler.setLevel(logging.INFO)
 
-info_handler = logging.FileHandler(info_log_filename)
-info_handler.setLevel(logging.INFO)
+    info_formatter = logging.Formatter('%(asctime)s - %(message)s')
+    info_handler.setFormatter(info_formatter)
 
-info_formatter = logging.Formatter('%(asctime)s - %(message)s')
-info_handler.setFormatter(info_formatter)
+    info_logger.addHandler(info_handler)
+    info_logger.addHandler(logging.StreamHandler())
 
-info_logger.addHandler(info_handler)
-info_logger.addHandler(logging.StreamHandler())
+    # Set up logger for ERROR level messages
+    error_logger.setLevel(logging.ERROR)
 
-# Set up logger for ERROR level messages
-error_logger = logging.getLogger('error_logger')
-error_logger.setLevel(logging.ERROR)
-
-error_handler = logging.FileHandler(error_log_filename)
-error_handler.setLevel(logging.ERROR)
-
-error_formatter = logging.Formatter('%(message)s')
-error_handler.setFormatter(error_formatter)
-
-error_logger.addHandler(error_handler)
-error_logger.addHandler(logging.StreamHandler())
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(message)s',
-    handlers=[
-        logging.FileHandler(info_log_filename),
-        logging.StreamHandler()
-    ]
-)
-logging.basicConfig(
-    level=logging.ERROR,
-    format='%(asctime)s - %(message)s',
-    handlers=[
-        logging.FileHandler(error_log_filename),
-        logging.StreamHandler()
-    ]
-)
+    error_handler = logging.FileHandler(error_log_filename)
+    error_handler.setLevel(logging.ERROR)
+
+    error_formatter = logging.Formatter('%(message)s')
+    error_handler.setFormatter(error_formatter)
+
+    error_logger.addHandler(error_handler)
+    error_logger.addHandler(logging.StreamHandler())
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(message)s',
+        handlers=[
+            logging.FileHandler(info_log_filename),
+            logging.StreamHandler()
+        ]
+    )
+    logging.basicConfig(
+        level=logging.ERROR,
+        format='%(asctime)s - %(message)s',
+        handlers=[
+            logging.FileHandler(error_log_filename),
+            logging.StreamHandler()
+        ]
+    )
 
 
 def log_errors():
@@ -91,95 +126,177 @@ def log_errors():
                 error_logger.error(f"{view}")
 
 
-try:
-    # Add the DB2 driver path
-    # os.add_dll_directory(
-    #     'C:\\Users\\MITDeepanraj\\PycharmProjects\\schemaValidator\\.venv\\Lib\\site-packages\\clidriver\\bin')
+def add_driver_directory():
+    # Add the DB2 driver path (Windows only), e.g. <venv>\Lib\site-packages\clidriver\bin
+    dll_directory = config.get('ENGINE', 'db2_dll_directory', fallback='')
+    if dll_directory and hasattr(os, 'add_dll_directory'):
+        os.add_dll_directory(dll_directory)
 
-    # Read configuration file
-    source = config['COMPARISON']['SOURCE']
-    target = config['COMPARISON']['TARGET']
 
-    src_username = config[source]['username']
-    src_password = config[source]['password']
-    src_host = config[source]['host']
-    src_port = config[source]['port']
-    src_db = config[source]['database']
+def setup(config_file='config.ini', source_section=None, target_section=None, output_root='output'):
+    """
+    Read the configuration, create the timestamped output directory and connect to both databases.
+    :param config_file: Path of the configuration file.
+    :param source_section: Config section of the source database, defaults to [COMPARISON] SOURCE.
+    :param target_section: Config section of the target database, defaults to [COMPARISON] TARGET.
+    :param output_root: Directory in which the SchemaValidator_<timestamp> folder is created.
+    """
+    global output_dir_with_timestamp
+
+    # Get the current timestamp
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
 
-    source_db = f'oracle+cx_oracle://{src_username}:{src_password}@{src_host}:{src_port}/?service_name={src_db}'
+    # Define the output directory with the timestamp
+    output_dir_with_timestamp = os.path.join(output_root, f'SchemaValidator_{timestamp}')
 
-    target_username = config[target]['username']
-    target_password = config[target]['password']
-    target_host = config[target]['host']
-    target_port = config[target]['port']
-    target_db = config[target]['database']
+    # Create the output directory if it doesn't exist
+    if not os.path.exists(output_dir_with_timestamp):
+        os.makedirs(output_dir_with_timestamp)
 
-    target_db = f'oracle+cx_oracle://{target_username}:{target_password}@{target_host}:{target_port}/?service_name={target_db}'
+    setup_logging(output_dir_with_timestamp)
 
-    # Create engines
-    source_engine = create_engine(source_db)
-    target_engine = create_engine(target_db)
+    if not config.read(config_file):
+        logging.info(f"Configuration error: cannot read '{config_file}'")
+        exit(1)
 
-    # Inspectors
-    source_inspector = inspect(source_engine)
-    target_inspector = inspect(target_engine)
+    connect_databases(source_section, target_section)
 
 
-except (configparser.Error, KeyError) as config_error:
-    logging.info(f"Configuration error: {config_error}")
-    exit(1)
-except Exception as e:
-    logging.info(f"Failed to set up database connections: {e}")
-    exit(1)
+def database_url(section_name):
+    section = config[section_name]
+    return (f"oracle+cx_oracle://{section['username']}:{section['password']}@{section['host']}:{section['port']}"
+            f"/?service_name={section['database']}")
 
 
-def get_trigger_schema(engine, schema_name, trigger_name):
+def shares_engine(source_section, target_section, engine=None):
+    """
+    Whether two config sections on the same database instance share one engine (and connection pool):
+    with [ENGINE] share_same_instance = auto when they use the same credentials or the user of the source
+    engine can read the catalog of the other schemas (see CATALOG_ACCESS), always with yes.
+    :param engine: The source engine, to check its catalog access.
+    """
+    share_same_instance = config.get('ENGINE', 'share_same_instance', fallback='auto').lower()
+    if connection_identity(config[source_section]) != connection_identity(config[target_section]):
+        return False
+    if share_same_instance != 'auto':
+        return share_same_instance == 'yes'
+    if ((config[source_section]['username'], config[source_section]['password'])
+            == (config[target_section]['username'], config[target_section]['password'])):
+        return True
+    return engine is not None and reads_other_schemas(engine, config[target_section]['schema_name'],
+                                                      config['QUERIES'].get('catalog_access'))
+
+
+def create_section_engine(section_name):
+    """
+    The engine of a config section, with its cursor sizes, throttle and catalog recording or replay.
+    """
+    engine = create_engine(database_url(section_name), **engine_options(config, 'oracle+cx_oracle'))
+    configure_cursors(engine, config.getint('ENGINE', 'arraysize', fallback=500),
+                      config.getint('ENGINE', 'prefetchrows', fallback=500))
+    # Optional adaptive throttling of the catalog queries of the engine
+    throttle = throttle_from_config(config, section_name)
+    if throttle:
+        throttles.append(attach_throttle(engine, throttle))
+    # Optional recording of the catalog queries of the engine, or their replay without a database
+    replay = replay_from_config(config, section_name)
+    if replay:
+        replays.append(attach_replay(engine, replay))
+    return engine
+
+
+def connect_section(section_name):
+    """
+    A catalog session for one more config section (e.g. the targets of a fan-out comparison),
+    on the source engine when shares_engine allows it.
+    :return: The CatalogSession, to be closed by the caller unless it is the source session.
+    """
+    if shares_engine(source, section_name, source_engine):
+        return source_session
+    return CatalogSession(create_section_engine(section_name), config['QUERIES'])
+
+
+def connect_databases(source_section=None, target_section=None):
+    """
+    Create the engines and catalog sessions of both sides from the loaded configuration.
+    """
+    global source, target, source_engine, target_engine, source_session, target_session, throttles, replays, \
+        view_catalogs
+
     try:
-        query = text("""
-            SELECT NAME, TEXT FROM SYSIBM.SYSTRIGGERS WHERE SCHEMA = :schema_name AND TRIGNAME = :trigger_name;
-        """)
-        with engine.connect() as conn:
-            result = conn.execute(query, {'schema_name': schema_name, 'trigger_name': trigger_name})
-            row = result.fetchone()
-            if row:
-                return {
-                    trigger_name: {
-                        "definition": row[1]
-                    }
+        add_driver_directory()
+
+        # Read configuration file
+        source = source_section or config['COMPARISON']['SOURCE']
+        target = target_section or config['COMPARISON']['TARGET']
+
+        # Create engines, the catalog access check of the source engine is throttled and recorded too
+        throttles = []
+        replays = []
+        source_engine = create_section_engine(source)
+        shared = shares_engine(source, target, source_engine)
+        if shared:
+            logging.info(f"{source} (source) and {target} (target) are on the same database, sharing one engine")
+            target_engine = source_engine
+        else:
+            target_engine = create_section_engine(target)
+
+        # Catalog sessions: one long lived connection and inspector per side, queries built once
+        source_session = CatalogSession(source_engine, config['QUERIES'])
+        target_session = source_session if shared else CatalogSession(target_engine, config['QUERIES'])
+
+        # Views are read in bulk per schema on first use, unless [VIEWS] bulk_extract = no
+        view_catalogs = (ViewCatalogCache(config.getboolean('VIEWS', 'compare_definitions', fallback=True))
+                         if config.getboolean('VIEWS', 'bulk_extract', fallback=True) else None)
+
+    except (configparser.Error, KeyError) as config_error:
+        logging.info(f"Configuration error: {config_error}")
+        exit(1)
+    except Exception as e:
+        logging.info(f"Failed to set up database connections: {e}")
+        exit(1)
+
+
+def get_trigger_schema(session, schema_name, trigger_name):
+    try:
+        result = session.execute('TRIGGER_SCHEMA', {'schema_name': schema_name, 'trigger_name': trigger_name})
+        row = result.fetchone()
+        if row:
+            return {
+                trigger_name: {
+                    "definition": row[1]
                 }
-            return {}
+            }
+        return {}
     except Exception as e:
         error_tables[TYPE].append(f"{TYPE} - {schema_name}.{trigger_name}")
         return {}
 
 
-def get_triggers(inspector, schema_name, table_name):
+def get_triggers(session, schema_name, table_name):
     try:
-        query = text("""
-            SELECT NAME, TEXT FROM SYSIBM.SYSTRIGGERS WHERE SCHEMA = :schema_name;
-        """)
-        with inspector.engine.connect() as conn:
-            result = conn.execute(query, {'schema_name': schema_name, 'table_name': table_name})
-            triggers = {}
-            for row in result:
-                triggers[row[0]] = row[1]  # Trigger name and trigger definition
-            logging.info(triggers)
+        result = session.execute('TRIGGERS_LIST', {'schema_name': schema_name})
+        triggers = {}
+        for row in result:
+            triggers[row[0]] = row[1]  # Trigger name and trigger definition
+        logging.info(triggers)
         return triggers
     except Exception as e:
         error_tables[TYPE].append(f"{TYPE} - {schema_name}.{table_name}")
         return {}
 
 
-def get_table_schema(inspector, schema_name, table_name, type):
+def get_table_schema(session, schema_name, table_name, type):
     global TYPE
     TYPE = type
     try:
+        inspector = session.inspector
         columns = inspector.get_columns(table_name, schema=schema_name)
         primary_keys = inspector.get_pk_constraint(table_name, schema=schema_name)
         foreign_keys = inspector.get_foreign_keys(table_name, schema=schema_name)
         unique_constraints = inspector.get_unique_constraints(table_name, schema=schema_name)
         # indexes = inspector.get_indexes(table_name, schema=schema_name)  # Fetch indexes
-        # triggers = get_triggers(inspector, schema_name, table_name)  # Fetch triggers
+        # triggers = get_triggers(session, schema_name, table_name)  # Fetch triggers
 
         schema = {}
 
@@ -246,16 +363,10 @@ def get_table_schema(inspector, schema_name, table_name, type):
             # Fallback mechanism
             try:
                 # Adjusted SQL query for DB2
-                query = text("""
-                    SELECT C.NAME, C.TEXT FROM SYSIBM.SYSCHECKS C 
-                    JOIN SYSIBM.SYSTABLES T ON C.TBCREATOR = T.CREATOR AND C.TBNAME = T.NAME 
-                    WHERE C.TBNAME = :table_name AND C.TBCREATOR = :schema_name
-                """)
-                with inspector.engine.connect() as conn:
-                    result = conn.execute(query, {'schema_name': schema_name, 'table_name': table_name})
-                    check_clauses = [row[1] for row in result]  # Ensure to handle possible None values
-                    if check_clauses:
-                        schema['check_constraints'] = check_clauses
+                result = session.execute('CHECK_CONSTRAINTS', {'schema_name': schema_name, 'table_name': table_name})
+                check_clauses = [row[1] for row in result]  # Ensure to handle possible None values
+                if check_clauses:
+                    schema['check_constraints'] = check_clauses
             except Exception as e:
                 logging.info(f"Error retrieving check constraints: {e}")
 
@@ -273,101 +384,141 @@ def get_table_schema(inspector, schema_name, table_name, type):
         return {}
 
 
-def get_view_schema(inspector, schema_name, view_name, type):
+def get_view_schema(session, schema_name, view_name, type):
     global TYPE
     TYPE = type
     try:
-        # For views, we might not need detailed schema, but let's fetch columns as example
-        columns = inspector.get_columns(view_name)
+        # Served from the bulk read of all the views of the schema, when the dialect has the queries
+        view_catalog = view_catalogs.get(session, schema_name) if view_catalogs is not None else None
+        if view_catalog is not None:
+            schema = view_catalog.get(view_name)
+            if schema == {}:
+                error_tables[TYPE].append(f"{TYPE} - {schema_name}.{view_name}")
+            return schema
+
+        columns = session.inspector.get_columns(view_name, schema=schema_name)
         schema = {}
         for column in columns:
             column_name = column['name']
             column_type = column['type']
-            column_type_str = str(column_type).upper()
+            # The same datatype as the bulk path, so views read either way compare equal
+            column_type_str = inspector_datatype(column_type, session.engine.dialect)
             schema[column_name] = {
-                "datatype": column_type_str
+                "datatype": column_type_str,
+                "is_nullable": column['nullable']
             }
+        if config.getboolean('VIEWS', 'compare_definitions', fallback=True):
+            schema[VIEW_DEFINITION] = normalize_definition(
+                session.inspector.get_view_definition(view_name, schema=schema_name), schema_name)
         return schema
     except Exception as e:
         error_tables[TYPE].append(f"{TYPE} - {schema_name}.{view_name}")
         return {}
 
 
-def get_functions(engine, schema_name):
+def get_functions(session, schema_name):
     try:
-        query = text(config['QUERIES']['FUNCTIONS_LIST'])
-        with engine.connect() as conn:
-            result = conn.execute(query, {'schema_name': schema_name})
-            functions = [row[0] for row in result]
-            return functions
+        result = session.execute('FUNCTIONS_LIST', {'schema_name': schema_name})
+        functions = [row[0] for row in result]
+        return functions
     except Exception as e:
         logging.info(f"Error retrieving functions: {e}")
         return []
 
 
-def get_function_schema(engine, schema_name, function_name):
+def get_function_schema(session, schema_name, function_name):
     try:
-        query = text(config['QUERIES']['FUNCTIONS_SCHEMA'])
-        # logging.info(query)
-        with engine.connect() as conn:
-            result = conn.execute(query, {'schema_name': schema_name, 'function_name': function_name})
-            row = result.fetchone()
-            if row:
-                return {
-                    function_name: {
-                        "definition": row[1]
-                    }
+        result = session.execute('FUNCTIONS_SCHEMA', {'schema_name': schema_name, 'function_name': function_name})
+        row = result.fetchone()
+        if row:
+            return {
+                function_name: {
+                    "definition": row[1]
                 }
-            return {}
+            }
+        return {}
     except Exception as e:
         error_tables[TYPE].append(f"{TYPE} - {schema_name}.{function_name}")
         return {}
 
 
-def get_stored_procedure_schema(engine, schema_name, proc_name):
+def get_stored_procedure_schema(session, schema_name, proc_name):
     try:
-        query = text(config['QUERIES']['STORED_PROCEDURE_SCHEMA'])
-        with engine.connect() as conn:
-            result = conn.execute(query, {'schema_name': schema_name, 'proc_name': proc_name})
-            row = result.fetchone()
-            if row:
-                return {
-                    proc_name: {
-                        "definition": row[1]
-                    }
+        result = session.execute('STORED_PROCEDURE_SCHEMA', {'schema_name': schema_name, 'proc_name': proc_name})
+        row = result.fetchone()
+        if row:
+            return {
+                proc_name: {
+                    "definition": row[1]
                 }
-            return {}
+            }
+        return {}
     except Exception as e:
         error_tables[TYPE].append(f"{TYPE} - {schema_name}.{proc_name}")
         return {}
 
 
-def get_stored_procedures(engine, schema_name):
+def get_stored_procedures(session, schema_name):
     try:
-        query = text(config['QUERIES']['STORED_PROCEDURE_LIST'])
-        # logging.info(query, schema_name)
-        with engine.connect() as conn:
-            result = conn.execute(query, {'schema_name': schema_name})
-            procedures = [row[0] for row in result]
-            return procedures
+        result = session.execute('STORED_PROCEDURE_LIST', {'schema_name': schema_name})
+        procedures = [row[0] for row in result]
+        return procedures
     except Exception as e:
         logging.info(f"Error retrieving stored procedures: {e}")
         return []
 
 
-def get_schema(engine, schema_name, item_name, schema_type, TYPE):
+def get_item_names(session, schema_name, schema_type):
+    if schema_type == 'tables':
+        return session.inspector.get_table_names(schema=schema_name)
+    elif schema_type == 'views':
+        return session.inspector.get_view_names(schema=schema_name)
+    elif schema_type == 'functions':
+        return get_functions(session, schema_name)
+    elif schema_type == 'stored_procedures':
+        return get_stored_procedures(session, schema_name)
+    else:
+        raise ValueError(f"Invalid comparison type specified: {schema_type}")
+
+
+def get_item_names_by_owner(session, schema_names, schema_type):
+    """
+    List the objects of the source and target schemas of the same database with one catalog query,
+    the <TYPE>_OWNERS_LIST query of the [QUERIES] section or the built-in query for the dialect.
+    :return: schema name -> object names, or None when no such query is available or it fails.
+    """
+    name = f"{schema_type.upper()}_OWNERS_LIST"
+    default_query = OWNER_LIST_QUERIES.get(session.engine.dialect.name, {}).get(schema_type)
+    if default_query is None and name not in session.statements:
+        return None
+    try:
+        rows = session.execute(session.statement(name, default_query),
+                               {'source_schema_name': schema_names[0], 'target_schema_name': schema_names[1]})
+        dialect = session.engine.dialect
+        # The inspector returns normalized (lower case) names for case insensitive tables and views
+        normalize = schema_type in ('tables', 'views') and dialect.requires_name_normalize
+        items = {schema_name.upper(): [] for schema_name in schema_names}
+        for owner, item_name in rows:
+            if owner.upper() in items:
+                items[owner.upper()].append(dialect.normalize_name(item_name) if normalize else item_name)
+        return {schema_name: items[schema_name.upper()] for schema_name in schema_names}
+    except Exception as e:
+        logging.info(f"Error retrieving {schema_type} of {', '.join(schema_names)}: {e}")
+        return None
+
+
+def get_schema(session, schema_name, item_name, schema_type, TYPE):
     try:
-        inspector = inspect(engine)
         if schema_type == 'tables':
-            return get_table_schema(inspector, schema_name, item_name, TYPE)
+            return get_table_schema(session, schema_name, item_name, TYPE)
         elif schema_type == 'views':
-            return get_view_schema(inspector, schema_name, item_name, TYPE)
+            return get_view_schema(session, schema_name, item_name, TYPE)
         elif schema_type == 'functions':
-            return get_function_schema(inspector, schema_name, item_name)
+            return get_function_schema(session, schema_name, item_name)
         elif schema_type == 'stored_procedures':
-            return get_stored_procedure_schema(engine, schema_name, item_name)
+            return get_stored_procedure_schema(session, schema_name, item_name)
         elif schema_type == 'triggers':
-            return get_trigger_schema(engine, schema_name, item_name)
+            return get_trigger_schema(session, schema_name, item_name)
         else:
             raise ValueError(f"Invalid schema type: {schema_type}")
     except Exception as e:
@@ -375,171 +526,477 @@ def get_schema(engine, schema_name, item_name, schema_type, TYPE):
         return {}
 
 
-def format_schema_for_json(schema):
-    try:
-        formatted_schema = {}
-        for item_name, item_info in schema.items():
-            if isinstance(item_info, dict):
-                # Handle column definitions or other dictionary-based schema items
-                if "definition" in item_info:
-                    item_data = {"definition": item_info["definition"]}
-                else:
-                    item_data = {"datatype": item_info.get("datatype", "").split("(")[0].strip().lower()}
-                    length_info = item_info.get("datatype", "").split("(")[1][:-1] if len(
-                        item_info.get("datatype", "").split("(")) > 1 else None
-
-                    if length_info:
-                        if "," in length_info:
-                            precision, scale = length_info.split(",")
-                            item_data["precision"] = int(precision.strip())
-                            item_data["scale"] = int(scale.strip())
-                        else:
-                            item_data["length"] = int(length_info.strip())
-
-                    if "default" in item_info:
-                        item_data["default"] = item_info["default"]
-
-                    item_data["is_nullable"] = item_info.get("is_nullable", None)
-
-            elif isinstance(item_info, list):
-                # Handle lists, which are likely constraints or keys
-                item_data = item_info
-
-            else:
-                # Handle unexpected types (optional, depending on your schema)
-                item_data = str(item_info)
-
-            formatted_schema[item_name] = item_data
-
-        return formatted_schema
-    except Exception as e:
-        logging.info(f"Error formatting {schema} schema: {e}")
-        return {}
-
-
-def save_schema_to_json(schema_data, output_file, schema_type):
-    with open(output_file, 'w') as json_file:
-        json.dump({schema_type: schema_data}, json_file, indent=4)
-    logging.info(f"{schema_type} schema saved to '{output_file}'.")
-
-
 def read_lookup_file(lookup_file):
     with open(lookup_file, 'r') as file:
         items = [line.strip() for line in file if line.strip()]
     return items
 
 
-def compare_schemas(source_schema, target_schema):
-    differences = {}
-
-    def compare_constraints(source_constraints, target_constraints):
-        if source_constraints != target_constraints:
-            return f"Mismatch: {source} (source) has {source_constraints} but {target} (target) has {target_constraints}"
+def get_lookup_file_path(comparison_type):
+    # The lookup file of the comparison type, or None when lookup files are disabled or missing
+    if config['LOOKUP_FILES'].get('lookup_file', 'no') == 'no':
         return None
+    lookup_folder = config['LOOKUP_FILES']['lookup_folder']
+    lookup_files = {
+        'tables': config['LOOKUP_FILES'].get('table_lookup_file', ''),
+        'views': config['LOOKUP_FILES'].get('view_lookup_file', ''),
+        'functions': config['LOOKUP_FILES'].get('function_lookup_file', ''),
+        'stored_procedures': config['LOOKUP_FILES'].get('stored_procedure_lookup_file', '')
+    }
+    lookup_file_path = lookup_folder + '/' + lookup_files.get(comparison_type, '')
+    return lookup_file_path if os.path.isfile(lookup_file_path) else None
+
+
+def get_aligned_items(comparison_type, source_names=None):
+    """
+    List the objects of a comparison type on both sides, restricted to the lookup file when one is used.
+    :param source_names: The source object names when they are known (e.g. from a baseline snapshot).
+    :return: The names found on both sides, only in the source and only in the target.
+    """
+    source_schema_name = config[source]['schema_name']
+    target_schema_name = config[target]['schema_name']
+    items = None
+    if source_names is not None:
+        items = {source_schema_name: source_names,
+                 target_schema_name: get_item_names(target_session, target_schema_name, comparison_type)}
+    elif source_session is target_session:
+        # Same database: both schemas are listed in one pass
+        items = get_item_names_by_owner(source_session, (source_schema_name, target_schema_name), comparison_type)
+    if items is not None:
+        items_source = items[source_schema_name]
+        items_target = items[target_schema_name]
+    else:
+        items_source = get_item_names(source_session, source_schema_name, comparison_type)
+        items_target = get_item_names(target_session, target_schema_name, comparison_type)
+
+    lookup_file_path = get_lookup_file_path(comparison_type)
+    if lookup_file_path:
+        # Keep the lookup file spelling, catalogs may return normalized (lower case) names
+        lookup_items = {item.lower(): item for item in read_lookup_file(lookup_file_path)}
+        items_source = [lookup_items[item.lower()] for item in items_source if item.lower() in lookup_items]
+        items_target = [lookup_items[item.lower()] for item in items_target if item.lower() in lookup_items]
+
+    items_both, items_source_only, items_target_only = align_names(items_source, items_target)
+    logging.info(f"Aligned {comparison_type}: {len(items_both)} in both, "
+                 f"{len(items_source_only)} only in {source} (source), "
+                 f"{len(items_target_only)} only in {target} (target)")
+    return items_both, items_source_only, items_target_only
+
+
+def open_registry():
+    """
+    Open the snapshot registry of the [REGISTRY] section and the baseline snapshot used as the source, if any.
+    """
+    global registry, baseline_manifest, snapshot_objects
+
+    registry = registry_from_config(config)
+    baseline_manifest = None
+    snapshot_objects = {'source': {}, 'target': {}}
+    baseline = config.get('REGISTRY', 'baseline', fallback='')
+    if registry is not None and baseline:
+        baseline_manifest = registry.load_manifest(baseline)
+        logging.info(f"Comparing {target} (target) with baseline {baseline} "
+                     f"(snapshot {baseline_manifest['id']} of {baseline_manifest['section']})")
+
 
-    for item_name in source_schema:
-        if item_name in target_schema:
-            source_item_schema = source_schema[item_name]
-            target_item_schema = target_schema[item_name]
-            item_differences = []
-
-            for column_name in source_item_schema:
-                if column_name not in target_item_schema:
-                    item_differences.append(f"Column '{column_name}' missing in target schema")
-                elif source_item_schema[column_name] != target_item_schema[column_name]:
-                    item_differences.append(
-                        f"Column '{column_name}' mismatch: {source_item_schema[column_name]} "
-                        f"!= {target_item_schema[column_name]}")
-
-            # Compare constraints
-            source_primary_key = source_item_schema.get('primary_key', [])
-            target_primary_key = target_item_schema.get('primary_key', [])
-            primary_key_diff = compare_constraints(source_primary_key, target_primary_key)
-            if primary_key_diff:
-                item_differences.append(primary_key_diff)
-
-            source_foreign_keys = source_item_schema.get('foreign_keys', [])
-            target_foreign_keys = target_item_schema.get('foreign_keys', [])
-            foreign_key_diff = compare_constraints(source_foreign_keys, target_foreign_keys)
-            if foreign_key_diff:
-                item_differences.append(foreign_key_diff)
-
-            source_unique_constraints = source_item_schema.get('unique_constraints', [])
-            target_unique_constraints = target_item_schema.get('unique_constraints', [])
-            unique_constraint_diff = compare_constraints(source_unique_constraints, target_unique_constraints)
-            if unique_constraint_diff:
-                item_differences.append(f"Unique constraints mismatch: {unique_constraint_diff}")
-
-            source_check_constraints = source_item_schema.get('check_constraints', [])
-            target_check_constraints = target_item_schema.get('check_constraints', [])
-            check_constraint_diff = compare_constraints(source_check_constraints, target_check_constraints)
-            if check_constraint_diff:
-                item_differences.append(f"Check constraints mismatch: {check_constraint_diff}")
-
-            # Compare indexes
-            # source_indexes = source_item_schema.get('indexes', {})
-            # target_indexes = target_item_schema.get('indexes', {})
-            # if source_indexes != target_indexes:
-            #     item_differences.append(f"Indexes mismatch: {source_indexes} != {target_indexes}")
-
-            # Compare triggers
-            # source_triggers = source_item_schema.get('triggers', {})
-            # target_triggers = target_item_schema.get('triggers', {})
-            # if source_triggers != target_triggers:
-            #     item_differences.append(f"Triggers mismatch: {source_triggers} != {target_triggers}")
-
-            if item_differences:
-                differences[item_name] = item_differences
+def save_schema_files(comparison_type, source_schema, target_schema, output_dir_for_comparison, snapshot=True):
+    """
+    Add the formatted schemas of one comparison type to the snapshot registry (unless snapshot is False),
+    and write the SourceSchema/TargetSchema files unless the registry replaces them.
+    """
+    if config.getboolean('output', 'parquet', fallback=False):
+        # Column catalogs for analytics tools, next to the JSON files
+        save_parquet(source_schema, os.path.join(output_dir_for_comparison,
+                                                 f'SourceColumns_{source}_{comparison_type}.parquet'))
+        save_parquet(target_schema, os.path.join(output_dir_for_comparison,
+                                                 f'TargetColumns_{target}_{comparison_type}.parquet'))
+    if registry is not None and snapshot:
+        if baseline_manifest is None:
+            snapshot_objects['source'][comparison_type] = registry.put_schema(source_schema)
+        snapshot_objects['target'][comparison_type] = registry.put_schema(target_schema)
+        if not config.getboolean('REGISTRY', 'write_schema_files', fallback=True):
+            return
+    # With [output] index = yes each file gets a .idx sidecar for single object lookups (snapshot_index.py)
+    save_schema = save_indexed_schema if config.getboolean('output', 'index', fallback=True) else save_schema_to_json
+    save_schema(source_schema, os.path.join(output_dir_for_comparison, f'SourceSchema_{source}_{comparison_type}.json'),
+                f"SourceSchema_{source}_{comparison_type}")
+    save_schema(target_schema, os.path.join(output_dir_for_comparison, f'TargetSchema_{target}_{comparison_type}.json'),
+                f"TargetSchema_{target}_{comparison_type}")
+
+
+def record_listed_objects(comparison_type, items_source, items_target):
+    """
+    Keep the listed objects that could not be reflected in the snapshot manifests as existence
+    records, so that a baseline lists the same objects as the run it was taken from.
+    """
+    if registry is None:
+        return
+    if baseline_manifest is None:
+        source_objects = snapshot_objects['source'].setdefault(comparison_type, {})
+        for item_name in items_source:
+            source_objects.setdefault(item_name, None)
+    target_objects = snapshot_objects['target'].setdefault(comparison_type, {})
+    for item_name in items_target:
+        target_objects.setdefault(item_name, None)
+
+
+def save_snapshot_manifests():
+    """
+    Save the manifests of this run to the snapshot registry and list them in Snapshots.json.
+    """
+    if registry is None:
+        return
+    manifests = {}
+    if baseline_manifest is None:
+        manifests['source'] = registry.save_manifest(source, config[source]['schema_name'],
+                                                     snapshot_objects['source'])
+    else:
+        manifests['source'] = baseline_manifest['id']
+    manifests['target'] = registry.save_manifest(target, config[target]['schema_name'], snapshot_objects['target'])
+    save_schema_to_json(manifests, os.path.join(output_dir_with_timestamp, 'Snapshots.json'), "Snapshots")
+    logging.info(f"Snapshot registry: {registry.written} new objects stored, {registry.reused} already stored")
+
+
+def compare_and_save(comparison_type, source_schema, target_schema, store, output_dir_for_comparison,
+                     dependency_graph=None, compare_workers=1, format_raw=False, min_objects_per_worker=200,
+                     snapshot=True):
+    """
+    Compare the reflected schemas of one comparison type and write its SourceSchema, TargetSchema,
+    SchemaDifferences (and for tables ImpactRanking) files.
+    :param snapshot: Whether the schemas are added to the snapshot registry.
+    :return: The differences of this comparison type as a name -> [messages] dictionary.
+    """
+    with profile_stage(profiler, comparison_type, 'compare'):
+        source_schema, target_schema, differences = format_and_compare(
+            source_schema, target_schema, store, comparison_type, config[source]['schema_name'],
+            config[target]['schema_name'], compare_workers, format_raw, min_objects_per_worker)
+
+    with profile_stage(profiler, comparison_type, 'save'):
+        save_schema_files(comparison_type, source_schema, target_schema, output_dir_for_comparison, snapshot)
+
+        differences_output_file = os.path.join(output_dir_for_comparison,
+                                               f'SchemaDifferences_{comparison_type}.json')
+        save_schema_to_json(differences, differences_output_file, "SchemaDifferences")
+
+    if comparison_type == 'tables':
+        # Rank mismatched tables by the number of tables referencing them
+        if dependency_graph is None:
+            dependency_graph = DependencyGraph.from_schema(source_schema)
+        dependency_graph.add_names(source_schema)
+        impact_output_file = os.path.join(output_dir_for_comparison, 'ImpactRanking_tables.json')
+        save_schema_to_json(dependency_graph.impact_ranking(differences), impact_output_file,
+                            "ImpactRanking")
+    return differences
+
+
+def validate_data(store, output_dir_for_comparison):
+    """
+    Compare the row counts and checksums of the tables found on both sides, as configured in the
+    [DATA_VALIDATION] section, and write the DataValidation and SchemaDifferences files.
+    """
+    items_both, _, _ = get_aligned_items('tables')
+    column_expression = config.get('DATA_VALIDATION', 'column_expression', fallback='') or None
+    checksum_expression = config.get('DATA_VALIDATION', 'checksum_expression', fallback='') or None
+    source_side = DataSide(source_session, config[source]['schema_name'], column_expression, checksum_expression,
+                           catalog_budget)
+    target_side = DataSide(target_session, config[target]['schema_name'], column_expression, checksum_expression,
+                           catalog_budget)
+
+    results = validate_tables(source_side, target_side, items_both, store,
+                              config.getint('DATA_VALIDATION', 'chunk_rows', fallback=1000000),
+                              config.getint('DATA_VALIDATION', 'workers', fallback=4),
+                              config.getboolean('DATA_VALIDATION', 'drill_down', fallback=False),
+                              config.getint('DATA_VALIDATION', 'leaf_rows', fallback=1000),
+                              config.getint('DATA_VALIDATION', 'max_row_differences', fallback=100))
+    save_schema_to_json(results, os.path.join(output_dir_for_comparison, 'DataValidation.json'), "DataValidation")
+    save_schema_to_json(store.differences_for('data'),
+                        os.path.join(output_dir_for_comparison, 'SchemaDifferences_data.json'), "SchemaDifferences")
+    logging.info(f"Completed data validation of {len(results)} tables.\n"
+                 f"Total differences: {store.count(object_type='data')}\n")
+    return results
+
+
+def compare_statistics(store, output_dir_for_comparison):
+    """
+    Compare the optimizer statistics and physical storage of the tables found on both sides, read in bulk
+    with a few catalog queries per side, as configured in the [STATISTICS] section, and write the
+    Statistics and SchemaDifferences files.
+    """
+    items_both, _, _ = get_aligned_items('tables')
+    with catalog_budget:
+        source_statistics = read_table_statistics(source_session, config[source]['schema_name'])
+    with catalog_budget:
+        target_statistics = read_table_statistics(target_session, config[target]['schema_name'])
+    if source_statistics is None or target_statistics is None:
+        logging.info("Statistics not compared: no statistics queries for the dialect (see STATISTICS_TABLES, "
+                     "STATISTICS_PARTITIONS and STATISTICS_INDEXES) or reading them failed")
+        return 0
+
+    compared = StatisticsCheck.from_config(config).compare(source_statistics, target_statistics, items_both,
+                                                            store, config[source]['schema_name'])
+    for section, statistics in ((source, source_statistics), (target, target_statistics)):
+        save_schema_to_json(statistics, os.path.join(output_dir_for_comparison, f'Statistics_{section}.json'),
+                            f"Statistics_{section}")
+    save_schema_to_json(store.differences_for('statistics'),
+                        os.path.join(output_dir_for_comparison, 'SchemaDifferences_statistics.json'),
+                        "SchemaDifferences")
+    logging.info(f"Completed statistics comparison of {compared} tables.\n"
+                 f"Total differences: {store.count(object_type='statistics')}\n")
+    return compared
+
+
+def compare_type(comparison_type, reflect_only=False, allow_sampling=True, sampled=None):
+    """
+    List, reflect, save and compare the objects of one comparison type.
+    :param allow_sampling: Whether the [SAMPLING] mode applies, False when escalated to a full comparison.
+    :param sampled: When escalated, the (source, target) objects already reflected by the sampled comparison,
+        which are not reflected again; the objects on one side only are already counted by fail fast.
+    :return: A ResultStore holding the differences of this comparison type.
+    """
+    source_schema_name = config[source]['schema_name']
+    target_schema_name = config[target]['schema_name']
+    differences = ResultStore(source, target)
+
+    # Formatting and comparison can be sharded across worker processes
+    compare_workers = config.getint('PERFORMANCE', 'compare_workers', fallback=1)
+    min_objects_per_worker = config.getint('PERFORMANCE', 'min_objects_per_worker', fallback=200)
+    format_in_workers = compare_workers > 1 and not reflect_only and baseline_manifest is None and fail_fast is None
+    reflect_one_sided = reflect_only or config.getboolean('PERFORMANCE', 'reflect_one_sided_objects',
+                                                          fallback=False)
+
+    s_count = 0
+    t_count = 0
+    logging.info(f"Starting comparison for {comparison_type}...")  # Debugging statement
+
+    # Create a subfolder based on comparison type
+    output_dir_for_comparison = os.path.join(output_dir_with_timestamp, comparison_type)
+    os.makedirs(output_dir_for_comparison, exist_ok=True)
+
+    if fail_fast is not None and fail_fast.stopped and not reflect_only:
+        fail_fast.skip(comparison_type)
+        logging.info(f"Fail fast: {comparison_type} not compared")
+        return differences
+
+    if comparison_type == 'data':
+        # Table contents, compared with aggregates computed by each database
+        if not reflect_only:
+            with profile_stage(profiler, comparison_type, 'validate'):
+                validate_data(differences, output_dir_for_comparison)
+        return differences
+
+    if comparison_type == 'statistics':
+        # Optimizer statistics and physical storage of the tables, from bulk catalog reads
+        if not reflect_only:
+            with profile_stage(profiler, comparison_type, 'compare'):
+                compare_statistics(differences, output_dir_for_comparison)
+        return differences
+
+    source_schema = {}
+    target_schema = {}
+
+    # With a baseline, the source objects are loaded from the snapshot registry instead of reflected
+    baseline_objects = baseline_manifest['objects'].get(comparison_type) if baseline_manifest else None
+    if baseline_manifest is not None and baseline_objects is None:
+        # e.g. a type compared by sampling when the baseline was taken: every object would be missing
+        logging.info(f"Baseline snapshot {baseline_manifest['id']} has no {comparison_type}, not compared")
+        return differences
+
+    with catalog_budget, profile_stage(profiler, comparison_type, 'list'):
+        items_both, items_source_only, items_target_only = get_aligned_items(
+            comparison_type, list(baseline_objects) if baseline_objects is not None else None)
+
+    # Foreign key graph of the source schema from one bulk catalog read
+    dependency_graph = None
+    if comparison_type == 'tables' and not reflect_only:
+        with catalog_budget:
+            dependency_graph = read_dependency_graph(source_session, source_schema_name)
+
+    if reflect_one_sided:
+        items_source = items_both + items_source_only
+        items_target = items_both + items_target_only
+    else:
+        # Objects on one side only can only be reported as missing, so they are not reflected
+        items_source = items_target = items_both
+
+    # Sampling mode: every name is compared, but only a sample of the objects on both sides is reflected
+    sample = None
+    if sampler is not None and allow_sampling and not reflect_only and baseline_objects is None:
+        sample = sampler.sample(items_both)
+        if len(sample) < len(items_both):
+            items_source = sample + (items_source_only if reflect_one_sided else [])
+            items_target = sample + (items_target_only if reflect_one_sided else [])
         else:
-            differences[item_name] = [f"Missing in {target} (target) schema"]
+            sample = None
+
+    # Related tables are reflected together, the most referenced tables of each component first
+    if dependency_graph is not None:
+        items_source = dependency_graph.reflection_order(items_source)
+        items_target = dependency_graph.reflection_order(items_target)
+
+    # Objects reflected in priority order, e.g. core tables ahead of audit tables
+    if priority is not None:
+        items_source = priority.order(items_source)
+        items_target = priority.order(items_target)
+
+    # An escalated comparison keeps the objects reflected for the sample
+    if sampled is not None:
+        source_schema.update(sampled[0])
+        target_schema.update(sampled[1])
+        items_source = [item_name for item_name in items_source if item_name not in source_schema]
+        items_target = [item_name for item_name in items_target if item_name not in target_schema]
+
+    gate = fail_fast if not reflect_only else None
+    both_names = set(items_both)
+    if gate is not None and sampled is None:
+        # Objects on one side only are differences known from their names
+        gate.record(comparison_type, {item_name: 1 for item_name in items_source_only + items_target_only})
+
+    baseline_hashes = ({name.lower(): object_hash for name, object_hash in baseline_objects.items()}
+                       if baseline_objects is not None else None)
+
+    progress.add_total(comparison_type, 'source', len(items_source))
+    progress.add_total(comparison_type, 'target', len(items_target))
+
+    # With fail fast, the objects are reflected and compared in batches until a limit is reached
+    batches = gate.batches(items_source, items_target) if gate is not None else [(items_source, items_target)]
+    done_source = set(source_schema)
+    done_target = set(target_schema)
+    for batch_source, batch_target in batches:
+        with profile_stage(profiler, comparison_type, 'reflect', 'source'):
+            for item_name in batch_source:
+                if gate is not None and gate.stopped:
+                    break
+                progress.log_object(comparison_type, 'source',
+                                    f"\tProcessing {source} (source) {comparison_type[:-1]}: {item_name}")
+                started = time.monotonic()
+                if baseline_hashes is not None:
+                    # Stored formatted, existence records (not reflected objects) have no hash
+                    object_hash = baseline_hashes.get(item_name.lower())
+                    if object_hash:
+                        source_schema[item_name] = object_from_json(item_name, registry.get_object(object_hash))
+                    progress.completed(comparison_type, 'source', item_name, time.monotonic() - started)
+                    done_source.add(item_name)
+                    s_count += 1
+                    continue
+                with catalog_budget:
+                    schema = get_schema(source_session, source_schema_name, item_name, comparison_type, 'SOURCE')
+                progress.completed(comparison_type, 'source', item_name, time.monotonic() - started)
+                # logging.info('source schema: ', schema)
+                if schema != {}:
+                    if format_in_workers:
+                        # Formatted by the compare workers
+                        source_schema[item_name] = schema
+                    else:
+                        formatted_schema = format_schema_for_json(schema)
+                        source_schema[item_name] = object_from_json(item_name, formatted_schema)
+                done_source.add(item_name)
+                s_count += 1
 
-    for item_name in target_schema:
-        if item_name not in source_schema:
-            differences[item_name] = [f"Missing in {source} (source) schema"]
+        with profile_stage(profiler, comparison_type, 'reflect', 'target'):
+            for item_name in batch_target:
+                if gate is not None and gate.stopped:
+                    break
+                progress.log_object(comparison_type, 'target',
+                                    f"\tProcessing {target} (target) {comparison_type[:-1]}: {item_name}")
+                started = time.monotonic()
+                with catalog_budget:
+                    schema = get_schema(target_session, target_schema_name, item_name, comparison_type, 'TARGET')
+                progress.completed(comparison_type, 'target', item_name, time.monotonic() - started)
+                # logging.info('target schema: ', schema)
+                if schema != {}:
+                    if format_in_workers:
+                        # Formatted by the compare workers
+                        target_schema[item_name] = schema
+                    else:
+                        formatted_schema = format_schema_for_json(schema)
+                        target_schema[item_name] = object_from_json(item_name, formatted_schema)
+                done_target.add(item_name)
+                t_count += 1
 
+        if gate is not None:
+            if gate.stopped:
+                break
+            batch_names = [item_name for item_name in batch_source if item_name in both_names]
+            batch_differences = compare_schemas(
+                {item_name: source_schema[item_name] for item_name in batch_names if item_name in source_schema},
+                {item_name: target_schema[item_name] for item_name in batch_names if item_name in target_schema},
+                ResultStore(source, target), comparison_type, source_schema_name, target_schema_name)
+            gate.record(comparison_type, {item_name: len(messages)
+                                          for item_name, messages in batch_differences.items()})
+
+    if gate is not None and gate.stopped:
+        # Partial results: the objects not reflected on both sides yet are left out of the comparison
+        not_compared = [item_name for item_name in items_both
+                        if item_name not in done_source or item_name not in done_target]
+        for item_name in not_compared:
+            source_schema.pop(item_name, None)
+            target_schema.pop(item_name, None)
+        gate.skip(comparison_type, len(not_compared))
+        logging.info(f"Fail fast: {len(not_compared)} {comparison_type} not compared")
+
+    # Existence records for the objects that were not reflected
+    if not reflect_one_sided:
+        for item_name in items_source_only:
+            source_schema[item_name] = {}
+        for item_name in items_target_only:
+            target_schema[item_name] = {}
+
+    # Saved and compared in the listed order, whatever the reflection order
+    source_schema = {item_name: source_schema[item_name] for item_name in items_both + items_source_only
+                     if item_name in source_schema}
+    target_schema = {item_name: target_schema[item_name] for item_name in items_both + items_target_only
+                     if item_name in target_schema}
+
+    if reflect_only:
+        with profile_stage(profiler, comparison_type, 'save'):
+            save_schema_files(comparison_type, schema_to_json(source_schema), schema_to_json(target_schema),
+                              output_dir_for_comparison)
+        record_listed_objects(comparison_type, items_source, items_target)
+        logging.info(f"Completed reflection for {comparison_type}.\n"
+                     f"Total processed: {s_count} {source} (Source) {comparison_type}\n"
+                     f"Total processed: {t_count} {target} (Target) {comparison_type}\n")
+        return differences
+
+    compare_and_save(comparison_type, source_schema, target_schema, differences,
+                     output_dir_for_comparison, dependency_graph, compare_workers, format_in_workers,
+                     min_objects_per_worker, snapshot=sample is None)
+    if sample is None:
+        # A sampled comparison is not a snapshot of the schema, it lacks the objects left out of the sample
+        record_listed_objects(comparison_type, items_both + (items_source_only if reflect_one_sided else []),
+                              items_both + (items_target_only if reflect_one_sided else []))
+
+    if sample is not None:
+        drifted = set(differences.differences_for(comparison_type)).intersection(sample)
+        estimate = sampler.estimate(items_both, sample, drifted)
+        log_estimate(comparison_type, estimate)
+        save_schema_to_json(estimate, os.path.join(output_dir_for_comparison, f'Sampling_{comparison_type}.json'),
+                            "Sampling")
+        if estimate['escalated']:
+            logging.info(f"Estimated drift rate of {comparison_type} above {sampler.escalate_above:.1%}, "
+                         f"escalating to a full comparison")
+            return compare_type(comparison_type, reflect_only, allow_sampling=False,
+                                sampled=({item_name: source_schema[item_name] for item_name in sample
+                                          if item_name in source_schema},
+                                         {item_name: target_schema[item_name] for item_name in sample
+                                          if item_name in target_schema}))
+
+    logging.info(f"Completed comparison for {comparison_type}.\n"
+                 f"Total processed: {s_count} {source} (Source) {comparison_type}\n"
+                 f"Total processed: {t_count} {target} (Target) {comparison_type}\n"
+                 f"Total differences: {len(differences)}\n")
     return differences
 
 
-def generate_documentation(differences, output_dir, format):
-    """
-    Generate a summary report documenting the schema comparison results.
-    :param differences: The differences in schemas as a dictionary.
-    :param output_dir: The directory to save the report.
-    :param format: The format of the documentation ('markdown' or 'html').
-    """
-    report = ""
-    if format == "markdown":
-        report += "# Schema Comparison Report\n\n"
-        for item_name, diff_list in differences.items():
-            report += f"## {item_name}\n"
-            for diff in diff_list:
-                report += f"- {diff}\n"
-            report += "\n"
-    elif format == "html":
-        report += "<html><body>"
-        report += "<h1>Schema Comparison Report</h1>"
-        for item_name, diff_list in differences.items():
-            report += f"<h2>{item_name}</h2>"
-            report += "<ul>"
-            for diff in diff_list:
-                report += f"<li>{diff}</li>"
-            report += "</ul>"
-        report += "</body></html>"
-
-    # Save the report to a file
-    file_extension = "md" if format == "markdown" else "html"
-    report_file = os.path.join(output_dir, f"SchemaComparisonReport.{file_extension}")
-    with open(report_file, 'w') as file:
-        file.write(report)
-    logging.info(f"Schema comparison report saved to '{report_file}'.")
-
-
-def main():
+def main(reflect_only=False):
+    """
+    Reflect the configured object types on both sides, save the schemas and compare them.
+    :param reflect_only: Only reflect and save the SourceSchema/TargetSchema files, without comparing.
+    """
+    global catalog_budget, progress, profiler, sampler, priority, fail_fast
+
+    status = 'failed'
     try:
-        source_schema_name = config[source]['schema_name']
-        target_schema_name = config[target]['schema_name']
-        output_dir = config['output']['directory']
-        comparison_types = config['COMPARISON']['compare'].split(",")  # Split comparison types by comma
+        comparison_types = [item.strip() for item in config['COMPARISON']['compare'].split(",")]
         error_log_file = config['LOOKUP_FILES']['error_log_file']
         terminal_log_file = config['LOOKUP_FILES']['terminal_log_file']
         error_log_file_with_timestamp = os.path.join(output_dir_with_timestamp, error_log_file)
@@ -551,103 +1008,68 @@ def main():
         logging.basicConfig(filename=terminal_log_file_with_timestamp, level=logging.logThreads,
                             format='{message}')
 
-        lookup_folder = config['LOOKUP_FILES']['lookup_folder']
-        lookup_file = config['LOOKUP_FILES']['lookup_file']
-
-        # Define lookup files for each type
-        lookup_files = {
-            'tables': config['LOOKUP_FILES'].get('table_lookup_file', ''),
-            'views': config['LOOKUP_FILES'].get('view_lookup_file', ''),
-            'functions': config['LOOKUP_FILES'].get('function_lookup_file', ''),
-            'stored_procedures': config['LOOKUP_FILES'].get('stored_procedure_lookup_file', '')
-        }
-        all_differences = {}
-
-        for comparison_type in comparison_types:
-            s_count = 0
-            t_count = 0
-            comparison_type = comparison_type.strip()
-            logging.info(f"Starting comparison for {comparison_type}...")  # Debugging statement
-
-            # Create a subfolder based on comparison type
-            output_dir_for_comparison = os.path.join(output_dir_with_timestamp, comparison_type)
-            os.makedirs(output_dir_for_comparison, exist_ok=True)
-
-            source_schema = {}
-            target_schema = {}
-
-            use_lookup_file = lookup_file != 'no'
-            lookup_file_path = lookup_folder + '/' + lookup_files.get(comparison_type, '')
-
-            if use_lookup_file and os.path.exists(lookup_file_path):
-                items_source = read_lookup_file(lookup_file_path)
-                items_target = items_source
-            else:
-                if comparison_type == 'tables':
-                    items_source = source_inspector.get_table_names(schema=source_schema_name)
-                    items_target = target_inspector.get_table_names(schema=target_schema_name)
-                elif comparison_type == 'views':
-                    items_source = source_inspector.get_view_names(schema=source_schema_name)
-                    items_target = target_inspector.get_view_names(schema=target_schema_name)
-                elif comparison_type == 'functions':
-                    items_source = get_functions(source_engine, source_schema_name)
-                    items_target = get_functions(target_engine, target_schema_name)
-                elif comparison_type == 'stored_procedures':
-                    items_source = get_stored_procedures(source_engine, source_schema_name)
-                    items_target = get_stored_procedures(target_engine, target_schema_name)
-                else:
-                    raise ValueError(f"Invalid comparison type specified: {comparison_type}")
-
-            for item_name in items_source:
-                logging.info(
-                    f"\tProcessing {source} (source) {comparison_type[:-1]}: {item_name}")  # Debugging statement
-                schema = get_schema(source_engine, source_schema_name, item_name, comparison_type, 'SOURCE')
-                # logging.info('source schema: ', schema)
-                if schema != {}:
-                    formatted_schema = format_schema_for_json(schema)
-                    source_schema[item_name] = formatted_schema
-                s_count += 1
-
-            for item_name in items_target:
-                logging.info(
-                    f"\tProcessing {target} (target) {comparison_type[:-1]}: {item_name}")  # Debugging statement
-                schema = get_schema(target_engine, target_schema_name, item_name, comparison_type, 'TARGET')
-                # logging.info('target schema: ', schema)
-                if schema != {}:
-                    formatted_schema = format_schema_for_json(schema)
-                    target_schema[item_name] = formatted_schema
-                t_count += 1
-
-            source_output_file = os.path.join(output_dir_for_comparison,
-                                              f'SourceSchema_{source}_{comparison_type}.json')
-            target_output_file = os.path.join(output_dir_for_comparison,
-                                              f'TargetSchema_{target}_{comparison_type}.json')
-
-            save_schema_to_json(source_schema, source_output_file, f"SourceSchema_{source}_{comparison_type}")
-            save_schema_to_json(target_schema, target_output_file, f"TargetSchema_{target}_{comparison_type}")
-
-            differences = compare_schemas(source_schema, target_schema)
-            differences_output_file = os.path.join(output_dir_for_comparison,
-                                                   f'SchemaDifferences_{comparison_type}.json')
-            save_schema_to_json(differences, differences_output_file, "SchemaDifferences")
-            all_differences.update(differences)
+        all_differences = ResultStore(source, target)
+        progress = Progress.from_config(config, output_dir_with_timestamp).start()
+        profiler = Profiler.from_config(config, output_dir_with_timestamp)
+        if profiler is not None:
+            profiler.start()
+        open_registry()
+        sampler = Sampler.from_config(config)
+        priority = Priority.from_config(config)
+        fail_fast = FailFast.from_config(config) if not reflect_only else None
+
+        # Comparison types can run as concurrent tasks sharing the engines, with a global
+        # limit on the catalog operations in flight across all of them
+        type_workers = config.getint('PERFORMANCE', 'type_workers', fallback=1)
+        catalog_concurrency = config.getint('PERFORMANCE', 'catalog_concurrency', fallback=0)
+        catalog_budget = threading.BoundedSemaphore(catalog_concurrency) if catalog_concurrency > 0 \
+            else contextlib.nullcontext()
+
+        if type_workers > 1 and len(comparison_types) > 1:
+            with ThreadPoolExecutor(max_workers=type_workers) as executor:
+                futures = [executor.submit(compare_type, comparison_type, reflect_only)
+                           for comparison_type in comparison_types]
+                stores = [future.result() for future in futures]
+        else:
+            stores = [compare_type(comparison_type, reflect_only) for comparison_type in comparison_types]
 
-            logging.info(f"Completed comparison for {comparison_type}.\n"
-                         f"Total processed: {s_count} {source} (Source) {comparison_type}\n"
-                         f"Total processed: {t_count} {target} (Target) {comparison_type}\n")
+        # Merged in the compare list order, so the reports do not depend on which type finished first
+        for store in stores:
+            all_differences.extend(store)
+        save_snapshot_manifests()
+        if fail_fast is not None:
+            save_schema_to_json(fail_fast.report(), os.path.join(output_dir_with_timestamp, 'FailFast.json'),
+                                "FailFast")
 
         # Generate documentation
-        generate_documentation(all_differences, output_dir_with_timestamp, 'markdown')
-        generate_documentation(all_differences, output_dir_with_timestamp, 'html')
+        if not reflect_only:
+            with profile_stage(profiler, 'all', 'report'):
+                generate_documentation(all_differences, output_dir_with_timestamp, 'markdown')
+                generate_documentation(all_differences, output_dir_with_timestamp, 'html')
+        status = 'stopped' if fail_fast is not None and fail_fast.stopped else 'finished'
     except Exception as e:
         logging.info(f"Unexpected error: {e}")
         exit(1)
+    finally:
+        progress.stop(status)
+        if profiler is not None:
+            profiler.stop()
+        source_session.close()
+        target_session.close()
+        for throttle in throttles:
+            logging.info(throttle.summary())
+        for replay in replays:
+            replay.close()
+            logging.info(replay.summary())
 
 
 if __name__ == "__main__":
+    setup()
     start_time = time.time()
     main()
     log_errors()
     end_time = time.time()
     time_taken = end_time - start_time
     logging.info(f"Time taken: {time_taken:.2f} seconds")
+    if fail_fast is not None and fail_fast.stopped:
+        exit(1)
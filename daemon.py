@@ -0,0 +1,369 @@
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from comparison import compare_schemas, format_schema_for_json
+from output_files import render_report
+from result_store import ResultStore
+from schema_model import object_from_json
+
+# Last DDL time of every object of a schema: (object type, name, timestamp)
+DDL_TIME_QUERIES = {
+    'oracle': """
+        SELECT OBJECT_TYPE, OBJECT_NAME, LAST_DDL_TIME FROM ALL_OBJECTS
+        WHERE OWNER = :schema_name AND OBJECT_TYPE IN ('TABLE', 'VIEW', 'FUNCTION', 'PROCEDURE')
+    """,
+    'ibm_db_sa': """
+        SELECT CASE TYPE WHEN 'T' THEN 'TABLE' ELSE 'VIEW' END, TABNAME, ALTER_TIME FROM SYSCAT.TABLES
+        WHERE TABSCHEMA = :schema_name AND TYPE IN ('T', 'V')
+        UNION ALL
+        SELECT CASE ROUTINETYPE WHEN 'F' THEN 'FUNCTION' ELSE 'PROCEDURE' END, ROUTINENAME, ALTER_TIME
+        FROM SYSCAT.ROUTINES WHERE ROUTINESCHEMA = :schema_name AND ROUTINETYPE IN ('F', 'P')
+    """
+}
+
+DDL_OBJECT_TYPES = {'TABLE': 'tables', 'VIEW': 'views', 'FUNCTION': 'functions', 'PROCEDURE': 'stored_procedures'}
+
+SIDES = ('source', 'target')
+
+
+class WarmSnapshot:
+    """
+    The reflected objects of both sides kept in memory as model objects, refreshed per object
+    when the catalog DDL timestamps change. All catalog access runs on one thread, so the
+    catalog sessions keep one connection each however many requests are served.
+    """
+
+    def __init__(self, validator, types, full_refresh_seconds=3600):
+        """
+        :param validator: The configured and connected cpdSchemaValidator module.
+        :param full_refresh_seconds: Reload interval for dialects without a DDL time query. 0 to disable.
+        """
+        self.validator = validator
+        self.types = types
+        self.full_refresh_seconds = full_refresh_seconds
+        self.schemas = {comparison_type: {side: {} for side in SIDES} for comparison_type in types}
+        self.loaded = {}
+        self.listed = {comparison_type: set() for comparison_type in types}
+        self.ddl_times = {side: None for side in SIDES}
+        self.polls = 0
+        self.refreshed_objects = 0
+        self._lock = threading.Lock()
+        self._catalog = ThreadPoolExecutor(max_workers=1, thread_name_prefix='catalog')
+
+    def _side(self, side):
+        validator = self.validator
+        if side == 'source':
+            return validator.source_session, validator.config[validator.source]['schema_name'], 'SOURCE'
+        return validator.target_session, validator.config[validator.target]['schema_name'], 'TARGET'
+
+    def on_catalog_thread(self, function, *args):
+        return self._catalog.submit(function, *args).result()
+
+    def _reflect(self, comparison_type, side, item_name):
+        session, schema_name, label = self._side(side)
+        schema = self.validator.get_schema(session, schema_name, item_name, comparison_type, label)
+        self.refreshed_objects += 1
+        return object_from_json(item_name, format_schema_for_json(schema)) if schema != {} else None
+
+    def _forget(self, comparison_type):
+        # The inspectors cache what they reflect, and bulk read views are read again on next use
+        for side in SIDES:
+            self._side(side)[0].inspector.clear_cache()
+        if comparison_type == 'views' and self.validator.view_catalogs is not None:
+            self.validator.view_catalogs.clear()
+
+    def _load(self, comparison_type, changed=None):
+        """
+        List and reflect the objects of a comparison type. With changed, the lower case names of the
+        objects changed since the last load, objects on both sides before and after are not reflected again.
+        """
+        self._forget(comparison_type)
+        items_both, items_source_only, items_target_only = self.validator.get_aligned_items(comparison_type)
+        with self._lock:
+            current = self.schemas[comparison_type]
+            listed = self.listed[comparison_type]
+        schemas = {}
+        for side, one_sided in (('source', items_source_only), ('target', items_target_only)):
+            schema = {}
+            for item_name in items_both:
+                if changed is not None and item_name in listed and item_name.lower() not in changed:
+                    if item_name in current[side]:
+                        schema[item_name] = current[side][item_name]
+                    continue
+                item = self._reflect(comparison_type, side, item_name)
+                if item is not None:
+                    schema[item_name] = item
+            # Existence records, as in a compare run
+            for item_name in one_sided:
+                schema[item_name] = object_from_json(item_name, {})
+            schemas[side] = schema
+        with self._lock:
+            self.schemas[comparison_type] = schemas
+            self.listed[comparison_type] = set(items_both)
+            self.loaded[comparison_type] = time.time()
+        logging.info(f"Warm snapshot of {comparison_type}: {len(schemas['source'])} source, "
+                     f"{len(schemas['target'])} target objects")
+
+    def load(self, types=None):
+        for comparison_type in types or self.types:
+            self.on_catalog_thread(self._load, comparison_type)
+        for side in SIDES:
+            self.ddl_times[side] = self.on_catalog_thread(self._read_ddl_times, side)
+
+    def _listed_name(self, comparison_type, item_name):
+        # The spelling of the catalog listing, as the DDL times are keyed by lower case names
+        with self._lock:
+            names = set(self.listed[comparison_type])
+            for side in SIDES:
+                names.update(self.schemas[comparison_type][side])
+        return next((name for name in names if name.lower() == item_name.lower()), item_name)
+
+    def _refresh_objects(self, comparison_type, item_names):
+        """
+        Reflect changed objects again. An object that fails to reflect keeps its previous snapshot,
+        dropped objects are removed when the comparison type is listed again (see _poll).
+        """
+        self._forget(comparison_type)
+        for item_name in item_names:
+            key = self._listed_name(comparison_type, item_name)
+            reflected = {side: self._reflect(comparison_type, side, key) for side in SIDES}
+            with self._lock:
+                for side, item in reflected.items():
+                    schema = self.schemas[comparison_type][side]
+                    if item is not None:
+                        schema[key] = item
+                    elif key in schema:
+                        logging.info(f"Error refreshing {comparison_type} {key} ({side}), keeping the previous "
+                                     f"snapshot of it")
+
+    def refresh(self, comparison_type, item_names=None):
+        """
+        Reflect the named objects (or the whole comparison type) again, now.
+        """
+        if item_names:
+            self.on_catalog_thread(self._refresh_objects, comparison_type, item_names)
+        else:
+            self.on_catalog_thread(self._load, comparison_type)
+
+    def _read_ddl_times(self, side):
+        session, schema_name, _ = self._side(side)
+        default_query = DDL_TIME_QUERIES.get(session.engine.dialect.name)
+        if default_query is None and 'DDL_TIMES' not in session.statements:
+            return None
+        try:
+            rows = session.execute(session.statement('DDL_TIMES', default_query), {'schema_name': schema_name})
+            return {(DDL_OBJECT_TYPES.get(str(object_type).upper()), str(name).lower()): str(ddl_time)
+                    for object_type, name, ddl_time in rows}
+        except Exception as e:
+            logging.info(f"Error reading the DDL times of {schema_name}: {e}")
+            return None
+
+    def _poll(self):
+        self.polls += 1
+        changed = {}
+        relist = set()
+        for side in SIDES:
+            ddl_times = self._read_ddl_times(side)
+            previous = self.ddl_times[side]
+            self.ddl_times[side] = ddl_times
+            if ddl_times is None or previous is None:
+                continue
+            for key, ddl_time in ddl_times.items():
+                if key not in previous:
+                    relist.add(key[0])
+                elif previous[key] != ddl_time:
+                    changed.setdefault(key[0], set()).add(key[1])
+            relist.update(key[0] for key in previous if key not in ddl_times)
+
+        for comparison_type in self.types:
+            if comparison_type in relist:
+                # Objects were created or dropped: listed again, only new and changed objects are reflected
+                self._load(comparison_type, changed.get(comparison_type, set()))
+            elif changed.get(comparison_type):
+                logging.info(f"Refreshing {len(changed[comparison_type])} changed {comparison_type}")
+                self._refresh_objects(comparison_type, sorted(changed[comparison_type]))
+            elif (any(self.ddl_times[side] is None for side in SIDES) and self.full_refresh_seconds > 0
+                  and time.time() - self.loaded.get(comparison_type, 0) > self.full_refresh_seconds):
+                self._load(comparison_type)
+
+    def poll(self):
+        self.on_catalog_thread(self._poll)
+
+    def compare(self, types=None, item_names=None):
+        """
+        Compare the warm snapshots, optionally only some objects, with compare_schemas.
+        :return: The ResultStore of the differences.
+        """
+        validator = self.validator
+        store = ResultStore(validator.source, validator.target)
+        source_schema_name = validator.config[validator.source]['schema_name']
+        target_schema_name = validator.config[validator.target]['schema_name']
+        for comparison_type in types or self.types:
+            with self._lock:
+                source_schema = dict(self.schemas[comparison_type]['source'])
+                target_schema = dict(self.schemas[comparison_type]['target'])
+            if item_names:
+                wanted = {name.lower() for name in item_names}
+                source_schema = {name: item for name, item in source_schema.items() if name.lower() in wanted}
+                target_schema = {name: item for name, item in target_schema.items() if name.lower() in wanted}
+            compare_schemas(source_schema, target_schema, store, comparison_type, source_schema_name,
+                            target_schema_name)
+        return store
+
+    def status(self):
+        with self._lock:
+            return {
+                'source': self.validator.source,
+                'target': self.validator.target,
+                'polls': self.polls,
+                'refreshed_objects': self.refreshed_objects,
+                'ddl_polling': all(self.ddl_times[side] is not None for side in SIDES),
+                'types': {comparison_type: {
+                    'source': len(sides['source']),
+                    'target': len(sides['target']),
+                    'loaded': (datetime.fromtimestamp(self.loaded[comparison_type]).isoformat(timespec='seconds')
+                               if comparison_type in self.loaded else None)
+                } for comparison_type, sides in self.schemas.items()}
+            }
+
+    def close(self):
+        self._catalog.shutdown(wait=True)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /health
+    GET /diff?type=tables[,views][&name=T1&name=T2][&refresh=1][&format=json|markdown|html]
+    POST /refresh?type=tables[&name=T1]
+    """
+    snapshot = None
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+    def _send(self, status, body, content_type='application/json'):
+        payload = (json.dumps(body, indent=4) if content_type == 'application/json' else body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', f"{content_type}; charset=utf-8")
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _parameters(self):
+        query = parse_qs(urlparse(self.path).query)
+        types = [item.strip() for value in query.get('type', []) for item in value.split(',') if item.strip()]
+        unknown = [item for item in types if item not in self.snapshot.types]
+        if unknown:
+            raise ValueError(f"Not served: {', '.join(unknown)}, expected {', '.join(self.snapshot.types)}")
+        return query, types or list(self.snapshot.types), query.get('name')
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        try:
+            if path == '/health':
+                self._send(200, dict(self.snapshot.status(), status='ok'))
+                return
+            if path != '/diff':
+                self._send(404, {'error': f"Unknown path {path}"})
+                return
+            started = time.monotonic()
+            query, types, item_names = self._parameters()
+            if query.get('refresh', ['0'])[0].lower() in ('1', 'yes', 'true'):
+                for comparison_type in types:
+                    self.snapshot.refresh(comparison_type, item_names)
+            store = self.snapshot.compare(types, item_names)
+            output_format = query.get('format', ['json'])[0]
+            if output_format in ('markdown', 'html'):
+                self._send(200, render_report(store, output_format),
+                           'text/markdown' if output_format == 'markdown' else 'text/html')
+                return
+            self._send(200, {
+                'source': store.source,
+                'target': store.target,
+                'differences': {comparison_type: store.differences_for(comparison_type) for comparison_type in types},
+                'summary': store.summary(),
+                'elapsed_ms': round((time.monotonic() - started) * 1000, 1)
+            })
+        except ValueError as e:
+            self._send(400, {'error': str(e)})
+        except Exception as e:
+            logging.info(f"Error serving {self.path}: {e}")
+            self._send(500, {'error': str(e)})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        try:
+            if path != '/refresh':
+                self._send(404, {'error': f"Unknown path {path}"})
+                return
+            _, types, item_names = self._parameters()
+            for comparison_type in types:
+                self.snapshot.refresh(comparison_type, item_names)
+            self._send(200, dict(self.snapshot.status(), status='ok'))
+        except ValueError as e:
+            self._send(400, {'error': str(e)})
+        except Exception as e:
+            logging.info(f"Error serving {self.path}: {e}")
+            self._send(500, {'error': str(e)})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+
+
+def make_server(snapshot, host='127.0.0.1', port=8765, socket_path=None):
+    handler = type('SnapshotRequestHandler', (RequestHandler,), {'snapshot': snapshot})
+    if socket_path:
+        return UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def run_daemon(validator, types, host='127.0.0.1', port=8765, socket_path=None, poll_seconds=60,
+               full_refresh_seconds=3600):
+    """
+    Load the warm snapshots, then serve compare requests until interrupted while polling the
+    catalog DDL times in the background.
+    """
+    snapshot = WarmSnapshot(validator, types, full_refresh_seconds)
+    snapshot.load()
+    stop = threading.Event()
+
+    def poll_loop():
+        while not stop.wait(poll_seconds):
+            try:
+                snapshot.poll()
+            except Exception as e:
+                logging.info(f"Error refreshing the warm snapshots: {e}")
+
+    poller = threading.Thread(target=poll_loop, name='ddl-poll', daemon=True)
+    poller.start()
+    server = make_server(snapshot, host, port, socket_path)
+    logging.info(f"Serving {', '.join(types)} of {validator.source} and {validator.target} on "
+                 + (f"unix socket {socket_path}" if socket_path else f"http://{host}:{server.server_address[1]}"))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Stopping the daemon")
+    finally:
+        stop.set()
+        server.server_close()
+        snapshot.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
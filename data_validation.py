@@ -0,0 +1,361 @@
+import contextlib
+import datetime
+import decimal
+import logging
+import numbers
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import types
+
+from result_store import ROW_COUNT_MISMATCH, CHECKSUM_MISMATCH, ROW_MISMATCH
+
+# Only the aggregates cross the network: every row is hashed and summed by the database itself.
+# {column} is a quoted column name, {row} the concatenation of the column expressions of a row.
+COLUMN_EXPRESSIONS = {
+    'oracle': "ORA_HASH({column})",
+    'ibm_db_sa': "COALESCE(VARCHAR({column}), '')"
+}
+CHECKSUM_EXPRESSIONS = {
+    'oracle': "SUM(ORA_HASH({row}))",
+    'ibm_db_sa': "SUM(CAST(HASH4({row}) AS BIGINT))"
+}
+DEFAULT_COLUMN_EXPRESSION = "COALESCE(CAST({column} AS VARCHAR(4000)), '')"
+
+# Character key columns are ordered by their binary (code point) value, as the rows of both sides are
+# merge-joined with Python comparisons, whatever the linguistic sort or collation of the session
+SORT_EXPRESSIONS = {
+    'oracle': "NLSSORT({column}, 'NLS_SORT=BINARY')",
+    'ibm_db_sa': "CAST({column} AS VARCHAR(4000) FOR BIT DATA)"
+}
+
+# Large object columns are left out of the checksums
+LOB_TYPES = {'BLOB', 'CLOB', 'NCLOB', 'DBCLOB', 'LONG', 'LONG RAW', 'XML', 'XMLTYPE', 'BFILE'}
+
+
+class DataSide:
+    """
+    Row count and checksum queries of one side, built for the dialect of its engine.
+    """
+
+    def __init__(self, session, schema_name, column_expression=None, checksum_expression=None, budget=None):
+        """
+        :param budget: The catalog operations budget ([PERFORMANCE] catalog_concurrency) held by each query.
+        """
+        dialect_name = session.engine.dialect.name
+        self.session = session
+        self.budget = budget or contextlib.nullcontext()
+        self.schema_name = schema_name
+        self.preparer = session.engine.dialect.identifier_preparer
+        self.column_expression = column_expression or COLUMN_EXPRESSIONS.get(dialect_name,
+                                                                             DEFAULT_COLUMN_EXPRESSION)
+        self.checksum_expression = checksum_expression or CHECKSUM_EXPRESSIONS.get(dialect_name)
+        self.sort_expression = SORT_EXPRESSIONS.get(dialect_name, "{column}")
+
+    def columns(self, table_name):
+        """
+        :return: The non LOB column names and the primary key columns of a table.
+        """
+        inspector = self.session.inspector
+        columns = [column['name'] for column in inspector.get_columns(table_name, schema=self.schema_name)
+                   if str(column['type']).split('(')[0].upper() not in LOB_TYPES]
+        primary_key = inspector.get_pk_constraint(table_name, schema=self.schema_name).get('constrained_columns')
+        return columns, primary_key or []
+
+    def table_reference(self, table_name):
+        return f"{self.preparer.quote_schema(self.schema_name)}.{self.preparer.quote(table_name)}"
+
+    def order_by(self, table_name, key_columns):
+        """
+        ORDER BY terms of the key columns, in binary order for the character columns.
+        """
+        character_columns = {column['name'] for column in
+                             self.session.inspector.get_columns(table_name, schema=self.schema_name)
+                             if isinstance(column['type'], types.String)}
+        return ', '.join(self.sort_expression.format(column=self.preparer.quote(column))
+                         if column in character_columns else self.preparer.quote(column)
+                         for column in key_columns)
+
+    def row_expression(self, columns):
+        return " || '|' || ".join(self.column_expression.format(column=self.preparer.quote(column))
+                                  for column in columns)
+
+    def bounds(self, table_name, key_column):
+        """
+        Row count and key range of a table, read from the key index where the database can.
+        """
+        key = self.preparer.quote(key_column)
+        statement = self.session.statement(
+            f"DATA_BOUNDS {self.table_reference(table_name)} {key}",
+            f"SELECT COUNT(*), MIN({key}), MAX({key}) FROM {self.table_reference(table_name)}")
+        with self.budget:
+            return tuple(self.session.execute(statement).fetchone())
+
+    def checksum(self, table_name, columns, key_column=None, low=None, high=None):
+        """
+        Row count and order independent checksum of a table, or of the rows low <= key < high.
+        The checksum is None when no checksum expression is known for the dialect.
+        """
+        aggregates = "COUNT(*)"
+        if self.checksum_expression and columns:
+            aggregates += ", " + self.checksum_expression.format(row=self.row_expression(columns))
+        query = f"SELECT {aggregates} FROM {self.table_reference(table_name)}"
+        parameters = {}
+        if key_column is not None and low is not None:
+            key = self.preparer.quote(key_column)
+            query += f" WHERE {key} >= :low AND {key} < :high"
+            parameters = {'low': low, 'high': high}
+        with self.budget:
+            row = self.session.execute(self.session.statement(query, query), parameters).fetchone()
+        return row[0], (row[1] if len(row) > 1 else None)
+
+    def rows(self, table_name, columns, key_columns, low, high, fetch_size=1000):
+        """
+        Stream the rows low <= key < high ordered by the primary key (see order_by), with a server side cursor.
+        """
+        key = self.preparer.quote(key_columns[0])
+        query = (f"SELECT {', '.join(self.preparer.quote(column) for column in columns)} "
+                 f"FROM {self.table_reference(table_name)} WHERE {key} >= :low AND {key} < :high "
+                 f"ORDER BY {self.order_by(table_name, key_columns)}")
+        statement = self.session.statement(query, query).execution_options(stream_results=True)
+        result = self.session.execute(statement, {'low': low, 'high': high})
+        while True:
+            rows = result.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+
+
+def is_integer(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool) and int(value) == value
+
+
+def plan_chunks(low, high, row_count, chunk_rows):
+    """
+    Split the integer key range [low, high] into half open ranges of about chunk_rows rows each.
+    """
+    if not chunk_rows or row_count <= chunk_rows or not (is_integer(low) and is_integer(high)):
+        return [(None, None)]
+    low, high = int(low), int(high)
+    chunk_count = -(-row_count // chunk_rows)
+    width = max(-(-(high - low + 1) // chunk_count), 1)
+    return [(start, min(start + width, high + 1)) for start in range(low, high + 1, width)]
+
+
+def plan_table(source_side, target_side, table_name, chunk_rows, drill_down=False):
+    """
+    Columns common to both sides and the key ranges to checksum, from one bounds query per side.
+    Ranges are taken on the (leading) primary key column when its values are integers.
+    """
+    source_columns, primary_key = source_side.columns(table_name)
+    target_columns, _ = target_side.columns(table_name)
+    target_names = {column.lower(): column for column in target_columns}
+    common = [column for column in source_columns if column.lower() in target_names]
+    plan = {
+        'source_columns': common,
+        'target_columns': [target_names[column.lower()] for column in common],
+        'key_column': None,
+        'key_range': None,
+        'primary_key': [column for column in primary_key if column.lower() in target_names],
+        'chunks': [(None, None)]
+    }
+    if primary_key and primary_key[0].lower() in target_names and (chunk_rows or drill_down):
+        key_column = primary_key[0]
+        source_rows, source_low, source_high = source_side.bounds(table_name, key_column)
+        target_rows, target_low, target_high = target_side.bounds(table_name, target_names[key_column.lower()])
+        lows = [value for value in (source_low, target_low) if value is not None]
+        highs = [value for value in (source_high, target_high) if value is not None]
+        if lows and highs and is_integer(min(lows)) and is_integer(max(highs)):
+            plan['key_range'] = (int(min(lows)), int(max(highs)) + 1)
+            plan['chunks'] = plan_chunks(min(lows), max(highs), max(source_rows, target_rows), chunk_rows)
+            if plan['chunks'][0][0] is not None:
+                plan['key_column'] = key_column
+    return plan
+
+
+def json_value(value):
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime.date, datetime.time, bytes)):
+        return str(value)
+    return value
+
+
+def diff_rows(source_side, target_side, table_name, plan, low, high):
+    """
+    Merge-join the streamed rows of one key range of both sides on the primary key, holding one slot
+    of the catalog budget of the source side for both streams.
+    :return: (key, source values, target values) of the differing rows, None for a missing row.
+    """
+    positions = [plan['source_columns'].index(column) for column in plan['primary_key']]
+    target_key_columns = [plan['target_columns'][position] for position in positions]
+    source_rows = source_side.rows(table_name, plan['source_columns'], plan['primary_key'], low, high)
+    target_rows = target_side.rows(table_name, plan['target_columns'], target_key_columns, low, high)
+
+    def next_row(rows):
+        row = next(rows, None)
+        return (tuple(row[position] for position in positions), tuple(row)) if row is not None else (None, None)
+
+    differences = []
+    with source_side.budget:
+        source_key, source_row = next_row(source_rows)
+        target_key, target_row = next_row(target_rows)
+        while source_key is not None or target_key is not None:
+            if target_key is None or (source_key is not None and source_key < target_key):
+                differences.append((source_key, source_row, None))
+                source_key, source_row = next_row(source_rows)
+            elif source_key is None or target_key < source_key:
+                differences.append((target_key, None, target_row))
+                target_key, target_row = next_row(target_rows)
+            else:
+                if source_row != target_row:
+                    differences.append((source_key, source_row, target_row))
+                source_key, source_row = next_row(source_rows)
+                target_key, target_row = next_row(target_rows)
+    return differences
+
+
+def drill_down(source_side, target_side, table_name, plan, ranges, executor, leaf_rows=1000):
+    """
+    Bisect mismatched key ranges, checksumming both halves on both sides concurrently, until they
+    hold at most leaf_rows rows. Only the rows of those small ranges are fetched and compared, so
+    the work grows with the logarithm of the table size when differences are sparse.
+    :param ranges: The mismatched (low, high, source rows, target rows) key ranges.
+    :return: The differing rows (see diff_rows) and the number of range checksums computed.
+    """
+    key_column = plan['primary_key'][0]
+    target_key = plan['target_columns'][plan['source_columns'].index(key_column)]
+    frontier = list(ranges)
+    leaves = []
+    checksum_count = 0
+    while frontier:
+        halves = []
+        for low, high, source_rows, target_rows in frontier:
+            if max(source_rows, target_rows) <= leaf_rows or high - low <= 1:
+                leaves.append((low, high))
+                continue
+            middle = (low + high) // 2
+            for half_low, half_high in ((low, middle), (middle, high)):
+                halves.append((half_low, half_high,
+                               executor.submit(source_side.checksum, table_name, plan['source_columns'], key_column,
+                                               half_low, half_high),
+                               executor.submit(target_side.checksum, table_name, plan['target_columns'], target_key,
+                                               half_low, half_high)))
+        frontier = []
+        for half_low, half_high, source_future, target_future in halves:
+            source_result = source_future.result()
+            target_result = target_future.result()
+            checksum_count += 2
+            # Counts and checksums are sums, so a mismatched range has at least one mismatched half
+            if source_result != target_result:
+                frontier.append((half_low, half_high, source_result[0], target_result[0]))
+
+    differences = []
+    for future in [executor.submit(diff_rows, source_side, target_side, table_name, plan, low, high)
+                   for low, high in leaves]:
+        differences.extend(future.result())
+    differences.sort(key=lambda difference: difference[0])
+    return differences, checksum_count
+
+
+def validate_tables(source_side, target_side, tables, store, chunk_rows=1000000, workers=4, drill_down_rows=False,
+                    leaf_rows=1000, max_row_differences=100):
+    """
+    Compare the row counts and checksums of tables present on both sides. Tables and the key
+    ranges of large tables are checksummed in parallel, each side on its own connections.
+    :param drill_down_rows: Bisect the mismatched key ranges down to the differing rows.
+    :param max_row_differences: Differing rows reported per table.
+    :return: table -> result dictionary, saved as DataValidation.json.
+    """
+    if not source_side.checksum_expression or not target_side.checksum_expression:
+        logging.info("No checksum expression for the database dialect, comparing row counts only")
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        plan_futures = {table_name: executor.submit(plan_table, source_side, target_side, table_name, chunk_rows,
+                                                    drill_down_rows)
+                        for table_name in tables}
+        plans = {}
+        for table_name, future in plan_futures.items():
+            try:
+                plans[table_name] = future.result()
+            except Exception as e:
+                logging.info(f"Error planning data validation of {table_name}: {e}")
+                results[table_name] = {'error': str(e)}
+
+        chunk_futures = {}
+        for table_name, plan in plans.items():
+            target_key = (plan['target_columns'][plan['source_columns'].index(plan['key_column'])]
+                          if plan['key_column'] else None)
+            for low, high in plan['chunks']:
+                chunk_futures[table_name, low] = (
+                    executor.submit(source_side.checksum, table_name, plan['source_columns'], plan['key_column'],
+                                    low, high),
+                    executor.submit(target_side.checksum, table_name, plan['target_columns'], target_key,
+                                    low, high))
+
+        for table_name, plan in plans.items():
+            result = {'columns': len(plan['source_columns']), 'key_column': plan['key_column'],
+                      'chunks': len(plan['chunks']), 'source_rows': 0, 'target_rows': 0, 'mismatched_ranges': []}
+            try:
+                for low, high in plan['chunks']:
+                    source_future, target_future = chunk_futures[table_name, low]
+                    source_rows, source_checksum = source_future.result()
+                    target_rows, target_checksum = target_future.result()
+                    result['source_rows'] += source_rows
+                    result['target_rows'] += target_rows
+                    if (source_rows, source_checksum) != (target_rows, target_checksum):
+                        result['mismatched_ranges'].append({'low': low, 'high': high, 'source_rows': source_rows,
+                                                            'target_rows': target_rows})
+                if drill_down_rows and result['mismatched_ranges'] and plan['key_range']:
+                    ranges = [(mismatch['low'], mismatch['high']) if mismatch['low'] is not None else plan['key_range']
+                              for mismatch in result['mismatched_ranges']]
+                    differences, result['range_checksums'] = drill_down(
+                        source_side, target_side, table_name, plan,
+                        [(low, high, mismatch['source_rows'], mismatch['target_rows'])
+                         for (low, high), mismatch in zip(ranges, result['mismatched_ranges'])],
+                        executor, leaf_rows)
+                    result['row_difference_count'] = len(differences)
+                    result['row_differences'] = [row_difference(plan, difference)
+                                                 for difference in differences[:max_row_differences]]
+            except Exception as e:
+                logging.info(f"Error validating data of {table_name}: {e}")
+                results[table_name] = {'error': str(e)}
+                continue
+            result['match'] = not result['mismatched_ranges']
+            results[table_name] = result
+            record_differences(store, source_side.schema_name, table_name, result)
+    return results
+
+
+def record_differences(store, schema_name, table_name, result):
+    if result['source_rows'] != result['target_rows']:
+        store.add('data', schema_name, table_name, ROW_COUNT_MISMATCH,
+                  source_value=result['source_rows'], target_value=result['target_rows'])
+    for mismatch in result['mismatched_ranges']:
+        if mismatch['low'] is None:
+            key_range = None
+        else:
+            key_range = f"{result['key_column']} {mismatch['low']} to {mismatch['high'] - 1}"
+        store.add('data', schema_name, table_name, CHECKSUM_MISMATCH, key_range,
+                  mismatch['source_rows'], mismatch['target_rows'])
+    for difference in result.get('row_differences', []):
+        store.add('data', schema_name, table_name, ROW_MISMATCH, difference['key'],
+                  difference['source'], difference['target'])
+
+
+def row_difference(plan, difference):
+    """
+    JSON form of a differing row: the key and the source and target values of the differing columns.
+    """
+    key, source_row, target_row = difference
+    columns = plan['source_columns']
+    if source_row is not None and target_row is not None:
+        changed = [i for i, (source_value, target_value) in enumerate(zip(source_row, target_row))
+                   if source_value != target_value]
+    else:
+        changed = range(len(columns))
+    return {
+        'key': ", ".join(f"{column}={json_value(value)}" for column, value in zip(plan['primary_key'], key)),
+        'source': {columns[i]: json_value(source_row[i]) for i in changed} if source_row is not None else None,
+        'target': {columns[i]: json_value(target_row[i]) for i in changed} if target_row is not None else None
+    }
@@ -0,0 +1,251 @@
+import logging
+from collections import deque
+
+from schema_model import FOREIGN_KEYS, Table
+
+# One catalog read of every foreign key of a schema: (table, constraint, referenced table)
+FOREIGN_KEY_QUERIES = {
+    'oracle': """
+        SELECT C.TABLE_NAME, C.CONSTRAINT_NAME, R.TABLE_NAME
+        FROM ALL_CONSTRAINTS C
+        JOIN ALL_CONSTRAINTS R ON C.R_OWNER = R.OWNER AND C.R_CONSTRAINT_NAME = R.CONSTRAINT_NAME
+        WHERE C.OWNER = :schema_name AND C.CONSTRAINT_TYPE = 'R'
+    """,
+    'ibm_db_sa': """
+        SELECT TABNAME, CONSTNAME, REFTABNAME FROM SYSCAT.REFERENCES WHERE TABSCHEMA = :schema_name
+    """
+}
+
+
+class DependencyGraph:
+    """
+    Foreign key graph of a schema with adjacency indexes in both directions.
+    Table names are matched case-insensitively, as catalogs and inspectors disagree on case.
+    """
+
+    def __init__(self):
+        self.references = {}  # table -> tables it references
+        self.referenced_by = {}  # table -> tables referencing it
+        self._names = {}
+
+    def _key(self, name):
+        key = name.lower()
+        self._names.setdefault(key, name)
+        return key
+
+    def add_table(self, name):
+        key = self._key(name)
+        self.references.setdefault(key, set())
+        self.referenced_by.setdefault(key, set())
+
+    def add_names(self, names):
+        # Prefer the spelling used by the comparison (e.g. lookup files) when reporting
+        for name in names:
+            self._names[name.lower()] = name
+            self.add_table(name)
+
+    def add_edge(self, table, referenced_table):
+        table_key = self._key(table)
+        referenced_key = self._key(referenced_table)
+        self.references.setdefault(table_key, set()).add(referenced_key)
+        self.referenced_by.setdefault(referenced_key, set()).add(table_key)
+        self.references.setdefault(referenced_key, set())
+        self.referenced_by.setdefault(table_key, set())
+
+    def name(self, key):
+        return self._names.get(key, key)
+
+    def __len__(self):
+        return len(self.references)
+
+    def edge_count(self):
+        return sum(len(targets) for targets in self.references.values())
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build the graph in one pass over (table, constraint, referenced table) catalog rows.
+        """
+        graph = cls()
+        for row in rows:
+            graph.add_edge(row[0], row[2])
+        return graph
+
+    @classmethod
+    def from_schema(cls, schema):
+        """
+        Build the graph in one pass over reflected tables (model objects or their JSON form).
+        """
+        graph = cls()
+        for name, table in schema.items():
+            graph.add_table(name)
+            if isinstance(table, Table):
+                foreign_keys = [constraint.referenced_table for constraint in table.constraints.get(FOREIGN_KEYS, ())]
+            elif isinstance(table, dict):
+                foreign_keys = [fk.get('referenced_table') for fk in table.get(FOREIGN_KEYS, [])]
+            else:
+                foreign_keys = []
+            for referenced_table in foreign_keys:
+                if referenced_table:
+                    graph.add_edge(name, referenced_table)
+        return graph
+
+    def affected_by(self, tables):
+        """
+        All tables that directly or transitively reference any of the given tables.
+        """
+        start = [table.lower() for table in tables]
+        seen = set(start)
+        queue = deque(start)
+        while queue:
+            for dependent in self.referenced_by.get(queue.popleft(), ()):
+                if dependent not in seen:
+                    seen.add(dependent)
+                    queue.append(dependent)
+        return sorted(self.name(key) for key in seen - set(start))
+
+    def _dependent_closures(self, keys):
+        """
+        Tables reachable through referenced_by from the given keys, computed in one pass with
+        Tarjan's algorithm: every strongly connected component shares one closure, built from
+        the closures of the components it reaches, which are always completed before it.
+        :return: (key -> bit mask of the reachable keys including itself, key -> bit of the key)
+        """
+        order = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        closures = {}
+        for root in keys:
+            if root in order:
+                continue
+            order[root] = low[root] = len(order)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.referenced_by.get(root, ())))]
+            while work:
+                node, dependents = work[-1]
+                for dependent in dependents:
+                    if dependent not in order:
+                        order[dependent] = low[dependent] = len(order)
+                        stack.append(dependent)
+                        on_stack.add(dependent)
+                        work.append((dependent, iter(self.referenced_by.get(dependent, ()))))
+                        break
+                    if dependent in on_stack:
+                        low[node] = min(low[node], order[dependent])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == order[node]:
+                        members = []
+                        while not members or members[-1] != node:
+                            members.append(stack.pop())
+                            on_stack.discard(members[-1])
+                        closure = 0
+                        for member in members:
+                            closure |= 1 << order[member]
+                        for member in members:
+                            for dependent in self.referenced_by.get(member, ()):
+                                closure |= closures.get(dependent, 0)
+                        for member in members:
+                            closures[member] = closure
+        return closures, order
+
+    @staticmethod
+    def _members(closure, keys):
+        # Keys of the set bits, keys being listed in bit order
+        while closure:
+            bit = closure & -closure
+            yield keys[bit.bit_length() - 1]
+            closure ^= bit
+
+    def impact_ranking(self, tables):
+        """
+        Rank tables by the number of tables affected by a change in them, highest first.
+        """
+        closures, order = self._dependent_closures(table.lower() for table in tables)
+        keys = list(order)
+        ranking = []
+        for table in tables:
+            key = table.lower()
+            closure = closures[key] & ~(1 << order[key])
+            affected = sorted(self.name(dependent) for dependent in self._members(closure, keys))
+            ranking.append({'table': table, 'affected_count': len(affected), 'affected_tables': affected})
+        ranking.sort(key=lambda item: (-item['affected_count'], item['table']))
+        return ranking
+
+    def components(self, names=None):
+        """
+        Connected components of the graph (ignoring direction), largest first.
+        :param names: Restrict the components to these tables, tables without foreign keys are singletons.
+        """
+        spelling = {name.lower(): name for name in names} if names is not None else {}
+        keys = list(spelling) if names is not None else list(self.references)
+        wanted = set(keys)
+        seen = set()
+        components = []
+        for key in keys:
+            if key in seen:
+                continue
+            component = []
+            seen.add(key)
+            queue = deque([key])
+            while queue:
+                current = queue.popleft()
+                component.append(spelling.get(current) or self.name(current))
+                for neighbour in self.references.get(current, set()) | self.referenced_by.get(current, set()):
+                    if neighbour in wanted and neighbour not in seen:
+                        seen.add(neighbour)
+                        queue.append(neighbour)
+            components.append(sorted(component))
+        components.sort(key=lambda component: (-len(component), component[0]))
+        return components
+
+    def reflection_order(self, names, priority=None):
+        """
+        Order tables component by component, so related tables are reflected together and
+        the most referenced tables of each component come first.
+        :param priority: Optional tables to move to the front of the order.
+        """
+        priority = {name.lower() for name in (priority or [])}
+        order = []
+        for component in self.components(names):
+            component.sort(key=lambda name: (name.lower() not in priority,
+                                             -len(self.referenced_by.get(name.lower(), ())), name))
+            order.extend(component)
+        order.sort(key=lambda name: name.lower() not in priority)
+        return order
+
+    def partition(self, names, workers):
+        """
+        Split tables into at most `workers` groups without splitting a connected component,
+        assigning the largest components first to the smallest group.
+        """
+        partitions = [[] for _ in range(max(workers, 1))]
+        for component in self.components(names):
+            min(partitions, key=len).extend(component)
+        return [partition for partition in partitions if partition]
+
+    def to_json(self):
+        return {self.name(key): sorted(self.name(target) for target in targets)
+                for key, targets in sorted(self.references.items())}
+
+
+def read_dependency_graph(session, schema_name):
+    """
+    Read every foreign key of the schema with a single catalog query, the FOREIGN_KEYS_LIST
+    query of the [QUERIES] section or the built-in query for the engine dialect.
+    :return: The DependencyGraph, or None when no bulk query is available for the dialect.
+    """
+    default_query = FOREIGN_KEY_QUERIES.get(session.engine.dialect.name)
+    if default_query is None and 'FOREIGN_KEYS_LIST' not in session.statements:
+        return None
+    try:
+        statement = session.statement('FOREIGN_KEYS_LIST', default_query)
+        return DependencyGraph.from_rows(session.execute(statement, {'schema_name': schema_name}))
+    except Exception as e:
+        logging.info(f"Error retrieving foreign keys of {schema_name}: {e}")
+        return None
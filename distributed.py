@@ -0,0 +1,317 @@
+import json
+import logging
+import math
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+
+# Coordinator/worker reflection. The coordinator lists the objects, splits them into shards in a
+# SQLite work table and merges the partial snapshot files the workers write. Workers are local
+# processes or processes on other hosts that can reach the same queue file and partial folder.
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def open_queue(queue_file):
+    connection = sqlite3.connect(queue_file, timeout=60, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS shards (
+            shard_id INTEGER PRIMARY KEY,
+            comparison_type TEXT NOT NULL,
+            side TEXT NOT NULL,
+            items TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            heartbeat REAL,
+            result_file TEXT,
+            error TEXT,
+            object_errors TEXT
+        )
+    """)
+    connection.execute("CREATE TABLE IF NOT EXISTS run (key TEXT PRIMARY KEY, value TEXT)")
+    return connection
+
+
+def set_run_value(connection, key, value):
+    connection.execute("INSERT OR REPLACE INTO run (key, value) VALUES (?, ?)", (key, value))
+
+
+def get_run_value(connection, key, default=None):
+    row = connection.execute("SELECT value FROM run WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def add_shards(connection, comparison_type, side, items, shard_size, dependency_graph=None):
+    """
+    Split the objects into shards of about shard_size objects.
+    :param dependency_graph: The foreign key graph of the tables, to shard whole connected components, so
+        that related tables are reflected by the same worker, in their reflection_order.
+    """
+    if dependency_graph is not None:
+        shards = [dependency_graph.reflection_order(partition)
+                  for partition in dependency_graph.partition(items, math.ceil(len(items) / shard_size))]
+    else:
+        shards = [items[start:start + shard_size] for start in range(0, len(items), shard_size)]
+    shard_ids = []
+    for shard in shards:
+        cursor = connection.execute("INSERT INTO shards (comparison_type, side, items) VALUES (?, ?, ?)",
+                                    (comparison_type, side, json.dumps(shard)))
+        shard_ids.append(cursor.lastrowid)
+    return shard_ids
+
+
+def claim_shard(connection, worker):
+    """
+    Atomically move the next pending shard to running for this worker.
+    :return: (shard_id, comparison_type, side, items) or None when nothing is pending.
+    """
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        row = connection.execute("SELECT shard_id, comparison_type, side, items FROM shards "
+                                 "WHERE status = ? ORDER BY shard_id LIMIT 1", (PENDING,)).fetchone()
+        if row:
+            connection.execute("UPDATE shards SET status = ?, worker = ?, attempts = attempts + 1, heartbeat = ? "
+                               "WHERE shard_id = ?", (RUNNING, worker, time.time(), row[0]))
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    if row is None:
+        return None
+    return row[0], row[1], row[2], json.loads(row[3])
+
+
+def requeue_stale_shards(connection, lease_seconds, max_attempts):
+    # Shards of workers that stopped sending heartbeats go back to the queue, or fail after max_attempts
+    stale_before = time.time() - lease_seconds
+    connection.execute("UPDATE shards SET status = ?, error = 'worker lease expired' "
+                       "WHERE status = ? AND heartbeat < ? AND attempts >= ?",
+                       (FAILED, RUNNING, stale_before, max_attempts))
+    connection.execute("UPDATE shards SET status = ?, worker = NULL WHERE status = ? AND heartbeat < ?",
+                       (PENDING, RUNNING, stale_before))
+
+
+def fail_shard(connection, shard_id, error, max_attempts):
+    # A shard that raised goes back to the queue as after a lease expiry, or fails after max_attempts
+    connection.execute("UPDATE shards SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, worker = NULL, "
+                       "error = ? WHERE shard_id = ?", (max_attempts, FAILED, PENDING, error, shard_id))
+
+
+def shard_counts(connection):
+    return dict(connection.execute("SELECT status, COUNT(*) FROM shards GROUP BY status").fetchall())
+
+
+def run_worker(queue_file, config_file=None, worker=None, heartbeat_seconds=10):
+    """
+    Reflect shards from the work queue until it is empty, writing one partial snapshot per shard.
+    :param config_file: Overrides the configuration file recorded by the coordinator (for remote hosts).
+    """
+    import cpdSchemaValidator as validator
+
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    connection = open_queue(queue_file)
+
+    # Wait for the coordinator to finish planning when started ahead of it
+    while get_run_value(connection, 'planned') != '1':
+        time.sleep(1)
+
+    validator.config.read(config_file or get_run_value(connection, 'config_file'))
+    validator.connect_databases(get_run_value(connection, 'source'), get_run_value(connection, 'target'))
+    partial_dir = get_run_value(connection, 'partial_dir')
+    max_attempts = int(get_run_value(connection, 'max_attempts', 3))
+    sessions = {'source': validator.source_session, 'target': validator.target_session}
+    schema_names = {'source': validator.config[validator.source]['schema_name'],
+                    'target': validator.config[validator.target]['schema_name']}
+
+    shard_count = 0
+    try:
+        while True:
+            shard = claim_shard(connection, worker)
+            if shard is None:
+                break
+            shard_id, comparison_type, side, items = shard
+            logging.info(f"Worker {worker} reflecting shard {shard_id}: {len(items)} {side} {comparison_type}")
+            # Objects that fail to reflect are collected by get_schema, and passed back with the shard
+            errors = validator.error_tables[side.upper()]
+            first_error = len(errors)
+            try:
+                partial = {}
+                last_heartbeat = time.time()
+                for item_name in items:
+                    schema = validator.get_schema(sessions[side], schema_names[side], item_name, comparison_type,
+                                                  side.upper())
+                    if schema != {}:
+                        partial[item_name] = validator.format_schema_for_json(schema)
+                    if time.time() - last_heartbeat > heartbeat_seconds:
+                        last_heartbeat = time.time()
+                        connection.execute("UPDATE shards SET heartbeat = ? WHERE shard_id = ?",
+                                           (last_heartbeat, shard_id))
+
+                result_file = os.path.join(partial_dir, f"{comparison_type}_{side}_{shard_id:06d}.json")
+                with open(result_file + '.tmp', 'w') as json_file:
+                    json.dump(partial, json_file)
+                os.replace(result_file + '.tmp', result_file)
+                connection.execute("UPDATE shards SET status = ?, result_file = ?, object_errors = ? "
+                                   "WHERE shard_id = ?",
+                                   (DONE, result_file, json.dumps(errors[first_error:]), shard_id))
+            except Exception as e:
+                logging.info(f"Worker {worker} failed shard {shard_id}: {e}")
+                fail_shard(connection, shard_id, str(e), max_attempts)
+            shard_count += 1
+    finally:
+        validator.source_session.close()
+        validator.target_session.close()
+        connection.close()
+        for throttle in validator.throttles:
+            logging.info(throttle.summary())
+    logging.info(f"Worker {worker} finished after {shard_count} shards")
+    return shard_count
+
+
+def start_local_workers(queue_file, count):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schemavalidator.py')
+    return [subprocess.Popen([sys.executable, script, 'work', '--queue', os.path.abspath(queue_file)])
+            for _ in range(count)]
+
+
+def load_partials(connection, comparison_type, side, error_tables=None):
+    """
+    Merge the partial snapshots of a comparison type and side in shard order.
+    :param error_tables: The coordinator's error_tables, extended with the objects the workers failed to reflect.
+    """
+    schema = {}
+    rows = connection.execute("SELECT result_file, object_errors FROM shards WHERE comparison_type = ? AND side = ? "
+                              "AND status = ? ORDER BY shard_id", (comparison_type, side, DONE)).fetchall()
+    for result_file, object_errors in rows:
+        with open(result_file, 'r') as json_file:
+            schema.update(json.load(json_file))
+        if error_tables is not None and object_errors:
+            error_tables[side.upper()].extend(json.loads(object_errors))
+    return schema
+
+
+def run_coordinator(validator, config_file, local_workers=2, shard_size=500, lease_seconds=300, max_attempts=3,
+                    poll_seconds=2, max_restarts=3):
+    """
+    Plan the shards of every comparison type, run (or wait for) the workers, then merge the partial
+    snapshots and compare them as a single process run would.
+    :param validator: The cpdSchemaValidator module after setup().
+    :param local_workers: Worker processes to start on this host, 0 to rely on remote workers only.
+    :param max_restarts: Times the local workers are started again when they all exit with shards pending.
+    :return: The ResultStore, or None when shards failed (after max_attempts, or as the local workers kept
+        exiting) and nothing was compared.
+    """
+    output_dir = validator.output_dir_with_timestamp
+    queue_file = os.path.join(output_dir, 'work_queue.sqlite')
+    partial_dir = os.path.abspath(os.path.join(output_dir, 'partial'))
+    os.makedirs(partial_dir, exist_ok=True)
+
+    connection = open_queue(queue_file)
+    set_run_value(connection, 'config_file', os.path.abspath(config_file))
+    set_run_value(connection, 'source', validator.source)
+    set_run_value(connection, 'target', validator.target)
+    set_run_value(connection, 'partial_dir', partial_dir)
+    set_run_value(connection, 'max_attempts', str(max_attempts))
+
+    reflect_one_sided = validator.config.getboolean('PERFORMANCE', 'reflect_one_sided_objects', fallback=False)
+    comparison_types = [item.strip() for item in validator.config['COMPARISON']['compare'].split(',')]
+    one_sided = {}
+    listed = {}
+    dependency_graphs = {}
+    for comparison_type in comparison_types:
+        if comparison_type in ('data', 'statistics'):
+            continue
+        items_both, items_source_only, items_target_only = validator.get_aligned_items(comparison_type)
+        listed[comparison_type] = (items_both + items_source_only, items_both + items_target_only)
+        if comparison_type == 'tables':
+            dependency_graphs[comparison_type] = validator.read_dependency_graph(
+                validator.source_session, validator.config[validator.source]['schema_name'])
+        dependency_graph = dependency_graphs.get(comparison_type)
+        if reflect_one_sided:
+            add_shards(connection, comparison_type, 'source', items_both + items_source_only, shard_size,
+                       dependency_graph)
+            add_shards(connection, comparison_type, 'target', items_both + items_target_only, shard_size,
+                       dependency_graph)
+            one_sided[comparison_type] = ([], [])
+        else:
+            add_shards(connection, comparison_type, 'source', items_both, shard_size, dependency_graph)
+            add_shards(connection, comparison_type, 'target', items_both, shard_size, dependency_graph)
+            one_sided[comparison_type] = (items_source_only, items_target_only)
+    set_run_value(connection, 'planned', '1')
+    logging.info(f"Planned {sum(shard_counts(connection).values())} shards in '{queue_file}'")
+
+    processes = start_local_workers(queue_file, local_workers)
+    restarts = 0
+    workers_failed = False
+    while True:
+        requeue_stale_shards(connection, lease_seconds, max_attempts)
+        counts = shard_counts(connection)
+        if not counts.get(PENDING) and not counts.get(RUNNING):
+            break
+        if processes and all(process.poll() is not None for process in processes) and counts.get(PENDING):
+            if restarts >= max_restarts:
+                # Workers that keep exiting (e.g. a wrong DSN or password) would be restarted forever
+                logging.info(f"Local workers exited {restarts + 1} times, failing the pending shards")
+                connection.execute("UPDATE shards SET status = ?, error = ? WHERE status = ?",
+                                   (FAILED, f"local workers exited {restarts + 1} times, see their logs", PENDING))
+                workers_failed = True
+                continue
+            # Local workers exited early (e.g. connection failures): start replacements
+            restarts += 1
+            logging.info(f"Local workers exited with shards pending, restarting them ({restarts}/{max_restarts})")
+            processes = start_local_workers(queue_file, local_workers)
+        time.sleep(poll_seconds)
+    for process in processes:
+        process.wait()
+
+    failed_shards = connection.execute("SELECT shard_id, comparison_type, side, error FROM shards WHERE status = ?",
+                                       (FAILED,)).fetchall()
+    for shard_id, comparison_type, side, error in failed_shards:
+        validator.error_tables[side.upper()].append(f"{side.upper()} - shard {shard_id} of {comparison_type}: {error}")
+    if workers_failed or failed_shards:
+        # The objects of the failed shards would all be reported as missing
+        logging.info(f"Distributed reflection failed ({len(failed_shards)} shards failed), nothing compared")
+        connection.close()
+        return None
+
+    store = validator.ResultStore(validator.source, validator.target)
+    for comparison_type in comparison_types:
+        output_dir_for_comparison = os.path.join(output_dir, comparison_type)
+        os.makedirs(output_dir_for_comparison, exist_ok=True)
+        if comparison_type == 'data':
+            validator.validate_data(store, output_dir_for_comparison)
+            continue
+        if comparison_type == 'statistics':
+            validator.compare_statistics(store, output_dir_for_comparison)
+            continue
+        source_schema = load_partials(connection, comparison_type, 'source', validator.error_tables)
+        target_schema = load_partials(connection, comparison_type, 'target', validator.error_tables)
+        items_source_only, items_target_only = one_sided[comparison_type]
+        for item_name in items_source_only:
+            source_schema[item_name] = {}
+        for item_name in items_target_only:
+            target_schema[item_name] = {}
+        # Compared and saved in the listed order, as in a single process run
+        source_listed, target_listed = listed[comparison_type]
+        source_schema = {item_name: source_schema[item_name] for item_name in source_listed
+                         if item_name in source_schema}
+        target_schema = {item_name: target_schema[item_name] for item_name in target_listed
+                         if item_name in target_schema}
+        validator.compare_and_save(comparison_type, source_schema, target_schema, store, output_dir_for_comparison,
+                                   dependency_graphs.get(comparison_type),
+                                   validator.config.getint('PERFORMANCE', 'compare_workers', fallback=1))
+        logging.info(f"Completed comparison for {comparison_type}.\n"
+                     f"Total differences: {store.count(object_type=comparison_type)}\n")
+    connection.close()
+
+    validator.generate_documentation(store, output_dir, 'markdown')
+    validator.generate_documentation(store, output_dir, 'html')
+    return store
@@ -0,0 +1,220 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+
+from comparison import align_names, compare_schemas, format_schema_for_json
+from output_files import generate_documentation, save_schema_to_json
+from progress import Progress
+from result_store import ResultStore
+from schema_model import object_from_json, schema_to_json
+from snapshot_index import save_indexed_schema
+
+
+class FanOut:
+    """
+    One source compared with many targets. The source is reflected once per comparison type into a
+    read only snapshot shared by every target comparison, and the targets are reflected concurrently,
+    so N targets cost 1 + N reflections instead of 2N.
+    """
+
+    def __init__(self, validator, targets, workers=4, catalog_concurrency=0):
+        """
+        :param validator: The configured and connected cpdSchemaValidator module.
+        :param targets: The config sections of the targets.
+        :param workers: Targets reflected at the same time (the source is reflected alongside them).
+        :param catalog_concurrency: Limit on the catalog operations in flight across all sides, 0 for none.
+        """
+        self.validator = validator
+        self.targets = targets
+        self.workers = max(workers, 1)
+        self.catalog_budget = (threading.BoundedSemaphore(catalog_concurrency) if catalog_concurrency > 0
+                               else contextlib.nullcontext())
+        self.sessions = {}
+        self.stores = {target: ResultStore(validator.source, target) for target in targets}
+        self.drift = {}  # comparison type -> object -> target -> number of differences
+        self.failed = {}  # comparison type -> target -> error, for the targets that were not compared
+        self.save_schema = (save_indexed_schema if validator.config.getboolean('output', 'index', fallback=True)
+                            else save_schema_to_json)
+
+    def _session(self, section_name):
+        validator = self.validator
+        if section_name == validator.target:
+            return validator.target_session
+        if section_name not in self.sessions:
+            self.sessions[section_name] = validator.connect_section(section_name)
+        return self.sessions[section_name]
+
+    def _list(self, session, section_name, comparison_type):
+        validator = self.validator
+        with self.catalog_budget:
+            items = validator.get_item_names(session, validator.config[section_name]['schema_name'], comparison_type)
+        lookup_file_path = validator.get_lookup_file_path(comparison_type)
+        if lookup_file_path:
+            # Keep the lookup file spelling, as get_aligned_items does
+            lookup_items = {item.lower(): item for item in validator.read_lookup_file(lookup_file_path)}
+            items = [lookup_items[item.lower()] for item in items if item.lower() in lookup_items]
+        return items
+
+    def _reflect(self, session, section_name, label, comparison_type, item_names):
+        validator = self.validator
+        schema_name = validator.config[section_name]['schema_name']
+        side = 'source' if label == 'SOURCE' else section_name
+        schema = {}
+        validator.progress.add_total(comparison_type, side, len(item_names))
+        for item_name in item_names:
+            validator.progress.log_object(comparison_type, side, f"\tProcessing {section_name} ({label.lower()}) "
+                                                                 f"{comparison_type[:-1]}: {item_name}")
+            started = time.monotonic()
+            with self.catalog_budget:
+                reflected = validator.get_schema(session, schema_name, item_name, comparison_type, label)
+            validator.progress.completed(comparison_type, side, item_name, time.monotonic() - started)
+            if reflected != {}:
+                schema[item_name] = object_from_json(item_name, format_schema_for_json(reflected))
+        return schema
+
+    def _reflect_target(self, target, comparison_type, source_names):
+        session = self._session(target)
+        items_both, _, items_target_only = align_names(source_names, self._list(session, target, comparison_type))
+        target_schema = self._reflect(session, target, 'TARGET', comparison_type, items_both)
+        # Existence records for the objects that were not reflected, as in a compare run
+        for item_name in items_target_only:
+            target_schema[item_name] = object_from_json(item_name, {})
+        return items_both, target_schema
+
+    def _compare_target(self, target, comparison_type, source_snapshot, items_both, target_schema, output_dir):
+        validator = self.validator
+        # The source objects in the order of a single target run: in both first, then only in the source
+        source_order = items_both + [name for name in source_snapshot if name not in target_schema]
+        source_schema = {name: source_snapshot[name] for name in source_order if name in source_snapshot}
+        store = self.stores[target]
+        compare_schemas(source_schema, target_schema, store, comparison_type,
+                        validator.config[validator.source]['schema_name'], validator.config[target]['schema_name'])
+        differences = store.differences_for(comparison_type)
+
+        output_dir_for_comparison = os.path.join(output_dir, target, comparison_type)
+        os.makedirs(output_dir_for_comparison, exist_ok=True)
+        self.save_schema(schema_to_json(target_schema),
+                         os.path.join(output_dir_for_comparison, f'TargetSchema_{target}_{comparison_type}.json'),
+                         f"TargetSchema_{target}_{comparison_type}")
+        save_schema_to_json(differences, os.path.join(output_dir_for_comparison,
+                                                      f'SchemaDifferences_{comparison_type}.json'),
+                            "SchemaDifferences")
+        for item_name, messages in differences.items():
+            self.drift.setdefault(comparison_type, {}).setdefault(item_name, {})[target] = len(messages)
+        logging.info(f"Compared {comparison_type} of {validator.source} (source) with {target} (target): "
+                     f"{len(differences)} objects differ")
+
+    def compare_type(self, comparison_type, output_dir, executor):
+        validator = self.validator
+        source_names = self._list(validator.source_session, validator.source, comparison_type)
+
+        # The source snapshot is reflected alongside the first targets and shared read only by all of them
+        source_future = executor.submit(self._reflect, validator.source_session, validator.source, 'SOURCE',
+                                        comparison_type, source_names)
+        target_futures = {target: executor.submit(self._reflect_target, target, comparison_type, source_names)
+                          for target in self.targets}
+        source_snapshot = MappingProxyType(source_future.result())
+
+        output_dir_for_comparison = os.path.join(output_dir, comparison_type)
+        os.makedirs(output_dir_for_comparison, exist_ok=True)
+        self.save_schema(schema_to_json(source_snapshot),
+                         os.path.join(output_dir_for_comparison,
+                                      f'SourceSchema_{validator.source}_{comparison_type}.json'),
+                         f"SourceSchema_{validator.source}_{comparison_type}")
+
+        for target, future in target_futures.items():
+            try:
+                items_both, target_schema = future.result()
+            except Exception as e:
+                logging.info(f"Error reflecting {comparison_type} of {target}: {e}")
+                self.failed.setdefault(comparison_type, {})[target] = str(e)
+                continue
+            self._compare_target(target, comparison_type, source_snapshot, items_both, target_schema, output_dir)
+
+    def drift_matrix(self):
+        """
+        The objects that differ in at least one target, with the number of differences per target.
+        :return: {comparison type: {object: {target: differences}}}, objects sorted by name.
+        """
+        return {comparison_type: {name: {target: drift[name][target] for target in self.targets
+                                         if target in drift[name]}
+                                  for name in sorted(drift)}
+                for comparison_type, drift in self.drift.items()}
+
+    def render_matrix(self):
+        # Markdown table of the drift matrix, one row per object and one column per target
+        report = f"# Drift Matrix\n\nSource: {self.validator.source}\n\n"
+        matrix = self.drift_matrix()
+        for comparison_type in list(matrix) + [name for name in self.failed if name not in matrix]:
+            drift = matrix.get(comparison_type, {})
+            report += f"## {comparison_type}\n\n"
+            for target, error in self.failed.get(comparison_type, {}).items():
+                report += f"**{target} not compared**: {error}\n\n"
+            report += "| Object | " + " | ".join(self.targets) + " | Targets |\n"
+            report += "|---|" + "---|" * len(self.targets) + "---|\n"
+            for name, counts in drift.items():
+                cells = [str(counts[target]) if target in counts else "" for target in self.targets]
+                report += f"| {name} | " + " | ".join(cells) + f" | {len(counts)}/{len(self.targets)} |\n"
+            report += "\n"
+        return report
+
+    def run(self, types, output_dir):
+        """
+        Compare the source with every target, writing a <target> folder per target (the usual comparison
+        type folders and reports), the SourceSchema files once, and the DriftMatrix.json/.md summary
+        (with the targets that failed to reflect, see failed).
+        :return: The ResultStore of each target.
+        """
+        # Targets and the source reflect in parallel, each on its own connection
+        with ThreadPoolExecutor(max_workers=self.workers + 1, thread_name_prefix='fanout') as executor:
+            for comparison_type in types:
+                if comparison_type in ('data', 'statistics'):
+                    logging.info(f"{comparison_type} is not part of a fan-out comparison, skipped")
+                    continue
+                self.compare_type(comparison_type, output_dir, executor)
+
+        for target, store in self.stores.items():
+            target_dir = os.path.join(output_dir, target)
+            os.makedirs(target_dir, exist_ok=True)
+            generate_documentation(store, target_dir, 'markdown')
+            generate_documentation(store, target_dir, 'html')
+        drift_matrix_file = os.path.join(output_dir, 'DriftMatrix.json')
+        with open(drift_matrix_file, 'w') as json_file:
+            json.dump({'DriftMatrix': self.drift_matrix(), 'FailedTargets': self.failed}, json_file, indent=4)
+        logging.info(f"DriftMatrix saved to '{drift_matrix_file}'.")
+        with open(os.path.join(output_dir, 'DriftMatrix.md'), 'w') as file:
+            file.write(self.render_matrix())
+        for target, store in self.stores.items():
+            failed_types = [comparison_type for comparison_type, failed in self.failed.items() if target in failed]
+            logging.info(f"{target}: {len(store)} differences"
+                         + (f", {', '.join(failed_types)} not compared" if failed_types else ""))
+        return self.stores
+
+    def close(self):
+        for session in self.sessions.values():
+            if session is not self.validator.source_session:
+                session.close()
+
+
+def run_fanout(validator, targets, workers=4):
+    """
+    Compare the [COMPARISON] compare types of the source with each target section.
+    :return: The ResultStore of each target, and {comparison type: {target: error}} for the targets not compared.
+    """
+    config = validator.config
+    types = [item.strip() for item in config['COMPARISON']['compare'].split(",")]
+    fanout = FanOut(validator, targets, workers, config.getint('PERFORMANCE', 'catalog_concurrency', fallback=0))
+    validator.progress = Progress.from_config(config, validator.output_dir_with_timestamp).start()
+    status = 'failed'
+    try:
+        stores = fanout.run(types, validator.output_dir_with_timestamp)
+        status = 'finished'
+        return stores, fanout.failed
+    finally:
+        validator.progress.stop(status)
+        fanout.close()
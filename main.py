@@ -37,9 +37,10 @@ def log_errors():
 
 try:
 
-    # Add the DB2 driver path
-    os.add_dll_directory(
-        'C:\\Users\\MITDeepanraj\\PycharmProjects\\schemaValidator\\.venv\\Lib\\site-packages\\clidriver\\bin')
+    # Add the DB2 driver path (Windows only), e.g. <venv>\\Lib\\site-packages\\clidriver\\bin
+    dll_directory = config.get('ENGINE', 'db2_dll_directory', fallback='')
+    if dll_directory and hasattr(os, 'add_dll_directory'):
+        os.add_dll_directory(dll_directory)
 
     # Read configuration file
 
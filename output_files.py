@@ -0,0 +1,70 @@
+import json
+import logging
+import os
+
+
+def save_schema_to_json(schema_data, output_file, schema_type):
+    with open(output_file, 'w') as json_file:
+        json.dump({schema_type: schema_data}, json_file, indent=4)
+    logging.info(f"{schema_type} schema saved to '{output_file}'.")
+
+
+def load_schema_json(input_file):
+    """
+    Read a file written by save_schema_to_json.
+    :return: The top level key (e.g. SourceSchema_SYSTEM_tables) and the schema data.
+    """
+    with open(input_file, 'r') as json_file:
+        data = json.load(json_file)
+    if len(data) == 1:
+        return next(iter(data.items()))
+    return os.path.splitext(os.path.basename(input_file))[0], data
+
+
+def object_label(object_type):
+    # Singular label of a comparison type for the report headers (tables -> table, data -> data)
+    return object_type[:-1] if object_type.endswith('s') else object_type
+
+
+def render_report(store, format):
+    """
+    Render the summary report of the schema comparison results.
+    :param store: The ResultStore holding the differences of every comparison type.
+    :param format: The format of the documentation ('markdown' or 'html').
+    """
+    report = ""
+    if format == "markdown":
+        report += "# Schema Comparison Report\n\n"
+        for (object_type, schema, item_name), records in store.group_by('key').items():
+            report += f"## {item_name} ({object_label(object_type)})\n"
+            for diff in store.messages(records):
+                report += f"- {diff}\n"
+            report += "\n"
+    elif format == "html":
+        report += "<html><body>"
+        report += "<h1>Schema Comparison Report</h1>"
+        for (object_type, schema, item_name), records in store.group_by('key').items():
+            report += f"<h2>{item_name} ({object_label(object_type)})</h2>"
+            report += "<ul>"
+            for diff in store.messages(records):
+                report += f"<li>{diff}</li>"
+            report += "</ul>"
+        report += "</body></html>"
+    return report
+
+
+def generate_documentation(store, output_dir, format):
+    """
+    Generate a summary report documenting the schema comparison results.
+    :param store: The ResultStore holding the differences of every comparison type.
+    :param output_dir: The directory to save the report.
+    :param format: The format of the documentation ('markdown' or 'html').
+    """
+    report = render_report(store, format)
+
+    # Save the report to a file
+    file_extension = "md" if format == "markdown" else "html"
+    report_file = os.path.join(output_dir, f"SchemaComparisonReport.{file_extension}")
+    with open(report_file, 'w') as file:
+        file.write(report)
+    logging.info(f"Schema comparison report saved to '{report_file}'.")
@@ -0,0 +1,157 @@
+import cProfile
+import contextlib
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+
+PROFILE_MODES = ('cprofile', 'sampling')
+
+# Where the time goes, by the file (or for built-ins the name) of each profiled function
+CATEGORIES = (
+    ('driver', ('cx_oracle', 'oracledb', 'ibm_db', 'sqlite3')),
+    ('sqlalchemy', ('sqlalchemy',)),
+    ('format', ('comparison.py', 'schema_model.py')),
+    ('json', (os.sep + 'json' + os.sep, '_json')),
+)
+
+
+def category_of(file_name, function_name=''):
+    location = f"{file_name}:{function_name}".lower()
+    for category, markers in CATEGORIES:
+        if any(marker in location for marker in markers):
+            return category
+    return 'other'
+
+
+class Profiler:
+    """
+    Profiles the stages of a run (listing, reflection per side, comparison, saving) separately.
+    In 'cprofile' mode each stage gets a .pstats file, and in both modes a sampling thread
+    records collapsed stacks (flamegraph.pl / speedscope input) per stage.
+    """
+
+    def __init__(self, output_dir, mode='cprofile', interval_ms=5):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Invalid profile mode: {mode}, expected one of {PROFILE_MODES}")
+        self.output_dir = output_dir
+        self.mode = mode
+        self.interval = interval_ms / 1000.0
+        self.stats = {}  # stage label -> pstats.Stats
+        self.stacks = {}  # stage label -> Counter of collapsed stacks
+        self.active = {}  # thread id -> stage label
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    @classmethod
+    def from_config(cls, config, output_dir):
+        """
+        The Profiler of the [PROFILE] section, or None when profiling is disabled.
+        """
+        mode = config.get('PROFILE', 'mode', fallback='')
+        if not mode or mode == 'no':
+            return None
+        return cls(os.path.join(output_dir, 'profile'), mode,
+                   config.getint('PROFILE', 'interval_ms', fallback=5))
+
+    @staticmethod
+    def label(comparison_type, stage, side='both'):
+        return f"{comparison_type}_{stage}_{side}"
+
+    @contextlib.contextmanager
+    def stage(self, comparison_type, stage, side='both'):
+        label = self.label(comparison_type, stage, side)
+        thread_id = threading.get_ident()
+        profile = None
+        if self.mode == 'cprofile':
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                # Python 3.12+ allows a single active profiler, e.g. with concurrent comparison types
+                logging.info(f"Not profiling {label} with cProfile: {e}")
+                profile = None
+        with self._lock:
+            self.active[thread_id] = label
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active.pop(thread_id, None)
+            if profile is not None:
+                profile.disable()
+                with self._lock:
+                    if label in self.stats:
+                        self.stats[label].add(profile)
+                    else:
+                        self.stats[label] = pstats.Stats(profile)
+
+    def _sample(self):
+        own_thread = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                active = dict(self.active)
+            frames = sys._current_frames()
+            for thread_id, label in active.items():
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(label)
+                with self._lock:
+                    self.stacks.setdefault(label, Counter())[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        """
+        Stop sampling and write the .pstats, .collapsed and summary files.
+        """
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        os.makedirs(self.output_dir, exist_ok=True)
+        summary = {}
+        for label, stats in self.stats.items():
+            stats.dump_stats(os.path.join(self.output_dir, f"{label}.pstats"))
+            categories = Counter()
+            for (file_name, _, function_name), (_, _, total_time, _, _) in stats.stats.items():
+                categories[category_of(file_name, function_name)] += total_time
+            summary[label] = {'seconds': round(stats.total_tt, 3),
+                              'categories': {category: round(seconds, 3)
+                                             for category, seconds in categories.most_common()}}
+        for label, stacks in self.stacks.items():
+            with open(os.path.join(self.output_dir, f"{label}.collapsed"), 'w') as collapsed_file:
+                for stack, count in stacks.most_common():
+                    collapsed_file.write(f"{stack} {count}\n")
+            stage_summary = summary.setdefault(label, {})
+            stage_summary['samples'] = sum(stacks.values())
+            # Without cProfile the wall time is estimated from the sample count
+            stage_summary.setdefault('seconds', round(stage_summary['samples'] * self.interval, 3))
+        with open(os.path.join(self.output_dir, 'summary.json'), 'w') as json_file:
+            json.dump(summary, json_file, indent=4)
+        for label, stage_summary in summary.items():
+            categories = ", ".join(f"{category} {seconds}s"
+                                   for category, seconds in stage_summary.get('categories', {}).items())
+            logging.info(f"Profile {label}: {stage_summary.get('seconds', '-')}s"
+                         + (f" ({categories})" if categories else "")
+                         + f", {stage_summary.get('samples', 0)} samples")
+        logging.info(f"Profiles saved to '{self.output_dir}'.")
+
+
+def profile_stage(profiler, comparison_type, stage, side='both'):
+    # A no-op context when profiling is disabled
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.stage(comparison_type, stage, side)
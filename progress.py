@@ -0,0 +1,140 @@
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+OBJECT_LOGGING_MODES = ('all', 'sample', 'debug')
+
+
+class Progress:
+    """
+    Objects completed per comparison type and side, throughput, ETA and the slowest objects.
+    A background thread logs a summary line and rewrites the progress file at a fixed interval,
+    instead of per object.
+    """
+
+    def __init__(self, progress_file=None, refresh_seconds=30, object_logging='all', sample_every=100, slowest=10):
+        """
+        :param progress_file: JSON file rewritten at every refresh, for schedulers to poll. None to disable.
+        :param object_logging: 'all' logs every object, 'sample' every sample_every-th, 'debug' at DEBUG level only.
+        """
+        if object_logging not in OBJECT_LOGGING_MODES:
+            raise ValueError(f"Invalid object_logging: {object_logging}, expected one of {OBJECT_LOGGING_MODES}")
+        self.progress_file = progress_file
+        self.refresh_seconds = refresh_seconds
+        self.object_logging = object_logging
+        self.sample_every = max(sample_every, 1)
+        self.slowest_count = slowest
+        self.started = time.time()
+        self.counts = {}  # (comparison type, side) -> [completed, total]
+        self.slowest = []  # heap of (seconds, comparison type, side, name)
+        self.status = 'running'
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, config, output_dir):
+        progress_file = config.get('PROGRESS', 'progress_file', fallback='progress.json')
+        return cls(progress_file=os.path.join(output_dir, progress_file) if progress_file else None,
+                   refresh_seconds=config.getint('PROGRESS', 'refresh_seconds', fallback=30),
+                   object_logging=config.get('PROGRESS', 'object_logging', fallback='all'),
+                   sample_every=config.getint('PROGRESS', 'sample_every', fallback=100),
+                   slowest=config.getint('PROGRESS', 'slowest_objects', fallback=10))
+
+    def add_total(self, comparison_type, side, count):
+        with self._lock:
+            self.counts.setdefault((comparison_type, side), [0, 0])[1] += count
+
+    def log_object(self, comparison_type, side, message):
+        # Per object log line, subject to the object_logging mode
+        if self.object_logging == 'all':
+            logging.info(message)
+        elif self.object_logging == 'debug':
+            logging.debug(message)
+        elif self.counts.get((comparison_type, side), [0])[0] % self.sample_every == 0:
+            logging.info(message)
+
+    def completed(self, comparison_type, side, item_name, seconds):
+        with self._lock:
+            self.counts.setdefault((comparison_type, side), [0, 0])[0] += 1
+            entry = (seconds, comparison_type, side, item_name)
+            if len(self.slowest) < self.slowest_count:
+                heapq.heappush(self.slowest, entry)
+            elif self.slowest and seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def snapshot(self):
+        with self._lock:
+            completed = sum(count[0] for count in self.counts.values())
+            total = sum(count[1] for count in self.counts.values())
+            elapsed = time.time() - self.started
+            rate = completed / elapsed if elapsed > 0 else 0.0
+            remaining = max(total - completed, 0)
+            types = {}
+            for (comparison_type, side), (side_completed, side_total) in self.counts.items():
+                types.setdefault(comparison_type, {})[side] = {'completed': side_completed, 'total': side_total}
+            return {
+                'status': self.status,
+                'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'updated': datetime.now().isoformat(timespec='seconds'),
+                'elapsed_seconds': round(elapsed, 1),
+                'completed': completed,
+                'total': total,
+                'percent': round(100.0 * completed / total, 1) if total else 0.0,
+                'objects_per_second': round(rate, 2),
+                'eta_seconds': round(remaining / rate, 1) if rate and self.status == 'running' else None,
+                'types': types,
+                'slowest': [{'type': comparison_type, 'side': side, 'name': name, 'seconds': round(seconds, 3)}
+                            for seconds, comparison_type, side, name in sorted(self.slowest, reverse=True)]
+            }
+
+    def report(self):
+        snapshot = self.snapshot()
+        eta = snapshot['eta_seconds']
+        eta_text = time.strftime('%H:%M:%S', time.gmtime(eta)) if eta is not None else '-'
+        per_type = " | ".join(
+            f"{comparison_type} " + " ".join(f"{side} {counts['completed']}/{counts['total']}"
+                                             for side, counts in sides.items())
+            for comparison_type, sides in snapshot['types'].items())
+        logging.info(f"Progress: {snapshot['completed']}/{snapshot['total']} objects ({snapshot['percent']}%), "
+                     f"{snapshot['objects_per_second']} objects/s, ETA {eta_text}"
+                     + (f" | {per_type}" if per_type else ""))
+        if snapshot['slowest']:
+            slowest = snapshot['slowest'][0]
+            logging.info(f"Slowest so far: {slowest['type']} {slowest['name']} ({slowest['side']}) "
+                         f"{slowest['seconds']}s")
+        self.write(snapshot)
+
+    def write(self, snapshot=None):
+        if not self.progress_file:
+            return
+        snapshot = snapshot or self.snapshot()
+        try:
+            # Replaced atomically, so a poller never reads a partial file
+            with open(self.progress_file + '.tmp', 'w') as json_file:
+                json.dump(snapshot, json_file, indent=4)
+            os.replace(self.progress_file + '.tmp', self.progress_file)
+        except OSError as e:
+            logging.info(f"Error writing progress file {self.progress_file}: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_seconds):
+            self.report()
+
+    def start(self):
+        self.write()
+        if self.refresh_seconds > 0:
+            self._thread = threading.Thread(target=self._run, name='progress', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, status='finished'):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.status = status
+        self.report()
@@ -0,0 +1,216 @@
+from collections import defaultdict
+from sys import intern
+
+from schema_model import PRIMARY_KEY, FOREIGN_KEYS, UNIQUE_CONSTRAINTS, CHECK_CONSTRAINTS
+
+# Difference kinds
+MISSING_IN_TARGET = 'missing_in_target'
+MISSING_IN_SOURCE = 'missing_in_source'
+COLUMN_MISSING = 'column_missing'
+COLUMN_MISMATCH = 'column_mismatch'
+DEFINITION_MISMATCH = 'definition_mismatch'
+# Data validation (row counts and checksums of table contents)
+ROW_COUNT_MISMATCH = 'row_count_mismatch'
+CHECKSUM_MISMATCH = 'checksum_mismatch'
+ROW_MISMATCH = 'row_mismatch'
+# Optimizer statistics and physical storage of tables and indexes
+STATISTICS_MISSING = 'statistics_missing'
+STATISTICS_STALE = 'statistics_stale'
+ROW_ESTIMATE_MISMATCH = 'row_estimate_mismatch'
+STORAGE_MISMATCH = 'storage_mismatch'
+# A difference read back from a SchemaDifferences file, where only the message is known
+MESSAGE = 'message'
+
+KINDS = (MISSING_IN_TARGET, MISSING_IN_SOURCE, COLUMN_MISSING, COLUMN_MISMATCH, DEFINITION_MISMATCH,
+         PRIMARY_KEY, FOREIGN_KEYS, UNIQUE_CONSTRAINTS, CHECK_CONSTRAINTS, ROW_COUNT_MISMATCH, CHECKSUM_MISMATCH,
+         ROW_MISMATCH, STATISTICS_MISSING, STATISTICS_STALE, ROW_ESTIMATE_MISMATCH, STORAGE_MISMATCH, MESSAGE)
+
+
+class Difference:
+    """
+    A single difference found between the source and the target schema.
+    The report message is rendered on demand instead of being stored.
+    """
+    __slots__ = ('object_type', 'schema', 'name', 'kind', 'column', 'source_value', 'target_value')
+
+    def __init__(self, object_type, schema, name, kind, column=None, source_value=None, target_value=None):
+        self.object_type = object_type
+        self.schema = schema
+        self.name = name
+        self.kind = kind
+        self.column = column
+        self.source_value = source_value
+        self.target_value = target_value
+
+    @property
+    def key(self):
+        return self.object_type, self.schema, self.name
+
+    def message(self, source, target):
+        if self.kind == MESSAGE:
+            return self.source_value
+        if self.kind == MISSING_IN_TARGET:
+            return f"Missing in {target} (target) schema"
+        if self.kind == MISSING_IN_SOURCE:
+            return f"Missing in {source} (source) schema"
+        if self.kind == COLUMN_MISSING:
+            return f"Column '{self.column}' missing in target schema"
+        if self.kind == COLUMN_MISMATCH:
+            return (f"Column '{self.column}' mismatch: {render_value(self.source_value)} "
+                    f"!= {render_value(self.target_value)}")
+        if self.kind == ROW_COUNT_MISMATCH:
+            return (f"Row count mismatch: {source} (source) has {self.source_value} rows "
+                    f"but {target} (target) has {self.target_value} rows")
+        if self.kind == CHECKSUM_MISMATCH:
+            rows = (f"{self.source_value} rows on both sides" if self.source_value == self.target_value
+                    else f"{self.source_value} source rows, {self.target_value} target rows")
+            return f"Checksum mismatch in {self.column or 'all rows'} ({rows})"
+        if self.kind == ROW_MISMATCH:
+            if self.target_value is None:
+                return f"Row {self.column} missing in {target} (target)"
+            if self.source_value is None:
+                return f"Row {self.column} missing in {source} (source)"
+            return f"Row {self.column} mismatch: {self.source_value} != {self.target_value}"
+        if self.kind in (STATISTICS_MISSING, STATISTICS_STALE):
+            # The value of a side is None when its statistics are fine
+            on = f" on {self.column}" if self.column else ""
+            sides = [f"{name} ({label}) {value}" for name, label, value in
+                     ((source, 'source', self.source_value), (target, 'target', self.target_value))
+                     if value is not None]
+            if self.kind == STATISTICS_MISSING:
+                return f"Optimizer statistics missing{on}: " + "; ".join(sides)
+            return f"Stale optimizer statistics{on}: " + "; ".join(sides)
+        if self.kind == ROW_ESTIMATE_MISMATCH:
+            return (f"Optimizer row estimate mismatch: {source} (source) statistics count {self.source_value} rows "
+                    f"but {target} (target) statistics count {self.target_value} rows")
+        if self.kind == STORAGE_MISMATCH:
+            return (f"Storage mismatch in {self.column}: {source} (source) has {self.source_value} "
+                    f"but {target} (target) has {self.target_value}")
+
+        mismatch = (f"Mismatch: {source} (source) has {render_value(self.source_value)} "
+                    f"but {target} (target) has {render_value(self.target_value)}")
+        if self.kind == UNIQUE_CONSTRAINTS:
+            return f"Unique constraints mismatch: {mismatch}"
+        if self.kind == CHECK_CONSTRAINTS:
+            return f"Check constraints mismatch: {mismatch}"
+        if self.kind == DEFINITION_MISMATCH:
+            return f"View definition mismatch: {mismatch}"
+        return mismatch
+
+    def __repr__(self):
+        return f"Difference({self.object_type!r}, {self.schema!r}, {self.name!r}, {self.kind!r}, {self.column!r})"
+
+
+class ResultStore:
+    """
+    Run-wide store of schema differences keyed by (type, schema, name), so that
+    objects of different types sharing a name no longer overwrite each other.
+    """
+
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        self._records = []
+        self._index = {}
+
+    def add(self, object_type, schema, name, kind, column=None, source_value=None, target_value=None):
+        # Interning keeps one copy of the repeated type/schema/name/column strings
+        object_type = _intern(object_type)
+        schema = _intern(schema)
+        name = _intern(name)
+        column = _intern(column)
+        record = Difference(object_type, schema, name, kind, column, source_value, target_value)
+        self._index.setdefault(record.key, []).append(len(self._records))
+        self._records.append(record)
+        return record
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __bool__(self):
+        return bool(self._records)
+
+    def extend(self, records):
+        """
+        Append the records of another store (e.g. of one comparison type) in their order.
+        """
+        for record in records:
+            self.add(record.object_type, record.schema, record.name, record.kind, record.column,
+                     record.source_value, record.target_value)
+
+    def add_messages(self, object_type, schema, differences):
+        """
+        Load differences in the name -> [messages] form of a SchemaDifferences_<type>.json file.
+        """
+        for name, messages in differences.items():
+            for message in messages:
+                self.add(object_type, schema, name, MESSAGE, source_value=message)
+
+    def keys(self):
+        return list(self._index)
+
+    def get(self, object_type, schema, name):
+        return [self._records[i] for i in self._index.get((object_type, schema, name), [])]
+
+    def filter(self, object_type=None, kind=None, name=None, schema=None):
+        for record in self._records:
+            if object_type is not None and record.object_type != object_type:
+                continue
+            if kind is not None and record.kind != kind:
+                continue
+            if name is not None and record.name != name:
+                continue
+            if schema is not None and record.schema != schema:
+                continue
+            yield record
+
+    def count(self, object_type=None, kind=None, name=None, schema=None):
+        return sum(1 for _ in self.filter(object_type, kind, name, schema))
+
+    def group_by(self, field, **filters):
+        """
+        Group records by one of 'object_type', 'schema', 'name' (table) or 'kind'.
+        :param field: The record attribute to group by.
+        :param filters: Optional object_type/kind/name/schema filters applied first.
+        """
+        if field == 'table':
+            field = 'name'
+        groups = defaultdict(list)
+        for record in self.filter(**filters):
+            groups[getattr(record, field)].append(record)
+        return dict(groups)
+
+    def object_types(self):
+        return list(dict.fromkeys(key[0] for key in self._index))
+
+    def messages(self, records):
+        return [record.message(self.source, self.target) for record in records]
+
+    def differences_for(self, object_type):
+        """
+        Differences of one comparison type in the name -> [messages] form
+        written to SchemaDifferences_<type>.json.
+        """
+        differences = {}
+        for (key_type, schema, name), positions in self._index.items():
+            if key_type == object_type:
+                differences[name] = self.messages(self._records[i] for i in positions)
+        return differences
+
+    def summary(self):
+        counts = defaultdict(lambda: defaultdict(int))
+        for record in self._records:
+            counts[record.object_type][record.kind] += 1
+        return {object_type: dict(kinds) for object_type, kinds in counts.items()}
+
+
+def render_value(value):
+    # Schema model objects are shown in their JSON form
+    return value.to_json() if hasattr(value, 'to_json') else value
+
+
+def _intern(value):
+    return intern(value) if isinstance(value, str) else value
@@ -0,0 +1,136 @@
+import logging
+import math
+import random
+from statistics import NormalDist
+
+STRATIFY_MODES = ('none', 'prefix')
+
+
+class Sampler:
+    """
+    Picks a random sample of the objects found on both sides, stratified by name prefix, and
+    estimates the share of drifted objects (objects with at least one difference) from it.
+    """
+
+    def __init__(self, sample_size=400, fraction=0.0, stratify='prefix', prefix_separator='_', confidence=0.95,
+                 escalate_above=0.05, seed=None):
+        """
+        :param sample_size: Objects sampled per comparison type, unless fraction is set.
+        :param fraction: Share of the objects sampled per comparison type, 0 to use sample_size.
+        :param escalate_above: Estimated drift rate above which the comparison type is compared in full.
+        :param seed: Random seed, for repeatable samples.
+        """
+        if stratify not in STRATIFY_MODES:
+            raise ValueError(f"Invalid stratify mode: {stratify}, expected one of {STRATIFY_MODES}")
+        self.sample_size = sample_size
+        self.fraction = fraction
+        self.stratify = stratify
+        self.prefix_separator = prefix_separator
+        self.confidence = confidence
+        self.escalate_above = escalate_above
+        self.random = random.Random(seed)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        The Sampler of the [SAMPLING] section, or None when sampling is disabled.
+        """
+        if not config.getboolean('SAMPLING', 'enabled', fallback=False):
+            return None
+        seed = config.get('SAMPLING', 'seed', fallback='')
+        return cls(sample_size=config.getint('SAMPLING', 'sample_size', fallback=400),
+                   fraction=config.getfloat('SAMPLING', 'fraction', fallback=0.0),
+                   stratify=config.get('SAMPLING', 'stratify', fallback='prefix'),
+                   prefix_separator=config.get('SAMPLING', 'prefix_separator', fallback='_'),
+                   confidence=config.getfloat('SAMPLING', 'confidence', fallback=0.95),
+                   escalate_above=config.getfloat('SAMPLING', 'escalate_above', fallback=0.05),
+                   seed=int(seed) if seed else None)
+
+    def stratum(self, name):
+        if self.stratify == 'prefix' and self.prefix_separator in name:
+            return name.split(self.prefix_separator, 1)[0].upper()
+        return ''
+
+    def strata(self, names):
+        strata = {}
+        for name in names:
+            strata.setdefault(self.stratum(name), []).append(name)
+        return strata
+
+    def sample(self, names):
+        """
+        A sample of the names with proportional allocation to the strata, at least one name per stratum.
+        The sample has the configured size, or one name per stratum when there are more strata than that.
+        :return: The sampled names in their listed order, or all of them when the sample would not be smaller.
+        """
+        size = math.ceil(self.fraction * len(names)) if self.fraction > 0 else self.sample_size
+        if size >= len(names):
+            return list(names)
+        strata = self.strata(names)
+        counts = {stratum: min(max(round(size * len(stratum_names) / len(names)), 1), len(stratum_names))
+                  for stratum, stratum_names in strata.items()}
+        # Rounding up and the one name minimum can exceed the size: take the excess from the largest allocations
+        limit = max(size, len(strata))
+        excess = sum(counts.values()) - limit
+        while excess > 0:
+            largest = max(counts, key=counts.get)
+            counts[largest] -= 1
+            excess -= 1
+        if len(strata) > size:
+            logging.info(f"Sampling one of each of {len(strata)} name prefixes, more than the sample size {size}")
+        sampled = set()
+        for stratum, stratum_names in strata.items():
+            sampled.update(self.random.sample(stratum_names, counts[stratum]))
+        return [name for name in names if name in sampled]
+
+    def estimate(self, names, sample, drifted):
+        """
+        The stratified estimate of the drift rate of the names from the drifted names of the sample,
+        with a Wilson score interval on the effective sample size (finite population corrected).
+        :return: The sampling report of a comparison type.
+        """
+        population = len(names)
+        z = NormalDist().inv_cdf(0.5 + self.confidence / 2)
+        sampled_strata = self.strata(sample)
+        rate = 0.0
+        variance = 0.0
+        strata = {}
+        for stratum, stratum_names in self.strata(names).items():
+            stratum_sample = sampled_strata.get(stratum, [])
+            stratum_drifted = sum(1 for name in stratum_sample if name in drifted)
+            weight = len(stratum_names) / population
+            if stratum_sample:
+                stratum_rate = stratum_drifted / len(stratum_sample)
+                rate += weight * stratum_rate
+                correction = 1 - len(stratum_sample) / len(stratum_names)
+                variance += weight ** 2 * stratum_rate * (1 - stratum_rate) / len(stratum_sample) * correction
+            strata[stratum or '-'] = {'objects': len(stratum_names), 'sampled': len(stratum_sample),
+                                      'drifted': stratum_drifted}
+
+        if len(sample) >= population:
+            low = high = rate
+        else:
+            effective = rate * (1 - rate) / variance if variance > 0 else len(sample)
+            denominator = 1 + z ** 2 / effective
+            center = (rate + z ** 2 / (2 * effective)) / denominator
+            margin = z * math.sqrt(rate * (1 - rate) / effective + z ** 2 / (4 * effective ** 2)) / denominator
+            low, high = max(center - margin, 0.0), min(center + margin, 1.0)
+        return {
+            'objects': population,
+            'sampled': len(sample),
+            'drifted': len(drifted),
+            'drift_rate': round(rate, 4),
+            'confidence': self.confidence,
+            'interval': [round(low, 4), round(high, 4)],
+            'estimated_drifted_objects': round(rate * population),
+            'escalate_above': self.escalate_above,
+            'escalated': rate > self.escalate_above and len(sample) < population,
+            'strata': strata
+        }
+
+
+def log_estimate(comparison_type, report):
+    logging.info(f"Sampled {report['sampled']} of {report['objects']} {comparison_type} on both sides: "
+                 f"{report['drifted']} drifted, estimated drift rate {report['drift_rate']:.1%} "
+                 f"({report['confidence']:.0%} interval {report['interval'][0]:.1%} - {report['interval'][1]:.1%}), "
+                 f"about {report['estimated_drifted_objects']} drifted objects")
@@ -0,0 +1,135 @@
+import fnmatch
+import logging
+import threading
+
+
+def read_patterns(value):
+    # Comma or newline separated patterns of a config option
+    return [item.strip() for item in value.replace('\n', ',').split(',') if item.strip()]
+
+
+class Priority:
+    """
+    The order in which objects are reflected: by descending weight of the first matching name
+    pattern (case insensitive fnmatch patterns), then in the listed order.
+    """
+
+    def __init__(self, weights):
+        """
+        :param weights: [(pattern, weight)], objects matching no pattern have weight 0.
+        """
+        self.weights = [(pattern.upper(), weight) for pattern, weight in weights]
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        The Priority of the [PRIORITY] section, or None when no priorities are configured. The priority
+        file lists names or patterns one per line, highest first: the lines of a file of N lines weigh N to 1,
+        and are matched before the weighted patterns.
+        """
+        weights = []
+        priority_file = config.get('PRIORITY', 'priority_file', fallback='')
+        if priority_file:
+            with open(priority_file, 'r') as file:
+                lines = [line.strip() for line in file if line.strip() and not line.startswith('#')]
+            weights.extend((pattern, len(lines) - position) for position, pattern in enumerate(lines))
+        for item in read_patterns(config.get('PRIORITY', 'patterns', fallback='')):
+            pattern, separator, weight = item.rpartition(':')
+            if not separator:
+                # A pattern without a weight weighs 1
+                pattern, weight = item, '1'
+            try:
+                weights.append((pattern, float(weight)))
+            except ValueError:
+                raise ValueError(f"Invalid [PRIORITY] patterns item: {item}, expected pattern:weight") from None
+        return cls(weights) if weights else None
+
+    def weight(self, name):
+        upper_name = name.upper()
+        return next((weight for pattern, weight in self.weights if fnmatch.fnmatchcase(upper_name, pattern)), 0)
+
+    def order(self, names):
+        return sorted(names, key=lambda name: -self.weight(name))
+
+
+class FailFast:
+    """
+    Stops the run once max_differences differences are found or a critical object differs, for CI
+    gates. Objects are compared in batches as they are reflected; stopping is shared by all the
+    comparison types running in the process.
+    """
+
+    def __init__(self, max_differences=1, critical=(), batch_size=50):
+        """
+        :param max_differences: Number of differences that stops the run, 0 for no limit.
+        :param critical: Name patterns of the objects whose first difference stops the run.
+        """
+        self.max_differences = max_differences
+        self.critical = [pattern.upper() for pattern in critical]
+        self.batch_size = max(batch_size, 1)
+        self.differences = 0
+        self.reason = None
+        self.skipped = {}  # comparison type -> objects not compared, or 'all'
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        The FailFast of the [FAIL_FAST] section, or None when disabled.
+        """
+        if not config.getboolean('FAIL_FAST', 'enabled', fallback=False):
+            return None
+        return cls(max_differences=config.getint('FAIL_FAST', 'max_differences', fallback=1),
+                   critical=read_patterns(config.get('FAIL_FAST', 'critical', fallback='')),
+                   batch_size=config.getint('FAIL_FAST', 'batch_size', fallback=50))
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def is_critical(self, name):
+        upper_name = name.upper()
+        return any(fnmatch.fnmatchcase(upper_name, pattern) for pattern in self.critical)
+
+    def batches(self, items_source, items_target):
+        """
+        Split the objects to reflect into batches of both sides, in the order of items_source
+        followed by the objects to reflect on the target side only.
+        """
+        target_names = set(items_target)
+        source_names = set(items_source)
+        names = list(dict.fromkeys(items_source + items_target))
+        return [([name for name in batch if name in source_names], [name for name in batch if name in target_names])
+                for batch in (names[start:start + self.batch_size]
+                              for start in range(0, len(names), self.batch_size))]
+
+    def record(self, comparison_type, differences):
+        """
+        Count the differences found and stop when a limit is reached.
+        :param differences: name -> number of differences of the objects compared.
+        :return: Whether the run is stopped.
+        """
+        with self._lock:
+            for name, count in differences.items():
+                if not count:
+                    continue
+                self.differences += count
+                if self.reason is None and self.critical and self.is_critical(name):
+                    self.reason = f"critical {comparison_type[:-1]} {name} differs"
+            if self.reason is None and self.max_differences and self.differences >= self.max_differences:
+                self.reason = f"{self.differences} differences found (limit {self.max_differences})"
+            if self.reason is not None and not self._stop.is_set():
+                logging.info(f"Fail fast: {self.reason}, stopping")
+                self._stop.set()
+        return self.stopped
+
+    def skip(self, comparison_type, count=None):
+        # Objects of a comparison type left out when stopping, None when the type was not started
+        with self._lock:
+            self.skipped[comparison_type] = 'all' if count is None else self.skipped.get(comparison_type, 0) + count
+
+    def report(self):
+        return {'stopped': self.stopped, 'reason': self.reason, 'differences': self.differences,
+                'max_differences': self.max_differences, 'critical': self.critical,
+                'not_compared': self.skipped}
@@ -0,0 +1,207 @@
+from collections import namedtuple
+from collections.abc import Mapping
+from sys import intern
+
+# Constraint kinds, named after the keys used in the JSON schema files
+PRIMARY_KEY = 'primary_key'
+FOREIGN_KEYS = 'foreign_keys'
+UNIQUE_CONSTRAINTS = 'unique_constraints'
+CHECK_CONSTRAINTS = 'check_constraints'
+
+CONSTRAINT_KINDS = (PRIMARY_KEY, FOREIGN_KEYS, UNIQUE_CONSTRAINTS, CHECK_CONSTRAINTS)
+
+# The SQL of a view, kept next to its columns under a key no (normalized) column name takes.
+# Snapshots saved before used "definition", read as the definition when its value is not a column.
+VIEW_DEFINITION = '$definition'
+LEGACY_VIEW_DEFINITION = 'definition'
+
+
+class _Missing:
+    # Marks a column attribute that is absent from the JSON, as opposed to present with a null value
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'MISSING'
+
+    def __reduce__(self):
+        return 'MISSING'
+
+
+MISSING = _Missing()
+
+_COLUMN_FIELDS = ('datatype', 'length', 'precision', 'scale', 'default', 'is_nullable')
+
+
+def _intern(value):
+    return intern(value) if isinstance(value, str) else value
+
+
+class Column(namedtuple('Column', ('name',) + _COLUMN_FIELDS + ('extra',))):
+    """
+    A table or view column. Attributes absent from the JSON are MISSING so
+    that to_json() gives back exactly the dictionary from_json() was given.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_json(cls, name, data):
+        values = [_intern(data.get(field, MISSING)) for field in _COLUMN_FIELDS]
+        extra = {key: value for key, value in data.items() if key not in _COLUMN_FIELDS} or None
+        return cls(_intern(name), *values, extra)
+
+    def to_json(self):
+        data = {}
+        for field, value in zip(_COLUMN_FIELDS, self[1:-1]):
+            if value is not MISSING:
+                data[field] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+class Constraint(namedtuple('Constraint', 'kind columns referenced_table referenced_columns definition')):
+    """
+    A primary key, foreign key, unique or check constraint of a table.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_json(cls, kind, data):
+        if kind == PRIMARY_KEY or kind == UNIQUE_CONSTRAINTS:
+            return cls(kind, tuple(_intern(column) for column in data), None, None, None)
+        if kind == FOREIGN_KEYS:
+            return cls(kind, tuple(_intern(column) for column in data.get('column', [])),
+                       _intern(data.get('referenced_table')),
+                       tuple(_intern(column) for column in data.get('referenced_columns', [])), None)
+        return cls(kind, (), None, None, data)
+
+    def to_json(self):
+        if self.kind == PRIMARY_KEY or self.kind == UNIQUE_CONSTRAINTS:
+            return list(self.columns)
+        if self.kind == FOREIGN_KEYS:
+            return {
+                'column': list(self.columns),
+                'referenced_table': self.referenced_table,
+                'referenced_columns': list(self.referenced_columns)
+            }
+        return self.definition
+
+
+class Table:
+    """
+    A table or view: its columns by name, its constraints by kind and the SQL of a view.
+    """
+    __slots__ = ('name', 'columns', 'constraints', 'extra', 'definition')
+
+    def __init__(self, name, columns=None, constraints=None, extra=None, definition=None):
+        self.name = _intern(name)
+        self.columns = columns if columns is not None else {}
+        self.constraints = constraints if constraints is not None else {}
+        self.extra = extra
+        self.definition = definition
+
+    @classmethod
+    def from_json(cls, name, data):
+        columns = {}
+        constraints = {}
+        extra = None
+        definition = None
+        for key, value in data.items():
+            if key in (VIEW_DEFINITION, LEGACY_VIEW_DEFINITION) and not isinstance(value, dict):
+                definition = value
+            elif key == PRIMARY_KEY:
+                constraints[key] = (Constraint.from_json(key, value),) if value else ()
+            elif key in CONSTRAINT_KINDS:
+                constraints[key] = tuple(Constraint.from_json(key, item) for item in value)
+            elif isinstance(value, dict):
+                column = Column.from_json(key, value)
+                columns[column.name] = column
+            else:
+                extra = extra or {}
+                extra[key] = value
+        return cls(name, columns, constraints, extra, definition)
+
+    def constraint_json(self, kind):
+        constraints = self.constraints.get(kind, ())
+        if kind == PRIMARY_KEY:
+            return constraints[0].to_json() if constraints else []
+        return [constraint.to_json() for constraint in constraints]
+
+    def to_json(self):
+        data = {name: column.to_json() for name, column in self.columns.items()}
+        for kind in self.constraints:
+            data[kind] = self.constraint_json(kind)
+        if self.extra:
+            data.update(self.extra)
+        if self.definition is not None:
+            data[VIEW_DEFINITION] = self.definition
+        return data
+
+    def __eq__(self, other):
+        # An empty constraint list and an absent one compare equal, as in compare_schemas
+        return (isinstance(other, Table) and self.columns == other.columns and self.extra == other.extra
+                and self.definition == other.definition
+                and all(self.constraints.get(kind, ()) == other.constraints.get(kind, ())
+                        for kind in CONSTRAINT_KINDS))
+
+    def __repr__(self):
+        return f"Table({self.name!r}, {len(self.columns)} columns)"
+
+
+class Routine:
+    """
+    A function, stored procedure or trigger with its DDL definition.
+    """
+    __slots__ = ('name', 'definition')
+
+    def __init__(self, name, definition):
+        self.name = _intern(name)
+        self.definition = definition
+
+    @classmethod
+    def from_json(cls, name, data):
+        # Routines are saved as {routine_name: {"definition": ddl}}
+        routine_name, routine_data = next(iter(data.items()))
+        return cls(routine_name, routine_data.get('definition'))
+
+    def to_json(self):
+        return {self.name: {'definition': self.definition}}
+
+    def __eq__(self, other):
+        return isinstance(other, Routine) and self.definition == other.definition
+
+    def __repr__(self):
+        return f"Routine({self.name!r})"
+
+
+def is_routine_json(data):
+    return bool(data) and all(isinstance(value, dict) and 'definition' in value for value in data.values())
+
+
+def object_from_json(name, data):
+    if isinstance(data, (Table, Routine)):
+        return data
+    if is_routine_json(data):
+        return Routine.from_json(name, data)
+    return Table.from_json(name, data)
+
+
+class LazySchema(Mapping):
+    """
+    A read only {name: model object} mapping that loads its objects on access (see snapshot_index.py).
+    """
+
+
+def schema_from_json(schema):
+    """
+    Convert a {name: json} schema, as saved in SourceSchema_*/TargetSchema_* files, to model objects.
+    A LazySchema is used as it is, so only the objects compared are loaded.
+    """
+    if isinstance(schema, LazySchema):
+        return schema
+    return {name: object_from_json(name, data) for name, data in schema.items()}
+
+
+def schema_to_json(schema):
+    return {name: item.to_json() if isinstance(item, (Table, Routine)) else item
+            for name, item in schema.items()}
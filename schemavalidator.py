@@ -0,0 +1,367 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from configparser import ConfigParser
+from datetime import datetime
+
+# Only standard library and pure Python modules are imported here. SQLAlchemy, the database
+# drivers and cpdSchemaValidator (which imports them) are imported by the subcommands that
+# connect to a database, so offline subcommands start quickly.
+from columnar import save_parquet
+from comparison import format_and_compare
+from output_files import generate_documentation, load_schema_json, save_schema_to_json
+from profiler import PROFILE_MODES
+from result_store import ResultStore
+from schema_model import schema_to_json
+from snapshot_index import open_snapshot, schema_subset
+from snapshot_registry import SnapshotRegistry
+
+COMPARISON_TYPES = ('tables', 'views', 'functions', 'stored_procedures', 'data', 'statistics')
+
+
+def configure_validator(args):
+    import cpdSchemaValidator
+
+    cpdSchemaValidator.setup(args.config, args.source, args.target, args.output)
+    if args.types:
+        cpdSchemaValidator.config['COMPARISON']['compare'] = args.types
+    if getattr(args, 'baseline', None):
+        if not cpdSchemaValidator.config.has_section('REGISTRY'):
+            cpdSchemaValidator.config.add_section('REGISTRY')
+        cpdSchemaValidator.config['REGISTRY']['enabled'] = 'yes'
+        cpdSchemaValidator.config['REGISTRY']['baseline'] = args.baseline
+    if getattr(args, 'sample', None):
+        if not cpdSchemaValidator.config.has_section('SAMPLING'):
+            cpdSchemaValidator.config.add_section('SAMPLING')
+        cpdSchemaValidator.config['SAMPLING']['enabled'] = 'yes'
+        cpdSchemaValidator.config['SAMPLING']['sample_size'] = str(args.sample)
+    if getattr(args, 'fail_fast', None) is not None:
+        if not cpdSchemaValidator.config.has_section('FAIL_FAST'):
+            cpdSchemaValidator.config.add_section('FAIL_FAST')
+        cpdSchemaValidator.config['FAIL_FAST']['enabled'] = 'yes'
+        cpdSchemaValidator.config['FAIL_FAST']['max_differences'] = str(args.fail_fast)
+    if getattr(args, 'profile', None):
+        if not cpdSchemaValidator.config.has_section('PROFILE'):
+            cpdSchemaValidator.config.add_section('PROFILE')
+        cpdSchemaValidator.config['PROFILE']['mode'] = args.profile
+    return cpdSchemaValidator
+
+
+def run_validator(args, reflect_only):
+    validator = configure_validator(args)
+    start_time = time.time()
+    validator.main(reflect_only=reflect_only)
+    validator.log_errors()
+    logging.info(f"Time taken: {time.time() - start_time:.2f} seconds")
+    # Non-zero when fail fast stopped the run, for CI gates
+    return 1 if validator.fail_fast is not None and validator.fail_fast.stopped else 0
+
+
+def command_compare(args):
+    return run_validator(args, reflect_only=False)
+
+
+def command_reflect(args):
+    return run_validator(args, reflect_only=True)
+
+
+def command_coordinate(args):
+    import distributed
+
+    validator = configure_validator(args)
+    start_time = time.time()
+    try:
+        store = distributed.run_coordinator(
+            validator, args.config,
+            local_workers=args.workers if args.workers is not None else
+            validator.config.getint('DISTRIBUTED', 'local_workers', fallback=2),
+            shard_size=args.shard_size or validator.config.getint('DISTRIBUTED', 'shard_size', fallback=500),
+            lease_seconds=validator.config.getint('DISTRIBUTED', 'lease_seconds', fallback=300),
+            max_attempts=validator.config.getint('DISTRIBUTED', 'max_attempts', fallback=3),
+            max_restarts=validator.config.getint('DISTRIBUTED', 'max_restarts', fallback=3))
+    finally:
+        validator.source_session.close()
+        validator.target_session.close()
+    validator.log_errors()
+    logging.info(f"Time taken: {time.time() - start_time:.2f} seconds")
+    return 0 if store is not None else 1
+
+
+def command_fanout(args):
+    import fanout
+
+    config = ConfigParser()
+    config.read(args.config)
+    targets = [item.strip() for item in (args.targets or config.get('FANOUT', 'targets', fallback='')).split(',')
+               if item.strip()]
+    if not targets:
+        logging.info("No targets: use --targets or [FANOUT] targets")
+        return 2
+    # The first target is connected by the validator setup, the others by the fan-out
+    args.target = targets[0]
+    validator = configure_validator(args)
+    start_time = time.time()
+    try:
+        stores, failed = fanout.run_fanout(validator, targets,
+                                           args.workers or validator.config.getint('FANOUT', 'workers', fallback=4))
+    finally:
+        validator.source_session.close()
+        validator.target_session.close()
+    validator.log_errors()
+    logging.info(f"Time taken: {time.time() - start_time:.2f} seconds")
+    if failed:
+        # A target that was not compared would otherwise look clean
+        return 1
+    return 1 if args.fail_on_differences and any(stores.values()) else 0
+
+
+def command_work(args):
+    import distributed
+
+    distributed.run_worker(args.queue, args.config)
+    return 0
+
+
+def command_serve(args):
+    import daemon
+
+    validator = configure_validator(args)
+    config = validator.config
+    types = [item.strip() for item in config['COMPARISON']['compare'].split(',')
+             if item.strip() not in ('data', 'statistics')]
+    try:
+        daemon.run_daemon(validator, types,
+                          host=args.host or config.get('DAEMON', 'host', fallback='127.0.0.1'),
+                          port=args.port if args.port is not None else config.getint('DAEMON', 'port', fallback=8765),
+                          socket_path=args.socket or config.get('DAEMON', 'socket', fallback='') or None,
+                          poll_seconds=config.getint('DAEMON', 'poll_seconds', fallback=60),
+                          full_refresh_seconds=config.getint('DAEMON', 'full_refresh_seconds', fallback=3600))
+    finally:
+        validator.source_session.close()
+        validator.target_session.close()
+    return 0
+
+
+def command_report(args):
+    # Re-render the reports of a previous run from its SchemaDifferences_<type>.json files
+    store = ResultStore(args.source or 'source', args.target or 'target')
+    types = args.types.split(',') if args.types else COMPARISON_TYPES
+    for comparison_type in (item.strip() for item in types):
+        for differences_file in sorted(glob.glob(os.path.join(args.run_dir, comparison_type,
+                                                              'SchemaDifferences_*.json'))):
+            _, differences = load_schema_json(differences_file)
+            store.add_messages(comparison_type, None, differences)
+    generate_documentation(store, args.run_dir, 'markdown')
+    generate_documentation(store, args.run_dir, 'html')
+    return 0
+
+
+def command_diff_files(args):
+    # Compare two saved SourceSchema/TargetSchema files without connecting to any database
+    source_key, source_schema = open_snapshot(args.source_file)
+    target_key, target_schema = open_snapshot(args.target_file)
+    if args.names:
+        # Only the named objects, parsed alone from indexed files
+        names = [item.strip() for item in args.names.split(',')]
+        source_schema = schema_subset(source_schema, names)
+        target_schema = schema_subset(target_schema, names)
+    comparison_type = args.types or next((item for item in COMPARISON_TYPES if source_key.endswith(item)), 'tables')
+    source = args.source or source_key
+    target = args.target or target_key
+
+    output_dir = os.path.join(args.output, f"SchemaValidator_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    output_dir_for_comparison = os.path.join(output_dir, comparison_type)
+    os.makedirs(output_dir_for_comparison, exist_ok=True)
+
+    store = ResultStore(source, target)
+    _, _, differences = format_and_compare(source_schema, target_schema, store, comparison_type, source, target,
+                                           workers=args.workers, format_raw=False)
+    save_schema_to_json(differences, os.path.join(output_dir_for_comparison,
+                                                  f'SchemaDifferences_{comparison_type}.json'), "SchemaDifferences")
+    generate_documentation(store, output_dir, 'markdown')
+    generate_documentation(store, output_dir, 'html')
+    logging.info(f"Total differences: {len(store)}")
+    return 1 if store and args.fail_on_differences else 0
+
+
+def command_show(args):
+    # Print saved objects of a schema file, parsed alone when the file is indexed
+    _, schema = open_snapshot(args.schema_file)
+    missing = [name for name in args.names if name not in schema]
+    for name in missing:
+        logging.info(f"{name} not found in '{args.schema_file}'")
+    objects = {name: schema_to_json({name: schema[name]})[name] for name in args.names if name in schema}
+    print(json.dumps(objects, indent=4))
+    return 1 if missing else 0
+
+
+def command_export_parquet(args):
+    # Write the column catalog of saved SourceSchema/TargetSchema files as Parquet, next to each file
+    exported = 0
+    for schema_file in args.schema_files:
+        _, schema = load_schema_json(schema_file)
+        exported += save_parquet(schema, os.path.splitext(schema_file)[0] + '.parquet')
+    return 0 if exported == len(args.schema_files) else 1
+
+
+def command_registry(args):
+    config = ConfigParser()
+    config.read(args.config)
+    registry = SnapshotRegistry(args.registry or config.get('REGISTRY', 'directory', fallback='registry'))
+
+    if args.action == 'list':
+        baselines = registry.baselines()
+        for manifest_id in registry.manifests():
+            manifest = registry.load_manifest(manifest_id)
+            names = [name for name, baseline_id in baselines.items() if baseline_id == manifest_id]
+            counts = ", ".join(f"{len(objects)} {comparison_type}"
+                               for comparison_type, objects in manifest['objects'].items())
+            logging.info(f"{manifest_id}: {manifest['schema_name']} {counts}"
+                         + (f" (baseline {', '.join(names)})" if names else ""))
+        return 0
+
+    if args.action == 'baseline':
+        if len(args.names) != 2:
+            logging.info("Usage: registry baseline NAME SNAPSHOT")
+            return 2
+        registry.set_baseline(args.names[0], args.names[1])
+        return 0
+
+    # diff: compare two stored snapshots, loading only the objects whose content differs
+    if len(args.names) != 2:
+        logging.info("Usage: registry diff OLD NEW")
+        return 2
+    old_manifest = registry.load_manifest(args.names[0])
+    new_manifest = registry.load_manifest(args.names[1])
+    types = ([item.strip() for item in args.types.split(',')] if args.types else
+             list(dict.fromkeys(list(old_manifest['objects']) + list(new_manifest['objects']))))
+
+    output_dir = os.path.join(args.output, f"SchemaValidator_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    store = ResultStore(args.source or old_manifest['section'], args.target or new_manifest['section'])
+    for comparison_type in types:
+        old_schema, new_schema, unchanged = registry.diff_inputs(old_manifest, new_manifest, comparison_type)
+        _, _, differences = format_and_compare(old_schema, new_schema, store, comparison_type,
+                                               old_manifest['schema_name'], new_manifest['schema_name'],
+                                               format_raw=False)
+        output_dir_for_comparison = os.path.join(output_dir, comparison_type)
+        os.makedirs(output_dir_for_comparison, exist_ok=True)
+        save_schema_to_json(differences, os.path.join(output_dir_for_comparison,
+                                                      f'SchemaDifferences_{comparison_type}.json'),
+                            "SchemaDifferences")
+        logging.info(f"{comparison_type}: {unchanged} unchanged objects skipped, "
+                     f"{store.count(object_type=comparison_type)} differences")
+    os.makedirs(output_dir, exist_ok=True)
+    generate_documentation(store, output_dir, 'markdown')
+    generate_documentation(store, output_dir, 'html')
+    return 1 if store and args.fail_on_differences else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='schemavalidator',
+                                     description='Compare database schemas between a source and a target.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_common(subparser):
+        subparser.add_argument('--config', default='config.ini', help='configuration file (default: config.ini)')
+        subparser.add_argument('--source', help='source config section, overrides [COMPARISON] SOURCE')
+        subparser.add_argument('--target', help='target config section, overrides [COMPARISON] TARGET')
+        subparser.add_argument('--types', help='comma separated object types, overrides [COMPARISON] compare')
+        subparser.add_argument('--output', default='output', help='output root directory (default: output)')
+
+    def add_profile(subparser):
+        subparser.add_argument('--profile', nargs='?', const='cprofile', choices=PROFILE_MODES,
+                               help='profile each stage into the profile folder of the run (default mode: cprofile)')
+
+    compare = subparsers.add_parser('compare', help='reflect both databases, compare and write the reports')
+    add_common(compare)
+    compare.add_argument('--baseline', help='compare the target with a baseline of the snapshot registry')
+    compare.add_argument('--fail-fast', type=int, nargs='?', const=1, metavar='N',
+                         help='stop and exit with status 1 once N differences (default 1) or a [FAIL_FAST] critical '
+                              'object difference are found, writing the partial results')
+    compare.add_argument('--sample', type=int, metavar='N',
+                         help='reflect a sample of N objects per type and estimate the drift rate (see [SAMPLING])')
+    add_profile(compare)
+    compare.set_defaults(func=command_compare)
+
+    reflect = subparsers.add_parser('reflect', help='reflect both databases and save the schema files only')
+    add_common(reflect)
+    add_profile(reflect)
+    reflect.set_defaults(func=command_reflect)
+
+    coordinate = subparsers.add_parser('coordinate', help='compare with reflection sharded across worker processes')
+    add_common(coordinate)
+    coordinate.add_argument('--workers', type=int,
+                            help='local worker processes, 0 to wait for remote workers (default: [DISTRIBUTED])')
+    coordinate.add_argument('--shard-size', type=int, help='objects per shard (default: [DISTRIBUTED])')
+    coordinate.set_defaults(func=command_coordinate)
+
+    fan_out = subparsers.add_parser('fanout', help='compare one source with many targets, reflecting the source once')
+    add_common(fan_out)
+    fan_out.add_argument('--targets', help='comma separated target config sections (default: [FANOUT] targets)')
+    fan_out.add_argument('--workers', type=int, help='targets reflected at the same time (default: [FANOUT] workers)')
+    fan_out.add_argument('--fail-on-differences', action='store_true',
+                         help='exit with status 1 when any target differs')
+    fan_out.set_defaults(func=command_fanout)
+
+    work = subparsers.add_parser('work', help='reflect shards of a coordinator work queue')
+    work.add_argument('--queue', required=True, help='work_queue.sqlite of the coordinator run')
+    work.add_argument('--config', help='configuration file, defaults to the one of the coordinator')
+    work.set_defaults(func=command_work)
+
+    serve = subparsers.add_parser('serve', help='keep warm snapshots and answer compare requests over HTTP')
+    add_common(serve)
+    serve.add_argument('--host', help='listen address (default: [DAEMON] host)')
+    serve.add_argument('--port', type=int, help='listen port, 0 for any free port (default: [DAEMON] port)')
+    serve.add_argument('--socket', help='serve on this Unix socket instead of a TCP port')
+    serve.set_defaults(func=command_serve)
+
+    report = subparsers.add_parser('report', help='re-render the reports of a previous run (offline)')
+    add_common(report)
+    report.add_argument('run_dir', help='a SchemaValidator_<timestamp> output directory')
+    report.set_defaults(func=command_report)
+
+    diff_files = subparsers.add_parser('diff-files', help='compare two saved schema files (offline)')
+    add_common(diff_files)
+    diff_files.add_argument('source_file', help='SourceSchema_<name>_<type>.json')
+    diff_files.add_argument('target_file', help='TargetSchema_<name>_<type>.json')
+    diff_files.add_argument('--workers', type=int, default=1, help='compare worker processes (default: 1)')
+    diff_files.add_argument('--names', help='comma separated objects to compare, only these are loaded')
+    diff_files.add_argument('--fail-on-differences', action='store_true',
+                            help='exit with status 1 when differences are found')
+    diff_files.set_defaults(func=command_diff_files)
+
+    show = subparsers.add_parser('show', help='print saved objects of a schema file (offline)')
+    show.add_argument('schema_file', help='SourceSchema_<name>_<type>.json or TargetSchema_<name>_<type>.json')
+    show.add_argument('names', nargs='+', help='object names')
+    show.set_defaults(func=command_show)
+
+    export_parquet = subparsers.add_parser('export-parquet',
+                                           help='write the column catalog of saved schema files as Parquet (offline)')
+    export_parquet.add_argument('schema_files', nargs='+', help='SourceSchema_*.json or TargetSchema_*.json files')
+    export_parquet.set_defaults(func=command_export_parquet)
+
+    registry = subparsers.add_parser('registry', help='list, name or compare stored snapshots (offline)')
+    add_common(registry)
+    registry.add_argument('action', choices=('list', 'baseline', 'diff'),
+                          help='list snapshots, baseline NAME SNAPSHOT, or diff OLD NEW')
+    registry.add_argument('names', nargs='*', help='baseline names or snapshot ids')
+    registry.add_argument('--registry', help='registry directory, overrides [REGISTRY] directory')
+    registry.add_argument('--fail-on-differences', action='store_true',
+                          help='exit with status 1 when differences are found')
+    registry.set_defaults(func=command_registry)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command in ('report', 'diff-files', 'show', 'export-parquet', 'work', 'registry'):
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import json
+import logging
+import mmap
+import os
+
+from output_files import load_schema_json
+from schema_model import LazySchema, object_from_json
+
+INDEX_SUFFIX = '.idx'
+
+
+def save_indexed_schema(schema_data, output_file, schema_type):
+    """
+    Write a schema file exactly like save_schema_to_json (json.dump with indent=4), and a sidecar
+    <output_file>.idx with the byte range of every object, for IndexedSnapshot.
+    """
+    objects = {}
+    chunks = ['{\n    ' + json.dumps(schema_type) + ': {']
+    offset = len(chunks[0])
+    for position, (name, data) in enumerate(schema_data.items()):
+        prefix = (',' if position else '') + '\n        ' + json.dumps(name) + ': '
+        value = json.dumps(data, indent=4).replace('\n', '\n        ')
+        objects[name] = [offset + len(prefix), len(value)]
+        chunks.append(prefix + value)
+        offset += len(prefix) + len(value)
+    chunks.append('\n    }\n}' if schema_data else '}\n}')
+    # ASCII only (json.dumps escapes the rest), so character and byte offsets are the same
+    content = ''.join(chunks).encode('ascii')
+    with open(output_file, 'wb') as json_file:
+        json_file.write(content)
+    with open(output_file + INDEX_SUFFIX, 'w') as index_file:
+        json.dump({'key': schema_type, 'size': len(content), 'objects': objects}, index_file)
+    logging.info(f"{schema_type} schema saved to '{output_file}'.")
+
+
+class IndexedSnapshot(LazySchema):
+    """
+    A schema file read through its .idx index and a memory map: only the objects accessed are parsed,
+    so loading one object or a subset costs its own size, not the size of the file. A read only
+    {name: model object} mapping that compare_schemas and format_and_compare accept as a schema.
+    """
+
+    def __init__(self, schema_file):
+        with open(schema_file + INDEX_SUFFIX, 'r') as index_file:
+            index = json.load(index_file)
+        if os.path.getsize(schema_file) != index['size']:
+            raise ValueError(f"'{schema_file}' changed since its index was written")
+        self.schema_file = schema_file
+        self.key = index['key']
+        self.index = index['objects']
+        self._file = open(schema_file, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if index['size'] else b''
+
+    def raw(self, name):
+        # The saved JSON of one object
+        offset, length = self.index[name]
+        return json.loads(self._map[offset:offset + length])
+
+    def __getitem__(self, name):
+        return object_from_json(name, self.raw(name))
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def subset(self, names):
+        """
+        The named objects found in the snapshot, as a {name: model object} dictionary.
+        """
+        return {name: self[name] for name in names if name in self.index}
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_snapshot(schema_file):
+    """
+    Open a saved schema file through its index when it has one, or load it entirely.
+    :return: The top level key and the schema, an IndexedSnapshot or a {name: json} dictionary.
+    """
+    if os.path.exists(schema_file + INDEX_SUFFIX):
+        try:
+            snapshot = IndexedSnapshot(schema_file)
+            return snapshot.key, snapshot
+        except (OSError, ValueError, KeyError) as e:
+            logging.info(f"Ignoring the index of '{schema_file}': {e}")
+    return load_schema_json(schema_file)
+
+
+def schema_subset(schema, names):
+    # The named objects of a schema opened by open_snapshot, an IndexedSnapshot parses only these
+    return {name: schema[name] for name in names if name in schema}
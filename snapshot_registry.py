@@ -0,0 +1,167 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+
+# Content addressed snapshot store:
+#   objects/<2 hex>/<sha256>.json.gz  one formatted object definition, stored once
+#   manifests/<id>.json.gz            object type -> object name -> hash, one per reflected side of a run
+#   baselines.json                    baseline name -> manifest id
+
+
+class SnapshotRegistry:
+    """
+    Stores reflected schemas as deduplicated, compressed objects referenced by manifests, so disk
+    use grows with the number of distinct object versions rather than with runs x objects.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.manifests_dir = os.path.join(root, 'manifests')
+        self.baselines_file = os.path.join(root, 'baselines.json')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        self.written = 0
+        self.reused = 0
+
+    @staticmethod
+    def object_hash(payload):
+        return hashlib.sha256(payload).hexdigest()
+
+    def _object_path(self, object_hash):
+        return os.path.join(self.objects_dir, object_hash[:2], f"{object_hash}.json.gz")
+
+    def put_object(self, value):
+        """
+        Store one formatted object definition, unless an identical one is already stored.
+        :return: The content hash of the object.
+        """
+        # Key order is kept (not sorted), as column order is part of the definition
+        payload = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        object_hash = self.object_hash(payload)
+        path = self._object_path(object_hash)
+        if os.path.exists(path):
+            self.reused += 1
+            return object_hash
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(temporary_path, 'wb') as object_file:
+            object_file.write(payload)
+        os.replace(temporary_path, path)
+        self.written += 1
+        return object_hash
+
+    def get_object(self, object_hash):
+        with gzip.open(self._object_path(object_hash), 'rb') as object_file:
+            return json.loads(object_file.read())
+
+    def put_schema(self, schema):
+        """
+        :param schema: {name: formatted object definition} of one comparison type.
+        :return: {name: hash}, None for the existence records of objects that were not reflected.
+        """
+        return {name: self.put_object(value) if value != {} else None for name, value in schema.items()}
+
+    def save_manifest(self, section, schema_name, objects, label=None):
+        """
+        :param objects: {comparison type: {name: hash}} of one side of a run.
+        :return: The manifest id.
+        """
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        manifest_id = f"{section}_{timestamp}"
+        suffix = 1
+        while os.path.exists(self._manifest_path(manifest_id)):
+            suffix += 1
+            manifest_id = f"{section}_{timestamp}_{suffix}"
+        manifest = {
+            'id': manifest_id,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'section': section,
+            'schema_name': schema_name,
+            'label': label,
+            'objects': objects
+        }
+        with gzip.open(self._manifest_path(manifest_id), 'wt', encoding='utf-8') as manifest_file:
+            json.dump(manifest, manifest_file)
+        logging.info(f"Snapshot {manifest_id} saved to '{self.root}' "
+                     f"({sum(len(names) for names in objects.values())} objects)")
+        return manifest_id
+
+    def _manifest_path(self, manifest_id):
+        return os.path.join(self.manifests_dir, f"{manifest_id}.json.gz")
+
+    def load_manifest(self, name):
+        """
+        :param name: A manifest id or a baseline name.
+        """
+        manifest_id = self.baselines().get(name, name)
+        path = self._manifest_path(manifest_id)
+        if not os.path.exists(path):
+            raise KeyError(f"No snapshot or baseline named '{name}' in '{self.root}'")
+        with gzip.open(path, 'rt', encoding='utf-8') as manifest_file:
+            return json.load(manifest_file)
+
+    def manifests(self):
+        return sorted(file_name[:-len('.json.gz')] for file_name in os.listdir(self.manifests_dir)
+                      if file_name.endswith('.json.gz'))
+
+    def baselines(self):
+        if not os.path.exists(self.baselines_file):
+            return {}
+        with open(self.baselines_file, 'r') as json_file:
+            return json.load(json_file)
+
+    def set_baseline(self, name, manifest_id):
+        self.load_manifest(manifest_id)
+        baselines = self.baselines()
+        baselines[name] = manifest_id
+        with open(self.baselines_file + '.tmp', 'w') as json_file:
+            json.dump(baselines, json_file, indent=4)
+        os.replace(self.baselines_file + '.tmp', self.baselines_file)
+        logging.info(f"Baseline {name} set to snapshot {manifest_id}")
+
+    def load_schema(self, manifest, comparison_type, names=None):
+        """
+        Load the object definitions of one comparison type of a manifest, only for the given names.
+        """
+        hashes = manifest['objects'].get(comparison_type, {})
+        if names is None:
+            names = hashes
+        return {name: self.get_object(hashes[name]) if hashes[name] else {} for name in names if name in hashes}
+
+    def diff_inputs(self, old_manifest, new_manifest, comparison_type):
+        """
+        The schemas to compare for two manifests. Objects with the same hash on both sides are
+        identical and are not loaded; objects on one side only are existence records.
+        :return: The old and new schemas and the number of unchanged objects left out.
+        """
+        old_hashes = old_manifest['objects'].get(comparison_type, {})
+        new_hashes = new_manifest['objects'].get(comparison_type, {})
+        old_schema = {}
+        new_schema = {}
+        unchanged = 0
+        for name, object_hash in old_hashes.items():
+            if name not in new_hashes:
+                old_schema[name] = {}
+            elif new_hashes[name] != object_hash:
+                old_schema[name] = self.get_object(object_hash) if object_hash else {}
+            else:
+                unchanged += 1
+        for name, object_hash in new_hashes.items():
+            if name not in old_hashes:
+                new_schema[name] = {}
+            elif old_hashes[name] != object_hash:
+                new_schema[name] = self.get_object(object_hash) if object_hash else {}
+        return old_schema, new_schema, unchanged
+
+
+def registry_from_config(config):
+    """
+    The SnapshotRegistry of the [REGISTRY] config section, or None when it is disabled.
+    """
+    if not config.getboolean('REGISTRY', 'enabled', fallback=False):
+        return None
+    return SnapshotRegistry(config.get('REGISTRY', 'directory', fallback='registry'))
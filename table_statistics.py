@@ -0,0 +1,280 @@
+import logging
+from datetime import datetime
+
+from result_store import STATISTICS_MISSING, STATISTICS_STALE, ROW_ESTIMATE_MISMATCH, STORAGE_MISMATCH
+
+# The optimizer statistics and physical attributes of every table and index of a schema, one catalog query each.
+# tables: (table, rows, blocks, last analyzed, stale flag, tablespace, compression, compression mode)
+# partitions: (table, partitioning type, subpartitioning type, partition count, key column) in key order
+# indexes: (table, index, type, uniqueness, compression, partitioned, tablespace, distinct keys, last analyzed)
+STATISTICS_QUERIES = {
+    'oracle': {
+        'tables': """
+            SELECT T.TABLE_NAME, S.NUM_ROWS, S.BLOCKS, S.LAST_ANALYZED, S.STALE_STATS,
+                   COALESCE(T.TABLESPACE_NAME, P.DEF_TABLESPACE_NAME), COALESCE(T.COMPRESSION, P.DEF_COMPRESSION),
+                   COALESCE(T.COMPRESS_FOR, P.DEF_COMPRESS_FOR)
+            FROM ALL_TABLES T
+            LEFT JOIN ALL_TAB_STATISTICS S
+                ON S.OWNER = T.OWNER AND S.TABLE_NAME = T.TABLE_NAME AND S.OBJECT_TYPE = 'TABLE'
+            LEFT JOIN ALL_PART_TABLES P ON P.OWNER = T.OWNER AND P.TABLE_NAME = T.TABLE_NAME
+            WHERE T.OWNER = :schema_name AND T.TEMPORARY = 'N' AND T.NESTED = 'NO' AND T.SECONDARY = 'N'
+        """,
+        'partitions': """
+            SELECT P.TABLE_NAME, P.PARTITIONING_TYPE, P.SUBPARTITIONING_TYPE, P.PARTITION_COUNT, K.COLUMN_NAME
+            FROM ALL_PART_TABLES P
+            LEFT JOIN ALL_PART_KEY_COLUMNS K ON K.OWNER = P.OWNER AND K.NAME = P.TABLE_NAME AND K.OBJECT_TYPE = 'TABLE'
+            WHERE P.OWNER = :schema_name
+            ORDER BY P.TABLE_NAME, K.COLUMN_POSITION
+        """,
+        'indexes': """
+            SELECT TABLE_NAME, INDEX_NAME, INDEX_TYPE, UNIQUENESS, COMPRESSION, PARTITIONED, TABLESPACE_NAME,
+                   DISTINCT_KEYS, LAST_ANALYZED
+            FROM ALL_INDEXES
+            WHERE TABLE_OWNER = :schema_name AND TABLE_TYPE = 'TABLE' AND INDEX_TYPE <> 'LOB'
+        """
+    },
+    'ibm_db_sa': {
+        # CARD and FULLKEYCARD are -1 and STATS_TIME is NULL until RUNSTATS has run
+        'tables': """
+            SELECT TABNAME, CARD, NPAGES, STATS_TIME, CAST(NULL AS VARCHAR(3)), TBSPACE, COMPRESSION, ROWCOMPMODE
+            FROM SYSCAT.TABLES
+            WHERE TABSCHEMA = :schema_name AND TYPE = 'T'
+        """,
+        'partitions': """
+            SELECT E.TABNAME, 'RANGE', 'NONE', P.PARTITION_COUNT, CAST(E.DATAPARTITIONEXPRESSION AS VARCHAR(512))
+            FROM SYSCAT.DATAPARTITIONEXPRESSION E
+            JOIN (SELECT TABSCHEMA, TABNAME, COUNT(*) AS PARTITION_COUNT FROM SYSCAT.DATAPARTITIONS
+                  WHERE TABSCHEMA = :schema_name GROUP BY TABSCHEMA, TABNAME) P
+                ON P.TABSCHEMA = E.TABSCHEMA AND P.TABNAME = E.TABNAME
+            ORDER BY E.TABNAME, E.DATAPARTITIONKEYSEQ
+        """,
+        'indexes': """
+            SELECT I.TABNAME, I.INDNAME, I.INDEXTYPE, I.UNIQUERULE, I.COMPRESSION, CAST(NULL AS VARCHAR(3)),
+                   S.TBSPACE, I.FULLKEYCARD, I.STATS_TIME
+            FROM SYSCAT.INDEXES I
+            LEFT JOIN SYSCAT.TABLESPACES S ON S.TBSPACEID = I.TBSPACEID
+            WHERE I.TABSCHEMA = :schema_name
+        """
+    }
+}
+
+# Physical attributes that can be compared, see the [STATISTICS] section
+STORAGE_ATTRIBUTES = ('partitioning', 'partition_count', 'compression', 'tablespace', 'indexes')
+INDEX_ATTRIBUTES = ('type', 'uniqueness', 'compression', 'partitioned')
+
+
+def _count(value):
+    # Row and key counts, None when not gathered (DB2 reports -1)
+    return int(value) if value is not None and value >= 0 else None
+
+
+def _text(*values):
+    # Catalog flags joined into one value (e.g. ENABLED ADVANCED), None when all are empty
+    text = ' '.join(str(value).strip() for value in values if value is not None and str(value).strip())
+    return text or None
+
+
+def _timestamp(value):
+    return value.isoformat(sep=' ') if isinstance(value, datetime) else (str(value) if value is not None else None)
+
+
+def read_table_statistics(session, schema_name):
+    """
+    Read the statistics, partitioning, compression and tablespace of every table and index of the schema,
+    with the STATISTICS_TABLES, STATISTICS_PARTITIONS and STATISTICS_INDEXES queries of the [QUERIES]
+    section or the built-in queries for the dialect. Names are normalized like the inspector's.
+    :return: {table: statistics} in JSON form, or None when no bulk query is available or it fails.
+    """
+    dialect = session.engine.dialect
+    default_queries = STATISTICS_QUERIES.get(dialect.name, {})
+    if 'tables' not in default_queries and 'STATISTICS_TABLES' not in session.statements:
+        return None
+    normalize = dialect.normalize_name if dialect.requires_name_normalize else (lambda name: name)
+    parameters = {'schema_name': schema_name}
+    try:
+        tables = {}
+        rows = session.execute(session.statement('STATISTICS_TABLES', default_queries.get('tables')), parameters)
+        for table_name, num_rows, blocks, last_analyzed, stale, tablespace, compression, compress_for in rows:
+            tables[normalize(table_name)] = {
+                "num_rows": _count(num_rows),
+                "blocks": _count(blocks),
+                "last_analyzed": _timestamp(last_analyzed),
+                "stale_stats": str(stale).upper() == 'YES' if stale is not None else None,
+                "tablespace": _text(tablespace),
+                "compression": _text(compression, compress_for),
+                "partitioning": None,
+                "indexes": {}
+            }
+
+        rows = session.execute(session.statement('STATISTICS_PARTITIONS', default_queries.get('partitions')),
+                               parameters)
+        for table_name, partitioning_type, subpartitioning_type, partition_count, key_column in rows:
+            table = tables.get(normalize(table_name))
+            if table is None:
+                continue
+            if table["partitioning"] is None:
+                table["partitioning"] = {"type": _text(partitioning_type),
+                                         "subpartitioning": _text(subpartitioning_type),
+                                         "partition_count": _count(partition_count), "key": []}
+            if key_column is not None:
+                # DB2 partition expressions quote the column names
+                table["partitioning"]["key"].append(normalize(str(key_column).strip().strip('"')))
+
+        rows = session.execute(session.statement('STATISTICS_INDEXES', default_queries.get('indexes')), parameters)
+        for (table_name, index_name, index_type, uniqueness, compression, partitioned, tablespace, distinct_keys,
+             last_analyzed) in rows:
+            table = tables.get(normalize(table_name))
+            if table is None:
+                continue
+            table["indexes"][normalize(index_name)] = {
+                "type": _text(index_type),
+                "uniqueness": _text(uniqueness),
+                "compression": _text(compression),
+                "partitioned": _text(partitioned),
+                "tablespace": _text(tablespace),
+                "distinct_keys": _count(distinct_keys),
+                "last_analyzed": _timestamp(last_analyzed)
+            }
+        logging.info(f"Read the statistics of {len(tables)} tables of {schema_name} in bulk")
+        return tables
+    except Exception as e:
+        logging.info(f"Error reading the statistics of {schema_name}: {e}")
+        return None
+
+
+def _lookup(statistics, name):
+    # An index of the other side, matched case-insensitively
+    if name in statistics:
+        return statistics[name]
+    return next((value for key, value in statistics.items() if key.lower() == name.lower()), None)
+
+
+class StatisticsCheck:
+    """
+    Flags tables and indexes whose optimizer statistics are missing or stale on either side, row estimates
+    that differ beyond a tolerance, and mismatched partitioning, compression and tablespaces.
+    """
+
+    def __init__(self, stale_days=30, row_tolerance=0.1, min_rows=1000,
+                 attributes=('partitioning', 'compression', 'indexes'), now=None):
+        """
+        :param stale_days: Statistics older than this many days are stale, 0 to only use the database's stale flag.
+        :param row_tolerance: Relative difference of the row estimates reported, None to not compare them.
+        :param min_rows: Row estimates are not compared when both sides have fewer rows.
+        :param attributes: The STORAGE_ATTRIBUTES compared.
+        """
+        unknown = [attribute for attribute in attributes if attribute not in STORAGE_ATTRIBUTES]
+        if unknown:
+            raise ValueError(f"Invalid storage attributes: {unknown}, expected some of {STORAGE_ATTRIBUTES}")
+        self.stale_days = stale_days
+        self.row_tolerance = row_tolerance
+        self.min_rows = min_rows
+        self.attributes = attributes
+        self.now = now or datetime.now()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        The StatisticsCheck of the [STATISTICS] section.
+        """
+        row_tolerance = config.get('STATISTICS', 'row_tolerance', fallback='0.1')
+        attributes = config.get('STATISTICS', 'compare', fallback='partitioning, compression, indexes')
+        return cls(stale_days=config.getint('STATISTICS', 'stale_days', fallback=30),
+                   row_tolerance=float(row_tolerance) if row_tolerance else None,
+                   min_rows=config.getint('STATISTICS', 'min_rows', fallback=1000),
+                   attributes=[item.strip() for item in attributes.split(',') if item.strip()])
+
+    def missing(self, statistics):
+        return "not analyzed" if statistics["last_analyzed"] is None else None
+
+    def stale(self, statistics):
+        # Why the statistics of one side are stale, or None
+        if statistics["last_analyzed"] is None:
+            return None
+        if statistics.get("stale_stats"):
+            return "marked stale"
+        if self.stale_days:
+            last_analyzed = datetime.fromisoformat(statistics["last_analyzed"])
+            age = (self.now - last_analyzed).days
+            if age > self.stale_days:
+                return f"last analyzed {last_analyzed.date()} ({age} days ago)"
+        return None
+
+    def _check_freshness(self, store, schema_name, table_name, source, target, on=None):
+        source_missing, target_missing = self.missing(source), self.missing(target)
+        if source_missing or target_missing:
+            store.add('statistics', schema_name, table_name, STATISTICS_MISSING, on, source_missing, target_missing)
+        source_stale, target_stale = self.stale(source), self.stale(target)
+        if source_stale or target_stale:
+            store.add('statistics', schema_name, table_name, STATISTICS_STALE, on, source_stale, target_stale)
+
+    def _check_rows(self, store, schema_name, table_name, source, target):
+        source_rows, target_rows = source["num_rows"], target["num_rows"]
+        if self.row_tolerance is None or source_rows is None or target_rows is None:
+            return
+        largest = max(source_rows, target_rows)
+        if largest >= self.min_rows and abs(source_rows - target_rows) > self.row_tolerance * largest:
+            store.add('statistics', schema_name, table_name, ROW_ESTIMATE_MISMATCH, None, source_rows, target_rows)
+
+    def _check_partitioning(self, store, schema_name, table_name, source, target):
+        source_partitioning, target_partitioning = source["partitioning"], target["partitioning"]
+        if source_partitioning is None and target_partitioning is None:
+            return
+        if source_partitioning is None or target_partitioning is None:
+            store.add('statistics', schema_name, table_name, STORAGE_MISMATCH, 'partitioning',
+                      source_partitioning["type"] if source_partitioning else 'not partitioned',
+                      target_partitioning["type"] if target_partitioning else 'not partitioned')
+            return
+        for attribute, label in (("type", 'partitioning type'), ("subpartitioning", 'subpartitioning type')):
+            if source_partitioning[attribute] != target_partitioning[attribute]:
+                store.add('statistics', schema_name, table_name, STORAGE_MISMATCH, label,
+                          source_partitioning[attribute], target_partitioning[attribute])
+        source_key = [column.lower() for column in source_partitioning["key"]]
+        if source_key != [column.lower() for column in target_partitioning["key"]]:
+            store.add('statistics', schema_name, table_name, STORAGE_MISMATCH, 'partitioning key',
+                      ', '.join(source_partitioning["key"]), ', '.join(target_partitioning["key"]))
+        if ('partition_count' in self.attributes
+                and source_partitioning["partition_count"] != target_partitioning["partition_count"]):
+            store.add('statistics', schema_name, table_name, STORAGE_MISMATCH, 'partition count',
+                      source_partitioning["partition_count"], target_partitioning["partition_count"])
+
+    def _check_indexes(self, store, schema_name, table_name, source, target):
+        # Indexes found on both sides, matched by name; the index columns are not compared here
+        attributes = INDEX_ATTRIBUTES + (('tablespace',) if 'tablespace' in self.attributes else ())
+        for index_name, source_index in source["indexes"].items():
+            target_index = _lookup(target["indexes"], index_name)
+            if target_index is None:
+                continue
+            self._check_freshness(store, schema_name, table_name, source_index, target_index, f"index {index_name}")
+            for attribute in attributes:
+                if source_index[attribute] != target_index[attribute]:
+                    store.add('statistics', schema_name, table_name, STORAGE_MISMATCH,
+                              f"index {index_name} {attribute}", source_index[attribute], target_index[attribute])
+
+    def compare(self, source_statistics, target_statistics, table_names, store, schema_name):
+        """
+        Compare the statistics of the named tables, found on both sides, into the ResultStore.
+        :return: The number of tables compared.
+        """
+        # Tables are matched case-insensitively, as lookup files and catalogs may disagree on case
+        source_tables = {name.lower(): statistics for name, statistics in source_statistics.items()}
+        target_tables = {name.lower(): statistics for name, statistics in target_statistics.items()}
+        compared = 0
+        for table_name in table_names:
+            source = source_tables.get(table_name.lower())
+            target = target_tables.get(table_name.lower())
+            if source is None or target is None:
+                # e.g. temporary tables, which have no statistics
+                continue
+            compared += 1
+            self._check_freshness(store, schema_name, table_name, source, target)
+            self._check_rows(store, schema_name, table_name, source, target)
+            if 'partitioning' in self.attributes:
+                self._check_partitioning(store, schema_name, table_name, source, target)
+            for attribute in ('compression', 'tablespace'):
+                if attribute in self.attributes and source[attribute] != target[attribute]:
+                    store.add('statistics', schema_name, table_name, STORAGE_MISMATCH, attribute,
+                              source[attribute], target[attribute])
+            if 'indexes' in self.attributes:
+                self._check_indexes(store, schema_name, table_name, source, target)
+        return compared
@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+
+
+class AdaptiveThrottle:
+    """
+    Limits the catalog queries of one engine per second and in flight. The limit follows an AIMD
+    policy: it grows additively while query latency stays under the threshold and is cut by
+    decrease_factor when a query is slower, so a busy dictionary slows the validation down.
+    """
+
+    def __init__(self, name, max_queries_per_second=0, max_in_flight=4, latency_threshold=0.5,
+                 decrease_factor=0.5, increase_step=1.0, min_in_flight=1):
+        """
+        :param max_queries_per_second: Query rate at the full limit, 0 for no rate limit.
+        :param latency_threshold: Query latency in seconds above which the limit is decreased.
+        """
+        self.name = name
+        self.max_queries_per_second = max_queries_per_second
+        self.max_in_flight = max(max_in_flight, 1)
+        self.min_in_flight = max(min(min_in_flight, self.max_in_flight), 1)
+        self.latency_threshold = latency_threshold
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step
+        self.limit = float(self.max_in_flight)
+        self.in_flight = 0
+        self.next_start = 0.0
+        self.last_decrease = 0.0
+        self.query_count = 0
+        self.slow_count = 0
+        self.wait_time = 0.0
+        self._condition = threading.Condition()
+
+    def rate(self):
+        # The query rate scales with the concurrency limit
+        if not self.max_queries_per_second:
+            return 0
+        return self.max_queries_per_second * self.limit / self.max_in_flight
+
+    def acquire(self):
+        start = time.monotonic()
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            rate = self.rate()
+            now = time.monotonic()
+            delay = 0.0
+            if rate:
+                # Reserve the next start slot, queries are spaced 1 / rate seconds apart
+                slot = max(self.next_start, now)
+                self.next_start = slot + 1.0 / rate
+                delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        started = time.monotonic()
+        with self._condition:
+            self.wait_time += started - start
+        return started
+
+    def release(self, started, failed=False):
+        latency = time.monotonic() - started
+        with self._condition:
+            self.in_flight -= 1
+            self.query_count += 1
+            now = time.monotonic()
+            if latency > self.latency_threshold and not failed:
+                self.slow_count += 1
+                # At most one decrease per threshold interval, queries already in flight were slowed by the same spike
+                if now - self.last_decrease > self.latency_threshold:
+                    previous = self.limit
+                    self.limit = max(self.limit * self.decrease_factor, float(self.min_in_flight))
+                    self.last_decrease = now
+                    if int(self.limit) < int(previous):
+                        logging.info(f"Catalog latency {latency:.2f}s on {self.name}: throttled to "
+                                     f"{int(self.limit)} queries in flight"
+                                     + (f", {self.rate():.1f} queries/s" if self.rate() else ""))
+            elif not failed:
+                self.limit = min(self.limit + self.increase_step / self.limit, float(self.max_in_flight))
+            self._condition.notify_all()
+
+    def summary(self):
+        return (f"{self.name}: {self.query_count} catalog queries, {self.slow_count} slow, "
+                f"{self.wait_time:.2f}s throttled, final limit {int(self.limit)} in flight")
+
+
+def throttle_from_config(config, name):
+    """
+    Build an AdaptiveThrottle from the [THROTTLE] config section, or None when throttling is disabled.
+    """
+    if not config.getboolean('THROTTLE', 'enabled', fallback=False):
+        return None
+    return AdaptiveThrottle(
+        name,
+        max_queries_per_second=config.getfloat('THROTTLE', 'max_queries_per_second', fallback=0),
+        max_in_flight=config.getint('THROTTLE', 'max_in_flight', fallback=4),
+        latency_threshold=config.getint('THROTTLE', 'latency_threshold_ms', fallback=500) / 1000,
+        decrease_factor=config.getfloat('THROTTLE', 'decrease_factor', fallback=0.5),
+        increase_step=config.getfloat('THROTTLE', 'increase_step', fallback=1.0))
+
+
+def attach_throttle(engine, throttle):
+    """
+    Throttle every statement the engine executes, including the Inspector's catalog queries.
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def throttle_start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('throttle_started', []).append(throttle.acquire())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def throttle_end(conn, cursor, statement, parameters, context, executemany):
+        throttle.release(conn.info['throttle_started'].pop())
+
+    @event.listens_for(engine, 'handle_error')
+    def throttle_error(exception_context):
+        started = exception_context.connection.info.get('throttle_started') \
+            if exception_context.connection is not None else None
+        if started:
+            throttle.release(started.pop(), failed=True)
+    return throttle
@@ -0,0 +1,172 @@
+import logging
+import re
+import threading
+
+from schema_model import VIEW_DEFINITION
+
+# Every view definition and every view column of a schema, each with a single catalog query.
+# The column queries return (view, column, type, length, precision, scale, nullable) in column order.
+VIEW_QUERIES = {
+    'oracle': {
+        'definitions': "SELECT VIEW_NAME, TEXT FROM ALL_VIEWS WHERE OWNER = :schema_name",
+        'columns': """
+            SELECT C.TABLE_NAME, C.COLUMN_NAME, C.DATA_TYPE, DECODE(C.CHAR_LENGTH, 0, C.DATA_LENGTH, C.CHAR_LENGTH),
+                   C.DATA_PRECISION, C.DATA_SCALE, C.NULLABLE
+            FROM ALL_TAB_COLUMNS C
+            JOIN ALL_VIEWS V ON V.OWNER = C.OWNER AND V.VIEW_NAME = C.TABLE_NAME
+            WHERE C.OWNER = :schema_name
+            ORDER BY C.TABLE_NAME, C.COLUMN_ID
+        """
+    },
+    'ibm_db_sa': {
+        'definitions': "SELECT VIEWNAME, TEXT FROM SYSCAT.VIEWS WHERE VIEWSCHEMA = :schema_name",
+        'columns': """
+            SELECT C.TABNAME, C.COLNAME, C.TYPENAME, C.LENGTH, C.LENGTH, C.SCALE, C.NULLS
+            FROM SYSCAT.COLUMNS C
+            JOIN SYSCAT.TABLES T ON T.TABSCHEMA = C.TABSCHEMA AND T.TABNAME = C.TABNAME
+            WHERE C.TABSCHEMA = :schema_name AND T.TYPE = 'V'
+            ORDER BY C.TABNAME, C.COLNO
+        """
+    }
+}
+
+NUMERIC_TYPES = ('NUMBER', 'NUMERIC', 'DECIMAL')
+CHARACTER_TYPES = ('VARCHAR', 'VARCHAR2', 'NVARCHAR2', 'CHAR', 'NCHAR', 'CHARACTER', 'GRAPHIC', 'VARGRAPHIC', 'RAW')
+# Catalog type names spelled differently by the dialects' type compilers
+TYPE_ALIASES = {'CHARACTER': 'CHAR'}
+
+
+def canonical_datatype(datatype):
+    """
+    A datatype in the form shared by the bulk and the inspector views paths, e.g. NUMBER(10, 2) or VARCHAR2(50):
+    upper case, without length semantics (50 CHAR) or fractional seconds precision, one space after commas.
+    """
+    datatype = re.sub(r'\s+', ' ', datatype.strip().upper())
+    datatype = re.sub(r'\s*,\s*', ', ', datatype)
+    datatype = re.sub(r'\s+(CHAR|BYTE)\)', ')', datatype)
+    datatype = re.sub(r'^TIMESTAMP\(\d+\)', 'TIMESTAMP', datatype)
+    name, parenthesis, arguments = datatype.partition('(')
+    return TYPE_ALIASES.get(name.strip(), name.strip()) + parenthesis + arguments
+
+
+def column_datatype(type_name, length, precision, scale):
+    """
+    The canonical datatype of a catalog column, the same as inspector_datatype of the reflected column.
+    """
+    type_name = type_name.strip().upper()
+    if type_name in NUMERIC_TYPES:
+        if precision is not None:
+            return canonical_datatype(f"{type_name}({precision}, {scale or 0})")
+        # NUMBER(*, 0) is reflected as INTEGER
+        return 'INTEGER' if type_name == 'NUMBER' and scale == 0 else type_name
+    if type_name == 'FLOAT' and precision is not None:
+        return f"FLOAT({precision})"
+    if type_name in CHARACTER_TYPES and length:
+        return canonical_datatype(f"{type_name}({length})")
+    return canonical_datatype(type_name)
+
+
+def inspector_datatype(column_type, dialect):
+    """
+    The canonical datatype of a column reflected by the inspector. The type is compiled for the database's
+    dialect, as str() of Oracle types leaves out their precision and length (NUMBER, VARCHAR2) and
+    renames others (NVARCHAR2 prints as NVARCHAR).
+    """
+    try:
+        return canonical_datatype(column_type.compile(dialect=dialect))
+    except Exception:
+        # Types the dialect cannot render (e.g. NullType of unknown catalog types)
+        return canonical_datatype(str(column_type))
+
+
+def normalize_definition(definition, schema_name):
+    """
+    View SQL made comparable across schemas: whitespace collapsed, the trailing semicolon and the
+    qualifiers naming the view's own schema removed.
+    """
+    if definition is None:
+        return None
+    if hasattr(definition, 'read'):
+        # CLOB columns of some drivers
+        definition = definition.read()
+    definition = re.sub(r'\s+', ' ', str(definition)).strip().rstrip(';').rstrip()
+    if schema_name:
+        definition = re.sub(rf'"?\b{re.escape(schema_name)}\b"?\.', '', definition, flags=re.IGNORECASE)
+    return definition
+
+
+class ViewCatalog:
+    """
+    The columns and definitions of every view of one schema, read in bulk and served from memory.
+    Names are normalized like the inspector's, so they match the names of get_view_names.
+    """
+
+    def __init__(self, schema_name, views):
+        self.schema_name = schema_name
+        self.views = views
+        self._keys = {name.lower(): name for name in views}
+
+    def __len__(self):
+        return len(self.views)
+
+    def get(self, view_name):
+        """
+        :return: The view schema {column: {"datatype", "is_nullable"}, VIEW_DEFINITION: sql}, or {} when unknown.
+        """
+        name = view_name if view_name in self.views else self._keys.get(view_name.lower())
+        return dict(self.views[name]) if name is not None else {}
+
+
+def read_view_catalog(session, schema_name, definitions=True):
+    """
+    Read the columns (and definitions) of every view of the schema with the VIEWS_COLUMNS and
+    VIEWS_DEFINITIONS queries of the [QUERIES] section or the built-in queries for the dialect.
+    :return: The ViewCatalog, or None when no bulk query is available for the dialect or it fails.
+    """
+    dialect = session.engine.dialect
+    default_queries = VIEW_QUERIES.get(dialect.name, {})
+    if 'columns' not in default_queries and 'VIEWS_COLUMNS' not in session.statements:
+        return None
+    normalize = dialect.normalize_name if dialect.requires_name_normalize else (lambda name: name)
+    try:
+        views = {}
+        rows = session.execute(session.statement('VIEWS_COLUMNS', default_queries.get('columns')),
+                               {'schema_name': schema_name})
+        for view_name, column_name, type_name, length, precision, scale, nullable in rows:
+            views.setdefault(normalize(view_name), {})[normalize(column_name)] = {
+                "datatype": column_datatype(type_name, length, precision, scale),
+                "is_nullable": str(nullable).upper() in ('Y', 'YES', 'TRUE', '1')
+            }
+        if definitions:
+            rows = session.execute(session.statement('VIEWS_DEFINITIONS', default_queries.get('definitions')),
+                                   {'schema_name': schema_name})
+            for view_name, definition in rows:
+                views.setdefault(normalize(view_name), {})[VIEW_DEFINITION] = normalize_definition(definition,
+                                                                                                   schema_name)
+        logging.info(f"Read {len(views)} views of {schema_name} in bulk")
+        return ViewCatalog(schema_name, views)
+    except Exception as e:
+        logging.info(f"Error reading the views of {schema_name} in bulk: {e}")
+        return None
+
+
+class ViewCatalogCache:
+    """
+    One ViewCatalog per catalog session and schema, read on first use by whichever thread needs it first.
+    """
+
+    def __init__(self, definitions=True):
+        self.definitions = definitions
+        self._catalogs = {}
+        self._lock = threading.Lock()
+
+    def get(self, session, schema_name):
+        key = (session, schema_name)
+        with self._lock:
+            if key not in self._catalogs:
+                self._catalogs[key] = read_view_catalog(session, schema_name, self.definitions)
+            return self._catalogs[key]
+
+    def clear(self):
+        with self._lock:
+            self._catalogs = {}